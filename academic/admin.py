@@ -1,15 +1,53 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
 from .models import (
     CustomUser, Turma, Aluno, Competencia, 
     SugestaoAtividade, Relatorio, Avaliacao, ConfiguracaoSistema
 )
+from .utils import filtro_busca_nome
+
+# ==============================================================================
+# 0. PAGINAÇÃO PARA TABELAS GRANDES
+# ==============================================================================
+class PaginadorContagemLimitada(Paginator):
+    """
+    Conta no máximo LIMITE linhas (SELECT COUNT(*) FROM (... LIMIT n)) em vez
+    de varrer a tabela inteira. Acima disso, use filtros ou a busca para chegar
+    ao registro.
+    """
+    LIMITE = 10000
+
+    @cached_property
+    def count(self):
+        return self.object_list[:self.LIMITE].count()
+
+class BuscaPorNomeMixin:
+    """
+    Busca da listagem (e do autocomplete) pela chave sem acentos: 'joao'
+    acha 'João'. Um termo só com dígitos também procura pela chave primária
+    (matrícula do aluno).
+    """
+    campos_nome_busca = ('nome_busca',)
+
+    def get_search_results(self, request, queryset, search_term):
+        termo = search_term.strip()
+        if not termo:
+            return queryset, False
+        filtro = Q()
+        for campo in self.campos_nome_busca:
+            filtro |= filtro_busca_nome(termo, campo)
+        if termo.isdigit():
+            filtro |= Q(pk=termo)
+        return queryset.filter(filtro), False
 
 # ==============================================================================
 # 1. USUÁRIO (CustomUser)
 # ==============================================================================
 @admin.register(CustomUser)
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(BuscaPorNomeMixin, UserAdmin):
     model = CustomUser
     list_display = ['username', 'first_name', 'email', 'role', 'is_staff']
     list_filter = ['role', 'is_staff', 'is_superuser']
@@ -34,6 +72,10 @@ class TurmaAdmin(admin.ModelAdmin):
     # Melhora a seleção de muitos para muitos (caixa de busca lateral)
     filter_horizontal = ('professores',)
 
+    def get_queryset(self, request):
+        # exibir_professores lê a lista de cada turma: uma consulta para a página toda
+        return super().get_queryset(request).prefetch_related('professores')
+
     def exibir_professores(self, obj):
         return ", ".join([p.first_name for p in obj.professores.all()])
     exibir_professores.short_description = 'Professores Vinculados'
@@ -48,10 +90,12 @@ class TurmaAdmin(admin.ModelAdmin):
 # 3. ALUNO
 # ==============================================================================
 @admin.register(Aluno)
-class AlunoAdmin(admin.ModelAdmin):
+class AlunoAdmin(BuscaPorNomeMixin, admin.ModelAdmin):
     list_display = ('nome_completo', 'turma', 'data_nascimento')
     search_fields = ('nome_completo',)
     list_filter = ('turma',)
+    list_select_related = ('turma',)
+    autocomplete_fields = ('turma',)
 
 # ==============================================================================
 # 4. COMPETÊNCIA (BNCC)
@@ -74,13 +118,29 @@ class AvaliacaoInline(admin.TabularInline):
     model = Avaliacao
     extra = 0 # Não cria linhas vazias extras automaticamente
     fields = ('competencia', 'nivel', 'observacao_especifica')
+    # Competência só leitura (já vem no JOIN): um <select> por linha listaria o
+    # catálogo inteiro e até o autocomplete consulta o banco linha a linha.
+    # Novas avaliações entram pela tela da própria Avaliação.
+    readonly_fields = ('competencia',)
+    show_change_link = True
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('competencia')
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 @admin.register(Relatorio)
-class RelatorioAdmin(admin.ModelAdmin):
+class RelatorioAdmin(BuscaPorNomeMixin, admin.ModelAdmin):
     list_display = ('aluno', 'trimestre', 'ano', 'professor', 'status')
     list_filter = ('status', 'trimestre', 'ano')
     search_fields = ('aluno__nome_completo', 'professor__first_name')
+    campos_nome_busca = ('aluno__nome_busca', 'professor__nome_busca')
     inlines = [AvaliacaoInline] # Permite ver todas as notas ao abrir um relatório
+    list_select_related = ('aluno', 'professor')
+    autocomplete_fields = ('aluno', 'professor')
+    show_full_result_count = False
+    paginator = PaginadorContagemLimitada
 
 # ==============================================================================
 # 6. SUGESTÃO DE ATIVIDADES
@@ -91,6 +151,9 @@ class SugestaoAtividadeAdmin(admin.ModelAdmin):
     list_filter = ('status', 'nivel_alvo')
     search_fields = ('titulo', 'descricao')
     date_hierarchy = 'data_envio' # Barra de tempo no topo para filtrar
+    list_select_related = ('competencia', 'professor_autor')
+    autocomplete_fields = ('competencia', 'professor_autor')
+    show_full_result_count = False
 
 # ==============================================================================
 # 7. CONFIGURAÇÃO DO SISTEMA
@@ -108,4 +171,10 @@ class ConfiguracaoAdmin(admin.ModelAdmin):
 @admin.register(Avaliacao)
 class AvaliacaoAdmin(admin.ModelAdmin):
     list_display = ('relatorio', 'competencia', 'nivel')
-    list_filter = ('nivel',)
\ No newline at end of file
+    list_filter = ('nivel',)
+    # Relatorio.__str__ lê o aluno: o JOIN precisa chegar até ele
+    list_select_related = ('relatorio__aluno', 'competencia')
+    raw_id_fields = ('relatorio', 'sugestoes_escolhidas')
+    autocomplete_fields = ('competencia',)
+    show_full_result_count = False
+    paginator = PaginadorContagemLimitada
\ No newline at end of file
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class AcademicConfig(AppConfig):
     name = 'academic'
+
+    def ready(self):
+        # Registra os signals de manutenção dos consolidados e os system checks
+        from . import checks, signals  # noqa: F401
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Warning, register, Tags
+
+# ==============================================================================
+# 1. PERFIL DE EXECUÇÃO
+# ==============================================================================
+@register(Tags.compatibility, deploy=True)
+def verificar_perfil_producao(app_configs, **kwargs):
+    """Executado por 'manage.py check --deploy' antes de subir o servidor."""
+    if getattr(settings, 'EM_PRODUCAO', False):
+        return []
+    return [
+        Warning(
+            "O perfil de desenvolvimento está ativo (DEBUG, templates sem cache, sessões no banco).",
+            hint="Defina SMARTWORKFLOW_PERFIL=producao no ambiente do servidor.",
+            id='academic.W001',
+        )
+    ]
@@ -0,0 +1,41 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from academic.utils import planejar_arquivamento, executar_arquivamento
+from core.replica import banco_arquivo
+
+class Command(BaseCommand):
+    help = 'Move um ano letivo encerrado para o banco de arquivo (prévia por padrão)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ano', type=int, required=True, help='Ano letivo a arquivar')
+        parser.add_argument('--confirmar', action='store_true', help='Executa o arquivamento após exibir a prévia')
+
+    def handle(self, *args, **options):
+        # Sempre monta e exibe a prévia antes de qualquer gravação
+        plano = planejar_arquivamento(options['ano'])
+
+        self.stdout.write(
+            f"Arquivamento de {plano['ano']}: {plano['qtd_relatorios']} relatórios "
+            f"({plano['qtd_pendentes']} não aprovados), {plano['qtd_avaliacoes']} avaliações, "
+            f"{plano['qtd_transicoes']} transições."
+        )
+
+        if plano['bloqueio']:
+            raise CommandError(plano['bloqueio'])
+
+        if not options['confirmar']:
+            self.stdout.write(self.style.WARNING('PRÉVIA: nada foi movido. Use --confirmar para executar.'))
+            return
+
+        # O arquivo acompanha o esquema do banco principal
+        call_command('migrate', database=banco_arquivo(), verbosity=0)
+
+        try:
+            resultado = executar_arquivamento(plano)
+        except RuntimeError as erro:
+            raise CommandError(str(erro))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"ARQUIVAMENTO CONCLUÍDO: {resultado['qtd_relatorios']} relatórios e "
+            f"{resultado['qtd_avaliacoes']} avaliações de {plano['ano']} movidos para o arquivo."
+        ))
@@ -0,0 +1,30 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.replica import atualizar_replica
+
+class Command(BaseCommand):
+    help = 'Copia o banco principal para a réplica de leitura (SMARTWORKFLOW_REPLICA_DB)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo', type=int, default=0,
+            help='Repete a cópia a cada N segundos (0 = copia uma vez e sai)'
+        )
+
+    def handle(self, *args, **options):
+        if not settings.REPLICA_DB:
+            raise CommandError('Defina SMARTWORKFLOW_REPLICA_DB com o caminho da réplica.')
+
+        origem = settings.DATABASES['default']['NAME']
+        intervalo = options['intervalo']
+
+        while True:
+            inicio = time.monotonic()
+            atualizar_replica(origem, settings.REPLICA_DB)
+            self.stdout.write(self.style.SUCCESS(
+                f'RÉPLICA ATUALIZADA em {time.monotonic() - inicio:.2f}s: {settings.REPLICA_DB}'
+            ))
+            if not intervalo:
+                break
+            time.sleep(intervalo)
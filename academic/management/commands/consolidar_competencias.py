@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from academic.utils import reconstruir_consolidados
+
+class Command(BaseCommand):
+    help = 'Reconstrói do zero os consolidados de níveis por turma e competência'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ano', type=int, help='Reconstrói apenas o ano letivo informado')
+
+    def handle(self, *args, **options):
+        total = reconstruir_consolidados(options['ano'])
+        self.stdout.write(self.style.SUCCESS(f'CONSOLIDAÇÃO CONCLUÍDA: {total} linhas de resumo gravadas.'))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from academic.models import SugestaoAtividade
+from academic.utils import grupos_quase_duplicados, reindexar_sugestoes
+
+class Command(BaseCommand):
+    help = 'Agrupa sugestões quase duplicadas pelo índice MinHash e rejeita as cópias (prévia por padrão)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reindexar', action='store_true', help='Recalcula o índice de todas as sugestões antes')
+        parser.add_argument('--confirmar', action='store_true', help='Rejeita as cópias, mantendo uma sugestão por grupo')
+
+    def handle(self, *args, **options):
+        # Sugestões ainda sem assinatura (anteriores ao índice) são indexadas sempre
+        indexadas = reindexar_sugestoes(todas=options['reindexar'])
+        if indexadas:
+            self.stdout.write(f"{indexadas} sugestões indexadas.")
+
+        grupos = grupos_quase_duplicados()
+        copias = []
+        for mantida, *repetidas in grupos:
+            self.stdout.write(
+                f"[{mantida.competencia.codigo} / nível {mantida.nivel_alvo}] "
+                f"mantém #{mantida.pk} '{mantida.titulo}' ({mantida.status})"
+            )
+            for sugestao in repetidas:
+                self.stdout.write(f"    cópia #{sugestao.pk} '{sugestao.titulo}' ({sugestao.status})")
+            copias.extend(sugestao.pk for sugestao in repetidas)
+
+        if not copias:
+            self.stdout.write(self.style.SUCCESS('Nenhuma sugestão quase duplicada encontrada.'))
+            return
+
+        if not options['confirmar']:
+            self.stdout.write(self.style.WARNING(
+                f"PRÉVIA: {len(copias)} cópias em {len(grupos)} grupos. Use --confirmar para rejeitá-las."
+            ))
+            return
+
+        # Rejeitadas saem do sorteio; relatórios que já as fixaram continuam mostrando
+        rejeitadas = SugestaoAtividade.objects.filter(pk__in=copias).update(status='REJEITADA')
+        self.stdout.write(self.style.SUCCESS(
+            f"DEDUPLICAÇÃO CONCLUÍDA: {rejeitadas} cópias rejeitadas em {len(grupos)} grupos."
+        ))
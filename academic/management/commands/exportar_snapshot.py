@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from academic.utils import exportar_snapshot
+
+class Command(BaseCommand):
+    help = 'Grava um snapshot do banco (JSONL compactado com checksums por modelo)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Caminho do snapshot (ex.: backup.jsonl.gz)')
+        parser.add_argument('--database', help='Alias do banco (padrão: o principal da escola; ex.: arquivo)')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        resumo = exportar_snapshot(options['arquivo'], using=options['database'])
+
+        for modelo, qtd in resumo.items():
+            self.stdout.write(f"  {modelo}: {qtd}")
+        self.stdout.write(self.style.SUCCESS(
+            f"SNAPSHOT GRAVADO: {sum(resumo.values())} linhas em {time.monotonic() - inicio:.1f}s -> {options['arquivo']}"
+        ))
@@ -12,9 +12,11 @@ class Command(BaseCommand):
         
         # Busca sugestões REJEITADAS criadas ANTES dessa data
         # data_envio__lte significa "Less Than or Equal" (Menor ou igual a)
+        # Rejeitadas que algum relatório aprovado fixou (ex.: cópias da deduplicação) ficam
         lixo = SugestaoAtividade.objects.filter(
             status='REJEITADA',
-            data_envio__lte=data_limite
+            data_envio__lte=data_limite,
+            avaliacoes=None,
         )
         
         total = lixo.count()
@@ -0,0 +1,59 @@
+import json
+import os
+import subprocess
+import sys
+from django.core.management.base import BaseCommand, CommandError
+
+# Bibliotecas pesadas usadas por poucas requisições: só podem ser importadas sob demanda
+MODULOS_SOB_DEMANDA = ('xhtml2pdf', 'reportlab')
+
+SCRIPT = """
+import json, resource, sys, time
+inicio = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps({
+    'segundos': time.perf_counter() - inicio,
+    'mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'modulos': sorted(m for m in %r if m in sys.modules),
+}))
+"""
+
+class Command(BaseCommand):
+    help = (
+        'Mede o custo de subir um worker (django.setup() + URLconf) num processo novo '
+        'e falha acima do orçamento ou se a pilha de PDF for importada na inicialização'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--execucoes', type=int, default=3, help='Usa a melhor de N medições (padrão: 3)')
+        parser.add_argument('--orcamento-segundos', type=float, default=0.75)
+        parser.add_argument('--orcamento-mb', type=float, default=75)
+
+    def medir(self):
+        saida = subprocess.run(
+            [sys.executable, '-c', SCRIPT % (MODULOS_SOB_DEMANDA,)],
+            capture_output=True, text=True, check=True, env=os.environ,
+        )
+        return json.loads(saida.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        # Melhor de N: descarta ruído de disco frio e de outros processos
+        medicoes = [self.medir() for _ in range(max(1, options['execucoes']))]
+        segundos = min(m['segundos'] for m in medicoes)
+        mb = min(m['mb'] for m in medicoes)
+        modulos = sorted({modulo for m in medicoes for modulo in m['modulos']})
+        self.stdout.write(f'Inicialização: {segundos:.3f}s, {mb:.0f} MB de RSS máximo.')
+
+        problemas = []
+        if modulos:
+            problemas.append(f"importados na inicialização: {', '.join(modulos)} (use render_to_pdf)")
+        if segundos >= options['orcamento_segundos']:
+            problemas.append(f"{segundos:.3f}s >= {options['orcamento_segundos']}s")
+        if mb >= options['orcamento_mb']:
+            problemas.append(f"{mb:.0f} MB >= {options['orcamento_mb']:.0f} MB")
+        if problemas:
+            raise CommandError('Fora do orçamento de inicialização: ' + '; '.join(problemas))
+        self.stdout.write(self.style.SUCCESS('DENTRO DO ORÇAMENTO.'))
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from core.escolas import escolas
+
+class Command(BaseCommand):
+    help = 'Cria e migra os bancos (principal e arquivo) de cada escola de SMARTWORKFLOW_ESCOLAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help='Só estas escolas (padrão: todas)')
+
+    def handle(self, *args, **options):
+        selecionadas = [e for e in escolas() if not options['slugs'] or e.slug in options['slugs']]
+        if not selecionadas:
+            raise CommandError('Nenhuma escola configurada (SMARTWORKFLOW_ESCOLAS) ou encontrada.')
+
+        settings.ESCOLAS_DIR.mkdir(parents=True, exist_ok=True)
+        for escola in selecionadas:
+            call_command('migrate', database=escola.banco, verbosity=0)
+            call_command('migrate', database=escola.banco_arquivo, verbosity=0)
+            self.stdout.write(self.style.SUCCESS(f'{escola.slug}: {escola.banco} e {escola.banco_arquivo} migrados.'))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from academic.utils import recalcular_recomendacoes
+
+class Command(BaseCommand):
+    help = 'Recalcula a matriz de co-ocorrência usada nas recomendações de competências da matéria'
+
+    def handle(self, *args, **options):
+        total = recalcular_recomendacoes()
+        self.stdout.write(self.style.SUCCESS(f'RECOMENDAÇÕES RECALCULADAS: {total} pares gravados.'))
@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from academic.utils import restaurar_snapshot, ErroSnapshot
+
+class Command(BaseCommand):
+    help = 'Restaura um snapshot gravado por exportar_snapshot (tudo ou nada)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Caminho do snapshot')
+        parser.add_argument('--database', help='Alias do banco (padrão: o principal da escola; ex.: arquivo)')
+        parser.add_argument('--substituir', action='store_true', help='Apaga os dados atuais antes de restaurar')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        try:
+            resumo = restaurar_snapshot(options['arquivo'], options['substituir'], using=options['database'])
+        except (ErroSnapshot, OSError, EOFError) as erro:
+            raise CommandError(f"Restauração cancelada, nada foi alterado: {erro}")
+
+        for modelo, qtd in resumo.items():
+            self.stdout.write(f"  {modelo}: {qtd}")
+        self.stdout.write(self.style.SUCCESS(
+            f"SNAPSHOT RESTAURADO: {sum(resumo.values())} linhas em {time.monotonic() - inicio:.1f}s"
+        ))
@@ -0,0 +1,391 @@
+import http.client
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from http.cookies import SimpleCookie
+from importlib import import_module
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.signals import got_request_exception
+from django.db import OperationalError, connections
+from django.db.models import Count
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from academic.models import (
+    CustomUser, Turma, Aluno, Competencia, Relatorio, Avaliacao, chave_busca
+)
+from academic.utils import STATUS_EDITAVEIS, _percentil, configuracao_para_escrita
+from core.escolas import escola_atual, escolas
+from core.replica import atualizar_replica, banco_principal
+
+PREFIXO = 'carga_'
+MATERIAS_CARGA = ('PORT', 'MAT')
+MATRICULA_INICIAL = 900_000_000
+
+RE_CSRF = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+RE_VERSAO_AVALIACAO = re.compile(r'name="versao_(\d+)" value="(\d+)"')
+RE_VERSAO_RELATORIO = re.compile(r'name="versao" value="(\d+)"')
+
+
+class _Metricas:
+    """Latências e falhas por rota ('GET avaliar_materia'), compartilhadas entre as threads."""
+
+    def __init__(self):
+        self.trava = threading.Lock()
+        self.rotas = defaultdict(lambda: {'tempos': [], 'erros': 0, 'travas': 0})
+
+    def registrar(self, rota, segundos, ok):
+        with self.trava:
+            dados = self.rotas[rota]
+            dados['tempos'].append(segundos)
+            if not ok:
+                dados['erros'] += 1
+
+    def excecao_no_servidor(self, sender, request=None, **kwargs):
+        # Chamado pelo handler do Django dentro do bloco 'except' da requisição
+        erro = sys.exc_info()[1]
+        if request is None or not isinstance(erro, OperationalError) or 'locked' not in str(erro):
+            return
+        rota = request.resolver_match.url_name if request.resolver_match else request.path
+        with self.trava:
+            self.rotas[f'{request.method} {rota}']['travas'] += 1
+
+
+class _Navegador:
+    """Um usuário simulado: cookies próprios, token CSRF da última página e uma conexão por requisição."""
+
+    def __init__(self, porta, sessao, metricas, host):
+        self.porta = porta
+        self.host = host
+        self.metricas = metricas
+        self.cookies = {settings.SESSION_COOKIE_NAME: sessao}
+        self.csrf = ''
+
+    def requisitar(self, metodo, rota, caminho, dados=None):
+        cabecalhos = {
+            'Host': self.host,
+            'Cookie': '; '.join(f'{nome}={valor}' for nome, valor in self.cookies.items()),
+        }
+        corpo = None
+        if dados is not None:
+            corpo = urlencode({**dados, 'csrfmiddlewaretoken': self.csrf})
+            cabecalhos['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        inicio = time.perf_counter()
+        conexao = http.client.HTTPConnection('127.0.0.1', self.porta, timeout=120)
+        try:
+            conexao.request(metodo, caminho, corpo, cabecalhos)
+            resposta = conexao.getresponse()
+            html = resposta.read().decode('utf-8', 'replace')
+        except (OSError, http.client.HTTPException):
+            self.metricas.registrar(f'{metodo} {rota}', time.perf_counter() - inicio, False)
+            return None, ''
+        finally:
+            conexao.close()
+        self.metricas.registrar(f'{metodo} {rota}', time.perf_counter() - inicio, resposta.status < 400)
+
+        for cabecalho in resposta.headers.get_all('Set-Cookie') or []:
+            self.cookies.update({nome: morsel.value for nome, morsel in SimpleCookie(cabecalho).items()})
+        token = RE_CSRF.search(html)
+        if token:
+            self.csrf = token.group(1)
+        return resposta.status, html
+
+
+class _ServidorSilencioso(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga do fechamento do trimestre: professores salvando notas e enviando '
+        'relatórios ao mesmo tempo que a coordenação decide. Roda num servidor local sobre '
+        'uma CÓPIA do banco; o banco configurado não é alterado.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--professores', type=int, default=30, help='Professores simultâneos')
+        parser.add_argument('--coordenadores', type=int, default=3, help='Coordenadores simultâneos')
+        parser.add_argument('--alunos', type=int, default=10, help='Alunos (relatórios) por professor')
+        parser.add_argument('--competencias', type=int, default=8, help='Competências por matéria em cada relatório')
+        parser.add_argument('--salvamentos', type=int, default=2, help='Salvamentos por matéria antes do envio')
+        parser.add_argument('--devolucao', type=float, default=0.1, help='Fração das decisões que devolve para correção')
+        parser.add_argument('--duracao', type=int, default=60, help='Duração máxima em segundos')
+        parser.add_argument('--semente', type=int, help='Semente do sorteio (execuções comparáveis)')
+
+    def handle(self, *args, **options):
+        # Com várias escolas, a carga vai para a escola de SMARTWORKFLOW_ESCOLA (pelo domínio dela)
+        escola = escola_atual()
+        if escolas() and (escola is None or not escola.dominios):
+            raise CommandError('Escolha a escola (com domínio configurado) em SMARTWORKFLOW_ESCOLA.')
+        self.host = escola.dominios[0] if escola else '127.0.0.1'
+
+        banco = connections[banco_principal()]
+        if banco.vendor != 'sqlite':
+            raise CommandError('O teste de carga trabalha sobre uma cópia do banco SQLite.')
+        if options['semente'] is not None:
+            random.seed(options['semente'])
+
+        # 1. Cópia descartável do banco (API de backup, como a réplica)
+        pasta = tempfile.TemporaryDirectory()
+        copia = os.path.join(pasta.name, 'carga.sqlite3')
+        atualizar_replica(str(banco.settings_dict['NAME']), copia)
+        banco.close()
+        banco.settings_dict['NAME'] = copia
+        self.stdout.write(f"Banco copiado para {copia}")
+
+        # Cache só deste processo e nada de réplica: o teste não toca nos dados reais
+        with override_settings(
+            DEBUG=False, ALLOWED_HOSTS=[self.host], REPLICA_DB=None,
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        ):
+            try:
+                cenario = self.preparar_cenario(options)
+                metricas, duracao = self.executar(cenario, options)
+                situacao = dict(
+                    Relatorio.objects.filter(professor__username__startswith=PREFIXO)
+                    .values_list('status').annotate(qtd=Count('id')).order_by()
+                )
+            finally:
+                connections.close_all()
+                pasta.cleanup()
+
+        self.relatorio_final(metricas, duracao, cenario, situacao)
+
+    # --------------------------------------------------------------------------
+    # Cenário: turmas, alunos e relatórios em rascunho no período ativo
+    # --------------------------------------------------------------------------
+    def preparar_cenario(self, options):
+        config = configuracao_para_escrita()
+        # Últimos dias antes do fim do prazo
+        config.data_inicio = None
+        config.data_fim = timezone.now().date() + timedelta(days=2)
+        config.save()
+        ano, trimestre = config.ano_letivo, config.trimestre_ativo
+
+        competencias = {}
+        for materia in MATERIAS_CARGA:
+            ids = list(Competencia.objects.filter(componente=materia)
+                       .order_by('codigo').values_list('id', flat=True)[:options['competencias']])
+            faltam = options['competencias'] - len(ids)
+            if faltam > 0:
+                ids += [c.id for c in Competencia.objects.bulk_create([
+                    Competencia(codigo=f'CARGA{materia}{i:02d}', componente=materia, anos_aplicacao='1',
+                                habilidade='Competência sintética do teste de carga.')
+                    for i in range(faltam)
+                ])]
+            competencias[materia] = ids
+
+        professores = CustomUser.objects.bulk_create([
+            CustomUser(
+                username=f'{PREFIXO}prof{i}', first_name=f'Professor {i}', role='PROFESSOR', password='!',
+                nome_busca=chave_busca(f'Professor {i}', f'{PREFIXO}prof{i}'),
+            )
+            for i in range(options['professores'])
+        ])
+        coordenadores = CustomUser.objects.bulk_create([
+            CustomUser(
+                username=f'{PREFIXO}coord{i}', first_name=f'Coordenação {i}', role='ADMINISTRADOR', password='!',
+                nome_busca=chave_busca(f'Coordenação {i}', f'{PREFIXO}coord{i}'),
+            )
+            for i in range(options['coordenadores'])
+        ])
+
+        turmas = Turma.objects.bulk_create([
+            Turma(nome=f'Carga {i}', serie_curricular='1', ano_letivo=ano) for i in range(len(professores))
+        ])
+        Turma.professores.through.objects.bulk_create([
+            Turma.professores.through(turma_id=turma.id, customuser_id=professor.id)
+            for turma, professor in zip(turmas, professores)
+        ])
+
+        alunos, relatorios = [], []
+        for i, (turma, professor) in enumerate(zip(turmas, professores)):
+            for j in range(options['alunos']):
+                matricula = MATRICULA_INICIAL + i * 1000 + j
+                nome = f'Aluno Carga {i}-{j}'
+                alunos.append(Aluno(matricula=matricula, nome_completo=nome, nome_busca=chave_busca(nome), turma=turma))
+                relatorios.append(Relatorio(aluno_id=matricula, turma=turma, professor=professor, ano=ano, trimestre=trimestre))
+        Aluno.objects.bulk_create(alunos, batch_size=500)
+        relatorios = Relatorio.objects.bulk_create(relatorios, batch_size=500)
+        Avaliacao.objects.bulk_create([
+            Avaliacao(relatorio=relatorio, competencia_id=cid)
+            for relatorio in relatorios for ids in competencias.values() for cid in ids
+        ], batch_size=500)
+
+        self.stdout.write(
+            f"Cenário: {len(professores)} professores, {len(coordenadores)} coordenadores, "
+            f"{len(relatorios)} relatórios de {trimestre}º tri/{ano} com "
+            f"{options['competencias']} competências em {len(MATERIAS_CARGA)} matérias."
+        )
+        return {
+            'ano': ano,
+            'trimestre': trimestre,
+            'sessoes_professores': [(p.id, self.criar_sessao(p)) for p in professores],
+            'sessoes_coordenadores': [self.criar_sessao(c) for c in coordenadores],
+            'total_relatorios': len(relatorios),
+        }
+
+    def criar_sessao(self, usuario):
+        """Sessão autenticada sem passar pelo login (nada de hash de senha no teste)."""
+        sessao = import_module(settings.SESSION_ENGINE).SessionStore()
+        sessao[SESSION_KEY] = usuario._meta.pk.value_to_string(usuario)
+        sessao[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        sessao[HASH_SESSION_KEY] = usuario.get_session_auth_hash()
+        sessao.save()
+        return sessao.session_key
+
+    # --------------------------------------------------------------------------
+    # Execução: servidor WSGI local com threads + usuários simulados
+    # --------------------------------------------------------------------------
+    def executar(self, cenario, options):
+        metricas = _Metricas()
+        got_request_exception.connect(metricas.excecao_no_servidor)
+
+        servidor = ThreadedWSGIServer(('127.0.0.1', 0), _ServidorSilencioso)
+        servidor.set_app(WSGIHandler())
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        porta = servidor.server_address[1]
+
+        ate = time.monotonic() + options['duracao']
+        professores_ativos = threading.Semaphore(0)
+        usuarios = [
+            threading.Thread(target=self.simular_professor, args=(
+                _Navegador(porta, sessao, metricas, self.host), professor_id, cenario, options, ate, professores_ativos,
+            ))
+            for professor_id, sessao in cenario['sessoes_professores']
+        ]
+        fim_professores = threading.Event()
+        usuarios += [
+            threading.Thread(target=self.simular_coordenador, args=(
+                _Navegador(porta, sessao, metricas, self.host), options, ate, fim_professores,
+            ))
+            for sessao in cenario['sessoes_coordenadores']
+        ]
+
+        self.stdout.write(f"Carga iniciada em http://127.0.0.1:{porta}/ (até {options['duracao']}s)...")
+        inicio = time.monotonic()
+        try:
+            for usuario in usuarios:
+                usuario.start()
+            for _ in cenario['sessoes_professores']:
+                professores_ativos.acquire()
+            fim_professores.set()
+            for usuario in usuarios:
+                usuario.join()
+        finally:
+            duracao = time.monotonic() - inicio
+            servidor.shutdown()
+            servidor.server_close()
+            got_request_exception.disconnect(metricas.excecao_no_servidor)
+        return metricas, duracao
+
+    def simular_professor(self, navegador, professor_id, cenario, options, ate, professores_ativos):
+        """Para cada relatório: abre e salva cada matéria algumas vezes, depois envia."""
+        try:
+            while time.monotonic() < ate:
+                pendentes = list(Relatorio.objects.filter(
+                    professor_id=professor_id, ano=cenario['ano'], trimestre=cenario['trimestre'],
+                    status__in=STATUS_EDITAVEIS,
+                ).values_list('id', flat=True))
+                if not pendentes:
+                    break
+                relatorio_id = random.choice(pendentes)
+
+                for materia in MATERIAS_CARGA:
+                    caminho = reverse('avaliar_materia', args=[relatorio_id, materia])
+                    for _ in range(options['salvamentos']):
+                        # Cada salvamento parte da tela recém-aberta (versões atuais)
+                        _, html = navegador.requisitar('GET', 'avaliar_materia', caminho)
+                        dados = {'btn_salvar': ''}
+                        for cid, versao in RE_VERSAO_AVALIACAO.findall(html):
+                            dados.update({
+                                f'versao_{cid}': versao,
+                                f'nivel_{cid}': random.choice('12345'),
+                                f'obs_{cid}': 'Observação do teste de carga.',
+                            })
+                        navegador.requisitar('POST', 'avaliar_materia', caminho, dados)
+
+                navegador.requisitar(
+                    'POST', 'enviar_relatorio_final', reverse('enviar_relatorio_final', args=[relatorio_id]), {}
+                )
+        finally:
+            connections.close_all()
+            professores_ativos.release()
+
+    def simular_coordenador(self, navegador, options, ate, fim_professores):
+        """Painel, leitura de um relatório em análise e decisão (aprovar ou devolver)."""
+        try:
+            while time.monotonic() < ate:
+                navegador.requisitar('GET', 'dashboard', reverse('dashboard'))
+                relatorio_id = (
+                    Relatorio.objects.filter(status='ANALISE', professor__username__startswith=PREFIXO)
+                    .order_by('?').values_list('id', flat=True).first()
+                )
+                if relatorio_id is None:
+                    if fim_professores.is_set():
+                        break
+                    time.sleep(0.2)
+                    continue
+
+                _, html = navegador.requisitar(
+                    'GET', 'visualizar_relatorio', reverse('visualizar_relatorio', args=[relatorio_id])
+                )
+                versao = RE_VERSAO_RELATORIO.search(html)
+                if not versao:
+                    continue
+                if random.random() < options['devolucao']:
+                    dados = {'acao': 'corrigir', 'motivo_devolucao': 'Revisar as observações.'}
+                else:
+                    dados = {'acao': 'aprovar'}
+                navegador.requisitar(
+                    'POST', 'decisao_relatorio', reverse('decisao_relatorio', args=[relatorio_id]),
+                    {**dados, 'versao': versao.group(1)},
+                )
+        finally:
+            connections.close_all()
+
+    # --------------------------------------------------------------------------
+    # Resultado
+    # --------------------------------------------------------------------------
+    def relatorio_final(self, metricas, duracao, cenario, situacao):
+        self.stdout.write(
+            f"Relatórios ao final ({cenario['total_relatorios']}): "
+            + ', '.join(f"{status}: {qtd}" for status, qtd in sorted(situacao.items()))
+        )
+        self.stdout.write('')
+        self.stdout.write(
+            f"{'Rota':<32} {'Req':>6} {'Req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+            f"{'máx ms':>8} {'Erros':>6} {'Travas':>6}"
+        )
+        total = erros = travas = 0
+        for rota, dados in sorted(metricas.rotas.items()):
+            tempos = sorted(dados['tempos'])
+            total += len(tempos)
+            erros += dados['erros']
+            travas += dados['travas']
+            ms = [(_percentil(tempos, p) or 0) * 1000 for p in (0.5, 0.95, 0.99, 1)]
+            self.stdout.write(
+                f"{rota:<32} {len(tempos):>6} {len(tempos) / duracao:>7.1f} "
+                f"{ms[0]:>8.0f} {ms[1]:>8.0f} {ms[2]:>8.0f} {ms[3]:>8.0f} {dados['erros']:>6} {dados['travas']:>6}"
+            )
+
+        estilo = self.style.SUCCESS if not erros and not travas else self.style.WARNING
+        self.stdout.write(estilo(
+            f"TOTAL: {total} requisições em {duracao:.1f}s ({total / duracao:.1f} req/s), "
+            f"{erros} erros, {travas} erros de banco travado (SQLite)."
+        ))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from academic.utils import planejar_virada_ano, executar_virada_ano
+
+class Command(BaseCommand):
+    help = 'Clona as turmas para o próximo ano letivo e promove os alunos de série (prévia por padrão)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ano', type=int, help='Ano letivo de origem (padrão: ano ativo na configuração)')
+        parser.add_argument('--confirmar', action='store_true', help='Executa a virada após exibir a prévia')
+
+    def handle(self, *args, **options):
+        # Sempre monta e exibe a prévia antes de qualquer gravação
+        plano = planejar_virada_ano(options['ano'])
+
+        self.stdout.write(f"Virada de {plano['ano_origem']} para {plano['ano_destino']}:")
+        for item in plano['itens']:
+            turma = item['turma']
+            if item['concluinte']:
+                destino = 'concluintes (permanecem na turma antiga)'
+            elif item['destino']:
+                destino = f"promovidos para {item['destino'].nome}"
+            else:
+                destino = 'SEM turma de destino'
+            self.stdout.write(f"  {turma.nome} ({turma.get_turno_display()}): {item['qtd_alunos']} alunos -> {destino}")
+
+        self.stdout.write(
+            f"Turmas a clonar: {plano['total_turmas']} | Promovidos: {plano['total_promovidos']} | "
+            f"Concluintes: {plano['total_concluintes']} | Sem destino: {plano['total_sem_destino']}"
+        )
+
+        if plano['bloqueio']:
+            raise CommandError(plano['bloqueio'])
+
+        if not options['confirmar']:
+            self.stdout.write(self.style.WARNING('PRÉVIA: nada foi gravado. Use --confirmar para executar.'))
+            return
+
+        resultado = executar_virada_ano(plano)
+        self.stdout.write(self.style.SUCCESS(
+            f"VIRADA CONCLUÍDA: {resultado['turmas_criadas']} turmas criadas e "
+            f"{resultado['alunos_promovidos']} alunos promovidos para {plano['ano_destino']}."
+        ))
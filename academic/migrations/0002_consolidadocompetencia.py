@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-19 18:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academic', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsolidadoCompetencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ano', models.IntegerField()),
+                ('trimestre', models.CharField(choices=[('1', '1º Trimestre'), ('2', '2º Trimestre'), ('3', '3º Trimestre')], max_length=1)),
+                ('componente', models.CharField(choices=[('PORT', 'Língua Portuguesa'), ('ARTE', 'Arte'), ('EDFIS', 'Educação Física'), ('MAT', 'Matemática'), ('CIEN', 'Ciências'), ('GEO', 'Geografia'), ('HIST', 'História'), ('REL', 'Ensino Religioso')], max_length=10)),
+                ('qtd_nivel_1', models.PositiveIntegerField(default=0)),
+                ('qtd_nivel_2', models.PositiveIntegerField(default=0)),
+                ('qtd_nivel_3', models.PositiveIntegerField(default=0)),
+                ('qtd_nivel_4', models.PositiveIntegerField(default=0)),
+                ('qtd_nivel_5', models.PositiveIntegerField(default=0)),
+                ('qtd_sem_nivel', models.PositiveIntegerField(default=0)),
+                ('competencia', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consolidados', to='academic.competencia')),
+                ('turma', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consolidados', to='academic.turma')),
+            ],
+            options={
+                'verbose_name_plural': 'Consolidados de Competências',
+                'indexes': [models.Index(fields=['ano', 'trimestre', 'componente'], name='academic_co_ano_4e889b_idx')],
+                'unique_together': {('ano', 'trimestre', 'turma', 'competencia')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-19 18:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academic', '0002_consolidadocompetencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PresetCompetencias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=100, verbose_name='Nome do Preset')),
+                ('componente', models.CharField(choices=[('PORT', 'Língua Portuguesa'), ('ARTE', 'Arte'), ('EDFIS', 'Educação Física'), ('MAT', 'Matemática'), ('CIEN', 'Ciências'), ('GEO', 'Geografia'), ('HIST', 'História'), ('REL', 'Ensino Religioso')], max_length=10)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('competencias', models.ManyToManyField(related_name='presets', to='academic.competencia')),
+                ('professor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='presets_competencias', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Preset de Competências',
+                'verbose_name_plural': 'Presets de Competências',
+                'unique_together': {('professor', 'nome', 'componente')},
+            },
+        ),
+    ]
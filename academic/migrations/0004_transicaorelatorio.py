@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-19 18:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academic', '0003_presetcompetencias'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransicaoRelatorio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ano', models.IntegerField()),
+                ('trimestre', models.CharField(choices=[('1', '1º Trimestre'), ('2', '2º Trimestre'), ('3', '3º Trimestre')], max_length=1)),
+                ('de_status', models.CharField(choices=[('RASCUNHO', '📝 Rascunho (Professor Editando)'), ('ANALISE', '⏳ Aguardando Coordenação'), ('APROVADO', '✅ Aprovado (Finalizado)'), ('CORRECAO', '⚠️ Devolvido para Correção')], max_length=20)),
+                ('para_status', models.CharField(choices=[('RASCUNHO', '📝 Rascunho (Professor Editando)'), ('ANALISE', '⏳ Aguardando Coordenação'), ('APROVADO', '✅ Aprovado (Finalizado)'), ('CORRECAO', '⚠️ Devolvido para Correção')], max_length=20)),
+                ('data_hora', models.DateTimeField(auto_now_add=True)),
+                ('relatorio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transicoes', to='academic.relatorio')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Transição de Relatório',
+                'verbose_name_plural': 'Transições de Relatórios',
+                'indexes': [models.Index(fields=['ano', 'trimestre', 'para_status', 'data_hora'], name='academic_tr_ano_34e9e1_idx'), models.Index(fields=['relatorio', 'para_status', 'data_hora'], name='academic_tr_relator_eb17b6_idx')],
+            },
+        ),
+    ]
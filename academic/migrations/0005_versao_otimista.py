@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-19 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academic', '0004_transicaorelatorio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='avaliacao',
+            name='versao',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='relatorio',
+            name='versao',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 6.0 on 2026-10-19 18:43
+
+import random
+
+from django.db import migrations, models
+
+
+def fixar_sugestoes_aprovados(apps, schema_editor):
+    """Relatórios já aprovados recebem um sorteio fixo, como os novos."""
+    Avaliacao = apps.get_model('academic', 'Avaliacao')
+    SugestaoAtividade = apps.get_model('academic', 'SugestaoAtividade')
+    Ligacao = Avaliacao.sugestoes_escolhidas.through
+    # Usa o banco sendo migrado (o arquivo também roda esta migração)
+    db = schema_editor.connection.alias
+
+    candidatas = {}
+    for sugestao in SugestaoAtividade.objects.using(db).filter(status='APROVADO'):
+        candidatas.setdefault((sugestao.competencia_id, sugestao.nivel_alvo), []).append(sugestao.id)
+
+    ligacoes = []
+    avaliacoes = Avaliacao.objects.using(db).filter(relatorio__status='APROVADO', nivel__isnull=False)
+    for av in avaliacoes.values('id', 'competencia_id', 'nivel').iterator():
+        compativeis = candidatas.get((av['competencia_id'], av['nivel']))
+        if compativeis:
+            ligacoes.extend(
+                Ligacao(avaliacao_id=av['id'], sugestaoatividade_id=sugestao_id)
+                for sugestao_id in random.sample(compativeis, min(len(compativeis), 2))
+            )
+    Ligacao.objects.using(db).bulk_create(ligacoes, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academic', '0005_versao_otimista'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='avaliacao',
+            name='sugestoes_escolhidas',
+            field=models.ManyToManyField(blank=True, related_name='avaliacoes', to='academic.sugestaoatividade'),
+        ),
+        migrations.RunPython(fixar_sugestoes_aprovados, migrations.RunPython.noop),
+    ]
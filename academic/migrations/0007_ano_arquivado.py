@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-19 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academic', '0006_sugestoes_escolhidas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnoArquivado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ano', models.IntegerField(unique=True)),
+                ('data_arquivamento', models.DateTimeField(auto_now_add=True)),
+                ('qtd_relatorios', models.PositiveIntegerField(default=0)),
+                ('qtd_avaliacoes', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Ano Arquivado',
+                'verbose_name_plural': 'Anos Arquivados',
+                'ordering': ['ano'],
+            },
+        ),
+    ]
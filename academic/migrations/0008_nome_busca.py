@@ -0,0 +1,42 @@
+# Generated by Django 6.0 on 2026-10-19 19:11
+
+import academic.models
+from django.db import migrations
+
+
+def preencher_nome_busca(apps, schema_editor):
+    """Chave de busca dos alunos e usuários já cadastrados."""
+    db = schema_editor.connection.alias
+    Aluno = apps.get_model('academic', 'Aluno')
+    CustomUser = apps.get_model('academic', 'CustomUser')
+
+    alunos = list(Aluno.objects.using(db).only('pk', 'nome_completo'))
+    for aluno in alunos:
+        aluno.nome_busca = academic.models.chave_busca(aluno.nome_completo)
+    Aluno.objects.using(db).bulk_update(alunos, ['nome_busca'], batch_size=500)
+
+    usuarios = list(CustomUser.objects.using(db).only('pk', 'first_name', 'last_name', 'username'))
+    for usuario in usuarios:
+        usuario.nome_busca = academic.models.chave_busca(usuario.first_name, usuario.last_name, usuario.username)
+    CustomUser.objects.using(db).bulk_update(usuarios, ['nome_busca'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academic', '0007_ano_arquivado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aluno',
+            name='nome_busca',
+            field=academic.models.CampoBusca(db_collation='NOCASE', db_index=True, default='', editable=False, max_length=300),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='nome_busca',
+            field=academic.models.CampoBusca(db_collation='NOCASE', db_index=True, default='', editable=False, max_length=300),
+        ),
+        migrations.RunPython(preencher_nome_busca, migrations.RunPython.noop),
+    ]
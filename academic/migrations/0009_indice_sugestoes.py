@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-19 19:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academic', '0008_nome_busca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sugestaoatividade',
+            name='assinatura',
+            field=models.CharField(default='', editable=False, max_length=512),
+        ),
+        migrations.CreateModel(
+            name='BandaSugestao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nivel_alvo', models.CharField(max_length=1)),
+                ('chave', models.BigIntegerField()),
+                ('competencia', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='academic.competencia')),
+                ('sugestao', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bandas', to='academic.sugestaoatividade')),
+            ],
+            options={
+                'verbose_name': 'Banda de Sugestão',
+                'verbose_name_plural': 'Bandas de Sugestões',
+                'indexes': [models.Index(fields=['competencia', 'nivel_alvo', 'chave'], name='academic_ba_compete_2fe139_idx')],
+            },
+        ),
+    ]
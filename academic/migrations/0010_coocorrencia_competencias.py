@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-19 19:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academic', '0009_indice_sugestoes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoocorrenciaCompetencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('serie_curricular', models.CharField(choices=[('1', '1º Ano Fundamental'), ('2', '2º Ano Fundamental'), ('3', '3º Ano Fundamental'), ('4', '4º Ano Fundamental'), ('5', '5º Ano Fundamental')], max_length=2)),
+                ('qtd', models.PositiveIntegerField()),
+                ('competencia', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='academic.competencia')),
+                ('relacionada', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='academic.competencia')),
+            ],
+            options={
+                'verbose_name': 'Co-ocorrência de Competências',
+                'verbose_name_plural': 'Co-ocorrências de Competências',
+                'unique_together': {('serie_curricular', 'competencia', 'relacionada')},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-19 21:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def preencher_turma(apps, schema_editor):
+    """Relatórios existentes ficam com a turma atual do aluno (único dado disponível)."""
+    Relatorio = apps.get_model('academic', 'Relatorio')
+    Aluno = apps.get_model('academic', 'Aluno')
+    db = schema_editor.connection.alias
+    Relatorio.objects.using(db).update(
+        turma_id=Subquery(Aluno.objects.using(db).filter(pk=OuterRef('aluno_id')).values('turma_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academic', '0010_coocorrencia_competencias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='relatorio',
+            name='turma',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='relatorios', to='academic.turma'),
+        ),
+        migrations.RunPython(preencher_turma, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='relatorio',
+            name='turma',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='relatorios', to='academic.turma'),
+        ),
+    ]
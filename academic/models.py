@@ -1,7 +1,43 @@
+import unicodedata
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 
+
+def normalizar_texto(texto):
+    """Minúsculas e sem acentos: 'Gêneros' -> 'generos'."""
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(ch for ch in decomposto if not unicodedata.combining(ch)).lower()
+
+
+def chave_busca(*partes):
+    """Chave de busca de nomes: 'João  D'Ávila' -> 'joao d avila' (sem acentos, só letras e números)."""
+    texto = normalizar_texto(' '.join(p for p in partes if p))
+    return ' '.join(''.join(ch if ch.isalnum() else ' ' for ch in texto).split())
+
+
+class CampoBusca(models.CharField):
+    """
+    Coluna com a chave de busca, indexada. No SQLite o LIKE só aproveita o
+    índice (busca por prefixo) em colunas com collation NOCASE.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', 300)
+        kwargs.setdefault('default', '')
+        kwargs.setdefault('editable', False)
+        kwargs.setdefault('db_index', True)
+        kwargs.setdefault('db_collation', 'NOCASE')
+        super().__init__(*args, **kwargs)
+
+
+def _com_chave_busca(kwargs, *campos_origem):
+    """save(update_fields=[...]) que muda o nome também grava a chave."""
+    campos = kwargs.get('update_fields')
+    if campos is not None and set(campos) & set(campos_origem):
+        kwargs['update_fields'] = set(campos) | {'nome_busca'}
+    return kwargs
+
 # ==============================================================================
 # 1. GESTÃO DE USUÁRIOS E PERMISSÕES
 # ==============================================================================
@@ -17,6 +53,12 @@ class CustomUser(AbstractUser):
         default='PROFESSOR', 
         verbose_name="Função"
     )
+    # Nome e usuário sem acentos, para a busca (mantido no save)
+    nome_busca = CampoBusca()
+
+    def save(self, *args, **kwargs):
+        self.nome_busca = chave_busca(self.first_name, self.last_name, self.username)
+        super().save(*args, **_com_chave_busca(kwargs, 'first_name', 'last_name', 'username'))
     
     def __str__(self):
         # Usamos first_name se disponível, senão o username
@@ -64,6 +106,12 @@ class Aluno(models.Model):
     data_nascimento = models.DateField(null=True, blank=True)
     turma = models.ForeignKey(Turma, on_delete=models.CASCADE, related_name='alunos')
     matricula = models.IntegerField(primary_key=True, default=0000000, verbose_name="Número de matrícula(Aluno)")
+    # Nome sem acentos, para a busca (mantido no save)
+    nome_busca = CampoBusca()
+
+    def save(self, *args, **kwargs):
+        self.nome_busca = chave_busca(self.nome_completo)
+        super().save(*args, **_com_chave_busca(kwargs, 'nome_completo'))
 
     def __str__(self):
         return self.nome_completo
@@ -132,6 +180,8 @@ class SugestaoAtividade(models.Model):
     
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDENTE')
     data_envio = models.DateTimeField(auto_now_add=True)
+    # Assinatura MinHash de título + descrição em hexadecimal (mantida pelos signals)
+    assinatura = models.CharField(max_length=512, default='', editable=False)
 
     def __str__(self):
         return f"{self.titulo} - {self.competencia.codigo}"
@@ -155,6 +205,8 @@ class Relatorio(models.Model):
     ]
 
     aluno = models.ForeignKey(Aluno, on_delete=models.CASCADE)
+    # Turma do aluno quando o relatório foi criado (a virada de ano muda aluno.turma)
+    turma = models.ForeignKey(Turma, on_delete=models.CASCADE, related_name='relatorios')
     professor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     trimestre = models.CharField(max_length=1, choices=TRIMESTRES, default='1')
     ano = models.IntegerField(default=2025)
@@ -162,10 +214,17 @@ class Relatorio(models.Model):
     feedback_coordenacao = models.TextField(blank=True, verbose_name="Feedback da Coordenação")
     data_criacao = models.DateTimeField(auto_now_add=True)
     data_atualizacao = models.DateTimeField(auto_now=True)
+    # Controle otimista: toda gravação confere e incrementa (UPDATE ... WHERE versao = n)
+    versao = models.PositiveIntegerField(default=1)
 
     class Meta:
         unique_together = ['aluno', 'trimestre', 'ano']
 
+    def save(self, *args, **kwargs):
+        if self.turma_id is None:
+            self.turma_id = self.aluno.turma_id
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Relatório {self.aluno} - {self.get_trimestre_display()} ({self.ano})"
 
@@ -186,6 +245,9 @@ class Avaliacao(models.Model):
     competencia = models.ForeignKey(Competencia, on_delete=models.CASCADE)
     nivel = models.CharField(max_length=1, choices=NIVEIS, null=True, blank=True) # Permitir null para competências selecionadas mas não avaliadas
     observacao_especifica = models.TextField(blank=True, verbose_name="Obs. desta competência")
+    versao = models.PositiveIntegerField(default=1)
+    # Sugestões sorteadas e fixadas no momento da aprovação do relatório
+    sugestoes_escolhidas = models.ManyToManyField(SugestaoAtividade, blank=True, related_name='avaliacoes')
     
     class Meta:
         unique_together = ('relatorio', 'competencia')
@@ -211,4 +273,175 @@ class ConfiguracaoSistema(models.Model):
         verbose_name_plural = "Configurações do Sistema"
 
     def __str__(self):
-        return f"Configuração Atual: {self.get_trimestre_ativo_display()} de {self.ano_letivo}"
\ No newline at end of file
+        return f"Configuração Atual: {self.get_trimestre_ativo_display()} de {self.ano_letivo}"
+
+# ==============================================================================
+# 8. CONSOLIDADOS PARA ANÁLISE DA COORDENAÇÃO (ROLLUPS)
+# ==============================================================================
+class ConsolidadoCompetencia(models.Model):
+    """
+    Distribuição materializada dos níveis por (ano, trimestre, turma, competência).
+    Mantida incrementalmente pelos signals de Avaliacao e reconstruída pelo
+    comando 'consolidar_competencias'. As telas de análise leem SOMENTE esta tabela.
+    """
+    ano = models.IntegerField()
+    trimestre = models.CharField(max_length=1, choices=Relatorio.TRIMESTRES)
+    turma = models.ForeignKey(Turma, on_delete=models.CASCADE, related_name='consolidados')
+    componente = models.CharField(max_length=10, choices=Competencia.COMPONENTES)
+    competencia = models.ForeignKey(Competencia, on_delete=models.CASCADE, related_name='consolidados')
+
+    qtd_nivel_1 = models.PositiveIntegerField(default=0)
+    qtd_nivel_2 = models.PositiveIntegerField(default=0)
+    qtd_nivel_3 = models.PositiveIntegerField(default=0)
+    qtd_nivel_4 = models.PositiveIntegerField(default=0)
+    qtd_nivel_5 = models.PositiveIntegerField(default=0)
+    qtd_sem_nivel = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('ano', 'trimestre', 'turma', 'competencia')
+        indexes = [models.Index(fields=['ano', 'trimestre', 'componente'])]
+        verbose_name_plural = "Consolidados de Competências"
+
+    @property
+    def contagens(self):
+        return [self.qtd_nivel_1, self.qtd_nivel_2, self.qtd_nivel_3, self.qtd_nivel_4, self.qtd_nivel_5]
+
+    @property
+    def total_avaliados(self):
+        return sum(self.contagens)
+
+    @property
+    def media(self):
+        total = self.total_avaliados
+        if not total:
+            return None
+        return sum(nivel * qtd for nivel, qtd in enumerate(self.contagens, start=1)) / total
+
+    @property
+    def percentual_desenvolvido(self):
+        """Percentual de alunos avaliados nos níveis 4 e 5."""
+        total = self.total_avaliados
+        if not total:
+            return 0
+        return int((self.qtd_nivel_4 + self.qtd_nivel_5) / total * 100)
+
+    def __str__(self):
+        return f"{self.turma_id}/{self.competencia_id} - {self.trimestre}º Tri {self.ano}"
+
+
+# ==============================================================================
+# 9. PRESETS DE COMPETÊNCIAS DO PROFESSOR
+# ==============================================================================
+class PresetCompetencias(models.Model):
+    """Lista salva de competências que o professor aplica de uma vez em um relatório."""
+    professor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='presets_competencias')
+    nome = models.CharField(max_length=100, verbose_name="Nome do Preset")
+    componente = models.CharField(max_length=10, choices=Competencia.COMPONENTES)
+    competencias = models.ManyToManyField(Competencia, related_name='presets')
+    data_criacao = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('professor', 'nome', 'componente')
+        verbose_name = "Preset de Competências"
+        verbose_name_plural = "Presets de Competências"
+
+    def __str__(self):
+        return f"{self.nome} ({self.componente})"
+
+
+# ==============================================================================
+# 10. HISTÓRICO DE TRANSIÇÕES DE STATUS DO RELATÓRIO (APPEND-ONLY)
+# ==============================================================================
+class TransicaoRelatorio(models.Model):
+    """
+    Registro imutável de cada mudança de status de um Relatório, gravado na
+    mesma transação da mudança. Alimenta as métricas de vazão e tempo de espera.
+    """
+    relatorio = models.ForeignKey(Relatorio, on_delete=models.CASCADE, related_name='transicoes')
+    ano = models.IntegerField()
+    trimestre = models.CharField(max_length=1, choices=Relatorio.TRIMESTRES)
+    de_status = models.CharField(max_length=20, choices=Relatorio.STATUS_FLUXO)
+    para_status = models.CharField(max_length=20, choices=Relatorio.STATUS_FLUXO)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    data_hora = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ano', 'trimestre', 'para_status', 'data_hora']),
+            models.Index(fields=['relatorio', 'para_status', 'data_hora']),
+        ]
+        verbose_name = "Transição de Relatório"
+        verbose_name_plural = "Transições de Relatórios"
+
+    def __str__(self):
+        return f"Relatório {self.relatorio_id}: {self.de_status} -> {self.para_status}"
+
+
+# ==============================================================================
+# 11. ANOS LETIVOS ARQUIVADOS (BANCO FRIO)
+# ==============================================================================
+class AnoArquivado(models.Model):
+    """
+    Ano letivo encerrado cujos relatórios, avaliações e transições foram
+    movidos para o banco de arquivo (alias 'arquivo'). Fica no banco principal
+    e diz às consultas históricas em qual banco procurar cada ano.
+    """
+    ano = models.IntegerField(unique=True)
+    data_arquivamento = models.DateTimeField(auto_now_add=True)
+    qtd_relatorios = models.PositiveIntegerField(default=0)
+    qtd_avaliacoes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['ano']
+        verbose_name = "Ano Arquivado"
+        verbose_name_plural = "Anos Arquivados"
+
+    def __str__(self):
+        return f"{self.ano} (arquivado)"
+
+
+# ==============================================================================
+# 12. ÍNDICE DE QUASE-DUPLICATAS DAS SUGESTÕES (MINHASH + LSH)
+# ==============================================================================
+class BandaSugestao(models.Model):
+    """
+    Uma linha por banda da assinatura MinHash de cada sugestão. Sugestões da
+    mesma competência e nível que compartilham alguma banda são candidatas a
+    quase-duplicatas; só elas têm as assinaturas comparadas.
+    """
+    sugestao = models.ForeignKey(SugestaoAtividade, on_delete=models.CASCADE, related_name='bandas')
+    competencia = models.ForeignKey(Competencia, on_delete=models.CASCADE, related_name='+')
+    nivel_alvo = models.CharField(max_length=1)
+    chave = models.BigIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['competencia', 'nivel_alvo', 'chave'])]
+        verbose_name = "Banda de Sugestão"
+        verbose_name_plural = "Bandas de Sugestões"
+
+    def __str__(self):
+        return f"Sugestão {self.sugestao_id}: {self.chave}"
+
+
+# ==============================================================================
+# 13. CO-OCORRÊNCIA DE COMPETÊNCIAS (RECOMENDAÇÕES DA MATÉRIA)
+# ==============================================================================
+class CoocorrenciaCompetencia(models.Model):
+    """
+    Matriz esparsa recalculada pelo comando 'recalcular_recomendacoes': em
+    quantos relatórios da série as duas competências foram avaliadas juntas.
+    A diagonal (relacionada = competencia) guarda em quantos relatórios a
+    competência apareceu. A tela da matéria lê só o índice em memória.
+    """
+    serie_curricular = models.CharField(max_length=2, choices=Turma.SERIES)
+    competencia = models.ForeignKey(Competencia, on_delete=models.CASCADE, related_name='+')
+    relacionada = models.ForeignKey(Competencia, on_delete=models.CASCADE, related_name='+')
+    qtd = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('serie_curricular', 'competencia', 'relacionada')
+        verbose_name = "Co-ocorrência de Competências"
+        verbose_name_plural = "Co-ocorrências de Competências"
+
+    def __str__(self):
+        return f"{self.serie_curricular}º: {self.competencia_id} + {self.relacionada_id} ({self.qtd})"
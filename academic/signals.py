@@ -0,0 +1,43 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Avaliacao, Competencia, ConfiguracaoSistema, SugestaoAtividade
+from .utils import (
+    chave_consolidado, agendar_consolidacao, invalidar_indice_catalogo, invalidar_configuracao, indexar_sugestao
+)
+
+# ==============================================================================
+# 1. MANUTENÇÃO INCREMENTAL DOS CONSOLIDADOS
+# ==============================================================================
+@receiver(post_save, sender=Avaliacao)
+@receiver(post_delete, sender=Avaliacao)
+def avaliacao_alterada(sender, instance, **kwargs):
+    # A chave é resolvida agora: no delete em cascata o relatório ainda existe neste ponto
+    agendar_consolidacao([chave_consolidado(instance.relatorio_id, instance.competencia_id)])
+
+# ==============================================================================
+# 2. ÍNDICE DE AUTOCOMPLETE DO CATÁLOGO BNCC
+# ==============================================================================
+@receiver(post_save, sender=Competencia)
+@receiver(post_delete, sender=Competencia)
+def catalogo_alterado(sender, instance, **kwargs):
+    invalidar_indice_catalogo()
+
+# ==============================================================================
+# 3. CONFIGURAÇÃO DA ESCOLA EM CACHE (PERÍODO ATIVO)
+# ==============================================================================
+@receiver(post_save, sender=ConfiguracaoSistema)
+@receiver(post_delete, sender=ConfiguracaoSistema)
+def configuracao_alterada(sender, instance, using, **kwargs):
+    invalidar_configuracao()
+    # De novo após o commit: uma leitura concorrente pode ter guardado o valor antigo
+    transaction.on_commit(invalidar_configuracao, using=using)
+
+# ==============================================================================
+# 4. ÍNDICE DE QUASE-DUPLICATAS DAS SUGESTÕES
+# ==============================================================================
+@receiver(post_save, sender=SugestaoAtividade)
+def sugestao_gravada(sender, instance, raw=False, **kwargs):
+    # loaddata (raw) grava as linhas como estão; o índice vem de 'deduplicar_sugestoes'
+    if not raw:
+        indexar_sugestao(instance)
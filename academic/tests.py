@@ -1,3 +1,1409 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    CustomUser, Turma, Aluno, Competencia, Relatorio, Avaliacao, TransicaoRelatorio, SugestaoAtividade,
+    ConfiguracaoSistema, ConsolidadoCompetencia, BandaSugestao, CoocorrenciaCompetencia, PresetCompetencias
+)
+from core.escolas import escola_por_slug, na_escola
+from core.middleware import AvisoPerfilDevMiddleware
+from core.replica import RoteadorReplica, atualizar_replica, usar_replica
+
+from .utils import (
+    alterar_status_relatorio, salvar_avaliacoes_com_versao, ConflitoVersao, aprovar_relatorio,
+    evolucao_longitudinal, planejar_arquivamento, executar_arquivamento, reconstruir_consolidados,
+    exportar_snapshot, restaurar_snapshot, ErroSnapshot, filtro_busca_nome, get_periodo_atual,
+    sugestoes_semelhantes, get_indice_recomendacoes, clonar_avaliacoes_anteriores,
+    clonar_trimestre_anterior_turma, planejar_virada_ano, executar_virada_ano, adicionar_avaliacoes_em_lote,
+    salvar_grade_avaliacao, metricas_fluxo_relatorios, relatorio_virtual, obter_relatorio_para_escrita
+)
+from .views import CAMPOS_DETALHE_COMPETENCIA, baixar_relatorio_pdf
+from .management.commands.medir_inicializacao import MODULOS_SOB_DEMANDA
+
+
+def _em_threads(qtd, alvo):
+    """Dispara 'alvo(i)' em 'qtd' threads ao mesmo tempo e devolve os resultados."""
+    barreira = threading.Barrier(qtd)
+    resultados = [None] * qtd
+
+    def executar(i):
+        try:
+            barreira.wait()
+            resultados[i] = alvo(i)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=executar, args=(i,)) for i in range(qtd)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return resultados
+
+
+def _com_retentativa(funcao):
+    """No SQLite os escritores são serializados; banco travado é tentado de novo."""
+    while True:
+        try:
+            return funcao()
+        except OperationalError as erro:
+            if 'locked' not in str(erro):
+                raise
+
+
+class DadosRelatorioMixin:
+    def criar_dados(self):
+        self.professor = CustomUser.objects.create_user('prof', password='x', role='PROFESSOR')
+        self.coordenador = CustomUser.objects.create_user('coord', password='x', role='ADMINISTRADOR')
+        turma = Turma.objects.create(nome='1A', serie_curricular='1', ano_letivo=2025)
+        aluno = Aluno.objects.create(matricula=1, nome_completo='Aluno Teste', turma=turma)
+        competencia = Competencia.objects.create(
+            codigo='EF01LP01', componente='PORT', anos_aplicacao='1', habilidade='Ler.'
+        )
+        self.relatorio = Relatorio.objects.create(aluno=aluno, professor=self.professor, ano=2025, trimestre='1')
+        self.avaliacao = Avaliacao.objects.create(relatorio=self.relatorio, competencia=competencia)
+
+
+class ViradaAnoTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.professor = CustomUser.objects.create_user('prof', password='x', role='PROFESSOR')
+        ConfiguracaoSistema.objects.create(id=1, ano_letivo=2025, trimestre_ativo='3')
+        self.turmas = {}
+        for nome, serie in [('1A', '1'), ('2A', '2'), ('5A', '5')]:
+            turma = self.turmas[nome] = Turma.objects.create(nome=nome, serie_curricular=serie, ano_letivo=2025)
+            turma.professores.add(self.professor)
+            Aluno.objects.create(matricula=len(self.turmas), nome_completo=f'Aluno {nome}', turma=turma)
+
+    def test_virada_clona_turmas_e_promove_alunos(self):
+        plano = planejar_virada_ano()
+        self.assertEqual(
+            (plano['total_promovidos'], plano['total_sem_destino'], plano['total_concluintes']), (1, 1, 1)
+        )
+
+        self.assertEqual(executar_virada_ano(plano), {'turmas_criadas': 3, 'alunos_promovidos': 1})
+
+        novas = {t.nome: t for t in Turma.objects.filter(ano_letivo=2026)}
+        self.assertEqual(sorted(novas), ['1A', '2A', '5A'])
+        self.assertEqual(list(novas['2A'].alunos.values_list('matricula', flat=True)), [1])
+        self.assertEqual(Aluno.objects.get(matricula=3).turma, self.turmas['5A'])
+        self.assertEqual(self.professor.turmas.filter(ano_letivo=2026).count(), 3)
+        self.assertEqual(get_periodo_atual(), (2026, '1'))
+        self.assertIsNotNone(planejar_virada_ano(2025)['bloqueio'])
+
+    def test_falha_desfaz_a_virada_inteira(self):
+        plano = planejar_virada_ano()
+
+        # A última etapa (ativar o novo ano) falha depois das turmas e alunos
+        with mock.patch.object(ConfiguracaoSistema, 'save', side_effect=OperationalError('disco cheio')):
+            with self.assertRaises(OperationalError):
+                executar_virada_ano(plano)
+
+        self.assertFalse(Turma.objects.filter(ano_letivo=2026).exists())
+        self.assertEqual(Aluno.objects.get(matricula=1).turma, self.turmas['1A'])
+        self.assertEqual(ConfiguracaoSistema.objects.get().ano_letivo, 2025)
+
+    def test_virada_ativa_a_configuracao_existente(self):
+        ConfiguracaoSistema.objects.all().delete()
+        ConfiguracaoSistema.objects.create(id=7, ano_letivo=2025, trimestre_ativo='3')
+        cache.clear()
+
+        executar_virada_ano(planejar_virada_ano())
+
+        self.assertEqual(list(ConfiguracaoSistema.objects.values_list('id', 'ano_letivo')), [(7, 2026)])
+        self.assertEqual(get_periodo_atual(), (2026, '1'))
+
+    def test_confirmacao_rejeita_previa_desatualizada(self):
+        admin = CustomUser.objects.create(username='admin', role='ADMINISTRADOR')
+        self.client.force_login(admin)
+        url = reverse('virada_ano_letivo')
+        assinatura = self.client.get(url).context['plano']['assinatura']
+
+        # Um aluno entra depois da prévia: a confirmação antiga não vale mais
+        Aluno.objects.create(matricula=9, nome_completo='Aluno Novo', turma=self.turmas['1A'])
+        self.client.post(url, {'assinatura': assinatura})
+        self.assertFalse(Turma.objects.filter(ano_letivo=2026).exists())
+
+        assinatura = self.client.get(url).context['plano']['assinatura']
+        self.client.post(url, {'assinatura': assinatura})
+        self.assertEqual(Turma.objects.filter(ano_letivo=2026).count(), 3)
+
+
+class ConsolidadosTests(DadosRelatorioMixin, TestCase):
+    def setUp(self):
+        self.criar_dados()
+
+    def consolidado(self):
+        return ConsolidadoCompetencia.objects.get(competencia=self.avaliacao.competencia)
+
+    def test_rollup_recalculado_so_depois_do_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.avaliacao.nivel = '4'
+            self.avaliacao.save()
+            # Antes do commit nada foi recalculado
+            self.assertFalse(ConsolidadoCompetencia.objects.exists())
+        self.assertEqual(len(callbacks), 1)
+
+        consolidado = self.consolidado()
+        self.assertEqual((consolidado.qtd_nivel_4, consolidado.qtd_sem_nivel, consolidado.componente), (1, 0, 'PORT'))
+        self.assertEqual(consolidado.turma, self.relatorio.aluno.turma)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.avaliacao.delete()
+        self.assertFalse(ConsolidadoCompetencia.objects.exists())
+
+    def test_reconstrucao_bate_com_o_incremental(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.avaliacao.nivel = '2'
+            self.avaliacao.save()
+        incremental = self.consolidado().contagens
+        ConsolidadoCompetencia.objects.all().delete()
+
+        self.assertEqual(reconstruir_consolidados(), 1)
+        self.assertEqual(self.consolidado().contagens, incremental)
+
+    def test_virada_nao_move_o_rollup_do_ano_anterior(self):
+        turma_antiga = self.relatorio.aluno.turma
+        with self.captureOnCommitCallbacks(execute=True):
+            self.avaliacao.nivel = '3'
+            self.avaliacao.save()
+
+        # A série seguinte existe: o aluno é promovido para a 2A de 2026
+        Turma.objects.create(nome='2A', serie_curricular='2', ano_letivo=2025)
+        executar_virada_ano(planejar_virada_ano(2025))
+        self.assertNotEqual(Aluno.objects.get(matricula=1).turma, turma_antiga)
+
+        # Correção tardia no relatório de 2025: o rollup continua na turma de 2025
+        with self.captureOnCommitCallbacks(execute=True):
+            self.avaliacao.nivel = '4'
+            self.avaliacao.save()
+        self.assertEqual(
+            list(ConsolidadoCompetencia.objects.values_list('ano', 'turma', 'qtd_nivel_4')), [(2025, turma_antiga.pk, 1)]
+        )
+
+        reconstruir_consolidados()
+        self.assertEqual(
+            list(ConsolidadoCompetencia.objects.values_list('ano', 'turma', 'qtd_nivel_4')), [(2025, turma_antiga.pk, 1)]
+        )
+
+    def test_analise_le_os_consolidados(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.avaliacao.nivel = '5'
+            self.avaliacao.save()
+        self.client.force_login(self.coordenador)
+
+        resposta = self.client.get(reverse('analise_competencias'), {'ano': '2025', 'tri': '1', 'componente': 'PORT'})
+
+        celula = resposta.context['linhas'][0]['celulas'][0]
+        self.assertEqual((celula['competencia'], celula['opacidade']), (self.avaliacao.competencia, '1.00'))
+
+    def test_analise_ignora_periodo_invalido(self):
+        self.client.force_login(self.coordenador)
+
+        resposta = self.client.get(reverse('analise_competencias'), {'ano': 'abc', 'tri': '9'})
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual((resposta.context['ano_selecionado'], resposta.context['tri_selecionado']), ('2025', '1'))
+
+
+class EvolucaoLongitudinalTests(DadosRelatorioMixin, TestCase):
+    def setUp(self):
+        self.criar_dados()
+        self.aluno = self.relatorio.aluno
+        competencia = self.avaliacao.competencia
+        Avaliacao.objects.filter(pk=self.avaliacao.pk).update(nivel='4')
+        for trimestre, nivel in [('2', '2'), ('3', '3')]:
+            relatorio = Relatorio.objects.create(aluno=self.aluno, professor=self.professor, ano=2025, trimestre=trimestre)
+            Avaliacao.objects.create(relatorio=relatorio, competencia=competencia, nivel=nivel)
+
+    def test_niveis_por_periodo_e_regressoes(self):
+        periodos, linhas = evolucao_longitudinal(relatorio__aluno=self.aluno)
+
+        self.assertEqual([p['trimestre'] for p in periodos], ['1', '2', '3'])
+        self.assertEqual(len(linhas), 1)
+        linha = linhas[0]
+        self.assertEqual((linha['aluno_nome'], linha['codigo'], linha['regressoes']), ('Aluno Teste', 'EF01LP01', 1))
+        self.assertEqual(
+            [(c['nivel'], c['regrediu']) for c in linha['celulas']], [('4', False), ('2', True), ('3', False)]
+        )
+
+    def test_tela_da_turma_filtra_regressoes(self):
+        self.client.force_login(self.coordenador)
+
+        resposta = self.client.get(reverse('evolucao_turma', args=[self.aluno.turma_id]), {'regressoes': '1'})
+
+        self.assertEqual(resposta.context['total_regressoes'], 1)
+        self.assertEqual([l['aluno_pk'] for l in resposta.context['linhas']], [self.aluno.pk])
+
+
+class AutocompleteCompetenciasTests(DadosRelatorioMixin, TestCase):
+    def setUp(self):
+        self.criar_dados()
+        self.addCleanup(cache.clear)
+        for codigo, componente, anos, habilidade in [
+            ('EF01LP05', 'PORT', '1, 2', 'Identificar gêneros textuais do cotidiano.'),
+            ('EF02LP01', 'PORT', '2', 'Reconhecer gêneros textuais.'),
+            ('EF01MA01', 'MAT', '1', 'Contar objetos.'),
+        ]:
+            Competencia.objects.create(codigo=codigo, componente=componente, anos_aplicacao=anos, habilidade=habilidade)
+        self.client.force_login(self.professor)
+        self.url = reverse('autocomplete_competencias', args=[self.relatorio.id, 'PORT'])
+
+    def codigos(self, resposta):
+        return [r['codigo'] for r in resposta.json()['resultados']]
+
+    def test_prefixo_de_codigo_e_palavras_sem_acento(self):
+        self.assertEqual(self.codigos(self.client.get(self.url, {'q': 'ef01'})), ['EF01LP01', 'EF01LP05'])
+        # Todas as palavras precisam casar; a série do aluno (1º ano) exclui EF02LP01
+        self.assertEqual(self.codigos(self.client.get(self.url, {'q': 'GENERO text'})), ['EF01LP05'])
+        self.assertEqual(self.codigos(self.client.get(self.url, {'q': 'contar'})), [])
+        self.assertEqual(self.codigos(self.client.get(self.url, {'q': 'e'})), [])
+
+    def test_tela_sem_relatorio_usa_a_serie_do_aluno(self):
+        url = reverse('autocomplete_competencias_aluno', args=[self.relatorio.aluno.pk, 'MAT'])
+        self.assertEqual(self.codigos(self.client.get(url, {'q': 'obj'})), ['EF01MA01'])
+
+        url = reverse('autocomplete_competencias', args=[self.relatorio.id + 999, 'PORT'])
+        self.assertEqual(self.client.get(url, {'q': 'ef01'}).status_code, 404)
+
+    def test_busca_nao_consulta_o_catalogo_e_acompanha_alteracoes(self):
+        self.client.get(self.url, {'q': 'ef01'})
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(self.url, {'q': 'ef01'})
+        self.assertFalse(any('academic_competencia' in q['sql'] for q in consultas.captured_queries))
+
+        Competencia.objects.create(codigo='EF01LP09', componente='PORT', anos_aplicacao='1', habilidade='Rimar.')
+        self.assertEqual(self.codigos(self.client.get(self.url, {'q': 'rim'})), ['EF01LP09'])
+
+
+class GradeAvaliacaoTests(DadosRelatorioMixin, TestCase):
+    def setUp(self):
+        self.criar_dados()
+        self.turma = self.relatorio.aluno.turma
+        self.turma.professores.add(self.professor)
+        self.competencia = self.avaliacao.competencia
+        self.avaliacao.observacao_especifica = 'Lê sílabas.'
+        self.avaliacao.save()
+        self.novo = Aluno.objects.create(matricula=2, nome_completo='Aluno Novo', turma=self.turma)
+        bloqueado = Aluno.objects.create(matricula=3, nome_completo='Aluno Bloqueado', turma=self.turma)
+        self.em_analise = Relatorio.objects.create(
+            aluno=bloqueado, professor=self.professor, ano=2025, trimestre='1', status='ANALISE'
+        )
+
+    def test_upsert_cria_atualiza_e_respeita_bloqueados(self):
+        niveis = {(pk, self.competencia.id): '3' for pk in (1, 2, 3)}
+
+        gravadas, bloqueados = salvar_grade_avaliacao(self.turma, 2025, '1', self.professor, niveis)
+
+        self.assertEqual((gravadas, bloqueados), (2, {3}))
+        self.avaliacao.refresh_from_db()
+        # ON CONFLICT DO UPDATE troca só o nível e a versão avança
+        self.assertEqual((self.avaliacao.nivel, self.avaliacao.observacao_especifica, self.avaliacao.versao),
+                         ('3', 'Lê sílabas.', 2))
+        criado = Relatorio.objects.get(aluno=self.novo, ano=2025, trimestre='1')
+        self.assertEqual((criado.professor, criado.status), (self.professor, 'RASCUNHO'))
+        self.assertEqual(criado.avaliacoes.get().nivel, '3')
+        self.assertFalse(self.em_analise.avaliacoes.exists())
+
+    def test_tela_tem_consultas_constantes(self):
+        self.client.force_login(self.professor)
+        url = reverse('grade_avaliacao', args=[self.turma.id, 'PORT'])
+
+        with self.assertNumQueries(9):
+            self.client.get(url)
+        for matricula in range(10, 30):
+            aluno = Aluno.objects.create(matricula=matricula, nome_completo=f'Aluno {matricula}', turma=self.turma)
+            relatorio = Relatorio.objects.create(aluno=aluno, professor=self.professor, ano=2025, trimestre='1')
+            Avaliacao.objects.create(relatorio=relatorio, competencia=self.competencia, nivel='2')
+        with self.assertNumQueries(9):
+            resposta = self.client.get(url)
+        self.assertEqual(len(resposta.context['linhas']), 23)
+
+    def test_post_grava_a_grade(self):
+        self.client.force_login(self.professor)
+        url = reverse('grade_avaliacao', args=[self.turma.id, 'PORT']) + f'?c={self.competencia.id}'
+
+        self.client.post(url, {f'nivel_2_{self.competencia.id}': '5'})
+
+        self.assertEqual(Avaliacao.objects.get(relatorio__aluno=self.novo).nivel, '5')
+
+
+class GestaoEscolarTests(TestCase):
+    def setUp(self):
+        self.coordenador = CustomUser.objects.create_user('coord', password='x', role='COORDENADOR')
+        self.client.force_login(self.coordenador)
+        self.cadastrar(30)
+
+    def cadastrar(self, qtd):
+        inicio = Aluno.objects.count()
+        for i in range(inicio, inicio + qtd):
+            turma = Turma.objects.create(nome=f'T{i:03d}', serie_curricular='1', ano_letivo=2025)
+            Aluno.objects.create(matricula=i + 1, nome_completo=f'Aluno {i:03d}', turma=turma)
+            prof = CustomUser.objects.create(username=f'prof{i}', role='PROFESSOR', first_name=f'P{i:03d}')
+            prof.turmas.add(turma)
+
+    def test_abas_paginadas_com_consultas_constantes(self):
+        url = reverse('gestao_escolar')
+        with self.assertNumQueries(12):
+            resposta = self.client.get(url, {'pagina_alunos': '2'})
+        self.assertEqual(len(resposta.context['alunos']), 5)
+        self.assertEqual((len(resposta.context['turmas']), len(resposta.context['professores'])), (25, 25))
+
+        self.cadastrar(60)
+        with self.assertNumQueries(12):
+            resposta = self.client.get(url, {'pagina_alunos': '2'})
+        self.assertEqual(resposta.context['alunos'].paginator.count, 90)
+        self.assertEqual(resposta.context['alunos'][0].nome_completo, 'Aluno 025')
+
+    def test_filtros_da_aba_de_alunos(self):
+        turma = Turma.objects.get(nome='T007')
+
+        resposta = self.client.get(reverse('gestao_escolar'), {'turma': str(turma.id), 'tab': 'alunos'})
+        self.assertEqual([a.nome_completo for a in resposta.context['alunos']], ['Aluno 007'])
+
+        resposta = self.client.get(reverse('gestao_escolar'), {'q_aluno': '12'})
+        self.assertEqual([a.pk for a in resposta.context['alunos']], [12])
+
+    def test_formulario_de_edicao_sob_demanda(self):
+        aluno = Aluno.objects.get(matricula=1)
+
+        resposta = self.client.get(reverse('gestao_form_edicao', args=['aluno', aluno.pk]))
+        self.assertContains(resposta, 'Aluno 000')
+        self.assertEqual(self.client.get(reverse('gestao_form_edicao', args=['outro', 1])).status_code, 404)
+
+
+class PerfilExecucaoTests(SimpleTestCase):
+    SCRIPT = """
+import json
+from django.conf import settings
+print(json.dumps({
+    'debug': settings.DEBUG,
+    'cache': settings.CACHES['default']['BACKEND'].rsplit('.', 1)[-1],
+    'sessao': settings.SESSION_ENGINE.rsplit('.', 1)[-1],
+    'conexao': settings.DATABASES['default'].get('CONN_MAX_AGE', 0),
+    'transacao': settings.DATABASES['default'].get('OPTIONS', {}).get('transaction_mode'),
+    'templates_em_cache': 'loaders' in settings.TEMPLATES[0]['OPTIONS'],
+    'aviso_dev': 'core.middleware.AvisoPerfilDevMiddleware' in settings.MIDDLEWARE,
+}))
+"""
+
+    def carregar(self, perfil):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'core.settings', 'SMARTWORKFLOW_PERFIL': perfil}
+        saida = subprocess.run([sys.executable, '-c', self.SCRIPT], capture_output=True, text=True, check=True, env=env)
+        return json.loads(saida.stdout.strip().splitlines()[-1])
+
+    def test_perfil_selecionado_pelo_ambiente(self):
+        self.assertEqual(self.carregar('producao'), {
+            'debug': False, 'cache': 'FileBasedCache', 'sessao': 'cache', 'conexao': 600,
+            'transacao': 'IMMEDIATE', 'templates_em_cache': True, 'aviso_dev': False,
+        })
+        self.assertEqual(self.carregar('dev'), {
+            'debug': True, 'cache': 'LocMemCache', 'sessao': 'db', 'conexao': 0,
+            'transacao': None, 'templates_em_cache': False, 'aviso_dev': True,
+        })
+
+    @override_settings(DEBUG=True)
+    def test_perfil_dev_avisa_uma_vez_sob_carga(self):
+        middleware = AvisoPerfilDevMiddleware(lambda request: 'ok')
+
+        with self.assertLogs('academic', level='WARNING') as logs:
+            for _ in range(AvisoPerfilDevMiddleware.limite_requisicoes * 2):
+                middleware(None)
+        self.assertEqual(len(logs.records), 1)
+
+
+class FluxoRelatoriosTests(DadosRelatorioMixin, TestCase):
+    def setUp(self):
+        self.criar_dados()
+        self.client.force_login(self.coordenador)
+
+    def test_cada_mudanca_de_status_registra_uma_transicao(self):
+        alterar_status_relatorio(self.relatorio, 'ANALISE', self.professor)
+        self.client.post(reverse('decisao_relatorio', args=[self.relatorio.id]),
+                         {'acao': 'corrigir', 'motivo_devolucao': 'Revisar LP01.', 'versao': self.relatorio.versao})
+
+        self.relatorio.refresh_from_db()
+        self.assertEqual((self.relatorio.status, self.relatorio.feedback_coordenacao), ('CORRECAO', 'Revisar LP01.'))
+        self.assertEqual(
+            list(TransicaoRelatorio.objects.order_by('id').values_list('de_status', 'para_status', 'usuario')),
+            [('RASCUNHO', 'ANALISE', self.professor.id), ('ANALISE', 'CORRECAO', self.coordenador.id)],
+        )
+
+    def test_metricas_de_vazao_e_espera(self):
+        agora = timezone.now()
+        alterar_status_relatorio(self.relatorio, 'ANALISE', self.professor)
+        alterar_status_relatorio(self.relatorio, 'CORRECAO', self.coordenador)
+        alterar_status_relatorio(self.relatorio, 'ANALISE', self.professor)
+        alterar_status_relatorio(self.relatorio, 'APROVADO', self.coordenador)
+        # Envios há 10h e 4h; decisões há 6h e agora
+        for transicao, horas in zip(TransicaoRelatorio.objects.order_by('id'), [10, 6, 4, 0]):
+            TransicaoRelatorio.objects.filter(pk=transicao.pk).update(data_hora=agora - timedelta(hours=horas))
+
+        metricas = metricas_fluxo_relatorios(2025, '1')
+
+        self.assertEqual(metricas['totais'], {'enviados': 2, 'aprovados': 1, 'devolvidos': 1})
+        self.assertEqual((metricas['espera']['qtd'], metricas['espera']['maximo']), (2, 4.0))
+        self.assertAlmostEqual(metricas['espera']['media'], 4.0)
+        self.assertEqual(metricas['fila'], [])
+
+    def test_metricas_ignoram_periodo_invalido(self):
+        resposta = self.client.get(reverse('metricas_fluxo'), {'ano': '20x5', 'tri': 'abc', 'dias': 'x'})
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(
+            (resposta.context['ano_selecionado'], resposta.context['tri_selecionado'], resposta.context['dias']),
+            ('2025', '1', 30),
+        )
+
+    def test_aprovacao_fixa_as_sugestoes_da_tela_e_do_pdf(self):
+        textos = ['Leitura compartilhada em roda', 'Jogo de rimas com cartas', 'Reescrita de contos conhecidos',
+                  'Caça-palavras temático', 'Diário de leitura semanal', 'Dramatização de fábulas']
+        sugestoes = [
+            SugestaoAtividade.objects.create(
+                titulo=texto, descricao=texto, nivel_alvo='4', status='APROVADO',
+                competencia=self.avaliacao.competencia, professor_autor=self.professor,
+            )
+            for texto in textos[:3]
+        ]
+        Avaliacao.objects.filter(pk=self.avaliacao.pk).update(nivel='4')
+        alterar_status_relatorio(self.relatorio, 'ANALISE', self.professor)
+        aprovar_relatorio(self.relatorio, self.coordenador)
+        fixadas = set(self.avaliacao.sugestoes_escolhidas.all())
+        self.assertEqual(len(fixadas), 2)
+        self.assertLessEqual(fixadas, set(sugestoes))
+
+        # Novas sugestões aprovadas depois não mudam o que o relatório aprovado mostra
+        for texto in textos[3:]:
+            SugestaoAtividade.objects.create(
+                titulo=texto, descricao=texto, nivel_alvo='4', status='APROVADO',
+                competencia=self.avaliacao.competencia, professor_autor=self.professor,
+            )
+
+        for _ in range(3):
+            resposta = self.client.get(reverse('visualizar_relatorio', args=[self.relatorio.id]))
+            self.assertEqual(set(resposta.context['sugestoes_map'][self.avaliacao.id]), fixadas)
+
+        requisicao = RequestFactory().get('/')
+        requisicao.user = self.coordenador
+        with mock.patch('academic.views.render_to_pdf', return_value=HttpResponse()) as render_pdf:
+            baixar_relatorio_pdf(requisicao, self.relatorio.id)
+        contexto = render_pdf.call_args.args[1]
+        self.assertEqual(set(contexto['sugestoes_map'][self.avaliacao.id]), fixadas)
+
+
+class VersaoOtimistaTests(DadosRelatorioMixin, TestCase):
+    def setUp(self):
+        self.criar_dados()
+
+    def test_decisao_sobre_versao_antiga_e_recusada(self):
+        versao_vista = self.relatorio.versao
+        salvar_avaliacoes_com_versao(self.relatorio, {self.avaliacao.id: (self.avaliacao.versao, '4', '')})
+
+        with self.assertRaises(ConflitoVersao):
+            alterar_status_relatorio(self.relatorio, 'APROVADO', self.coordenador, versao_vista)
+
+        self.relatorio.refresh_from_db()
+        self.assertEqual(self.relatorio.status, 'RASCUNHO')
+        self.assertFalse(TransicaoRelatorio.objects.exists())
+
+    def test_salvar_apos_envio_nao_grava(self):
+        alterar_status_relatorio(self.relatorio, 'ANALISE', self.professor)
+
+        with self.assertRaises(ConflitoVersao):
+            salvar_avaliacoes_com_versao(self.relatorio, {self.avaliacao.id: (self.avaliacao.versao, '2', '')})
+
+        self.avaliacao.refresh_from_db()
+        self.assertIsNone(self.avaliacao.nivel)
+
+    def test_avaliacao_editada_em_outra_tela_volta_como_conflito(self):
+        versao_lida = self.avaliacao.versao
+        salvar_avaliacoes_com_versao(self.relatorio, {self.avaliacao.id: (versao_lida, '3', 'primeira')})
+
+        gravados, conflitos = salvar_avaliacoes_com_versao(
+            self.relatorio, {self.avaliacao.id: (versao_lida, '5', 'segunda')}
+        )
+
+        self.assertEqual((gravados, conflitos), ([], [self.avaliacao.id]))
+        self.avaliacao.refresh_from_db()
+        self.assertEqual((self.avaliacao.nivel, self.avaliacao.observacao_especifica), ('3', 'primeira'))
+
+    def test_acoes_da_tela_conferem_a_versao_exibida(self):
+        Competencia.objects.create(codigo='EF01LP02', componente='PORT', anos_aplicacao='1', habilidade='Escrever.')
+        self.client.force_login(self.professor)
+        url = reverse('avaliar_materia', args=[self.relatorio.id, 'PORT'])
+        versao_vista = self.relatorio.versao
+        # Outra tela grava no relatório depois que esta foi aberta
+        salvar_avaliacoes_com_versao(self.relatorio, {self.avaliacao.id: (self.avaliacao.versao, '4', '')})
+
+        for dados in [
+            {'btn_adicionar': '', 'termo_busca': 'EF01LP02'},
+            {'btn_adicionar_todas': ''},
+            {'btn_excluir': self.avaliacao.id},
+        ]:
+            resposta = self.client.post(url, {'versao': versao_vista, **dados})
+            self.assertRedirects(resposta, url, fetch_redirect_response=False)
+        self.client.post(
+            reverse('limpar_materia', args=[self.relatorio.id, 'PORT']), {'versao': versao_vista}
+        )
+        self.assertEqual(list(self.relatorio.avaliacoes.values_list('competencia__codigo', flat=True)), ['EF01LP01'])
+
+        self.relatorio.refresh_from_db()
+        self.client.post(url, {'versao': self.relatorio.versao, 'btn_adicionar': '', 'termo_busca': 'EF01LP02'})
+        self.assertEqual(self.relatorio.avaliacoes.count(), 2)
+        self.relatorio.refresh_from_db()
+        self.client.post(reverse('limpar_materia', args=[self.relatorio.id, 'PORT']), {'versao': self.relatorio.versao})
+        self.assertFalse(self.relatorio.avaliacoes.exists())
+
+
+    def test_versao_que_nao_e_numero_e_conflito(self):
+        alterar_status_relatorio(self.relatorio, 'ANALISE', self.professor)
+        self.client.force_login(self.coordenador)
+
+        resposta = self.client.post(
+            reverse('decisao_relatorio', args=[self.relatorio.id]), {'acao': 'aprovar', 'versao': 'abc'}
+        )
+
+        self.assertRedirects(
+            resposta, reverse('visualizar_relatorio', args=[self.relatorio.id]), fetch_redirect_response=False
+        )
+        self.relatorio.refresh_from_db()
+        self.assertEqual(self.relatorio.status, 'ANALISE')
+
+    def test_versao_da_avaliacao_que_nao_e_numero_e_conflito_da_linha(self):
+        self.client.force_login(self.professor)
+        url = reverse('avaliar_materia', args=[self.relatorio.id, 'PORT'])
+        cid = self.avaliacao.competencia_id
+
+        resposta = self.client.post(url, {'btn_salvar': '', f'versao_{cid}': 'abc', f'nivel_{cid}': '4'})
+
+        self.assertRedirects(resposta, url, fetch_redirect_response=False)
+        self.avaliacao.refresh_from_db()
+        self.assertIsNone(self.avaliacao.nivel)
+
+
+class InclusaoEmLoteTests(DadosRelatorioMixin, TestCase):
+    def setUp(self):
+        self.criar_dados()
+        for codigo, anos in [('EF01LP05', '1, 2'), ('EF12LP01', '1,2'), ('EF02LP01', '2'), ('EF35LP01', '3, 4, 5')]:
+            Competencia.objects.create(codigo=codigo, componente='PORT', anos_aplicacao=anos, habilidade='Ler.')
+        self.client.force_login(self.professor)
+        self.url = reverse('avaliar_materia', args=[self.relatorio.id, 'PORT'])
+
+    def codigos(self, relatorio):
+        return sorted(relatorio.avaliacoes.values_list('competencia__codigo', flat=True))
+
+    def test_lote_ignora_as_ja_presentes_em_um_insert(self):
+        ids = list(Competencia.objects.filter(componente='PORT').values_list('id', flat=True))
+
+        # count antes, INSERT único, count depois
+        with self.assertNumQueries(3):
+            self.assertEqual(adicionar_avaliacoes_em_lote(self.relatorio, ids), 4)
+        self.assertEqual(self.relatorio.avaliacoes.count(), 5)
+
+    def test_adicionar_todas_da_serie(self):
+        self.client.post(self.url, {'btn_adicionar_todas': ''})
+
+        self.assertEqual(self.codigos(self.relatorio), ['EF01LP01', 'EF01LP05', 'EF12LP01'])
+
+    def test_preset_salvo_e_aplicado_em_outro_relatorio(self):
+        self.client.post(self.url, {'btn_adicionar_todas': ''})
+        self.client.post(self.url, {'btn_salvar_preset': '', 'nome_preset': '1º ano básico'})
+        preset = PresetCompetencias.objects.get(professor=self.professor, nome='1º ano básico')
+        self.assertEqual(preset.competencias.count(), 3)
+
+        colega = Aluno.objects.create(matricula=2, nome_completo='Colega', turma=self.relatorio.aluno.turma)
+        outro = Relatorio.objects.create(aluno=colega, professor=self.professor, ano=2025, trimestre='1')
+        self.client.post(
+            reverse('avaliar_materia', args=[outro.id, 'PORT']), {'btn_aplicar_preset': '', 'preset_id': preset.id}
+        )
+        self.assertEqual(self.codigos(outro), ['EF01LP01', 'EF01LP05', 'EF12LP01'])
+
+        # Preset de outro professor não é aplicado
+        intruso = CustomUser.objects.create_user('prof2', password='x', role='PROFESSOR')
+        self.client.force_login(intruso)
+        resposta = self.client.post(self.url, {'btn_aplicar_preset': '', 'preset_id': preset.id})
+        self.assertEqual(resposta.status_code, 404)
+
+
+class ClonagemAvaliacoesTests(DadosRelatorioMixin, TestCase):
+    def setUp(self):
+        self.criar_dados()
+        self.avaliacao.nivel = '4'
+        self.avaliacao.save()
+        self.aluno = self.relatorio.aluno
+
+    def test_clone_grava_versao_inicial(self):
+        novo = Relatorio.objects.create(aluno=self.aluno, professor=self.professor, ano=2025, trimestre='2')
+
+        self.assertEqual(clonar_avaliacoes_anteriores(2025, '2', aluno=self.aluno), 1)
+
+        copia = Avaliacao.objects.get(relatorio=novo)
+        self.assertEqual(copia.versao, 1)
+        # A cópia entra no controle otimista como qualquer outra avaliação
+        salvas, conflitos = salvar_avaliacoes_com_versao(novo, {copia.pk: ('1', '3', '')})
+        self.assertEqual((salvas, conflitos), ([copia.pk], []))
+
+    def test_clone_com_e_sem_niveis(self):
+        self.avaliacao.observacao_especifica = 'Lê com fluência.'
+        self.avaliacao.save()
+        novo = Relatorio.objects.create(aluno=self.aluno, professor=self.professor, ano=2025, trimestre='2')
+
+        clonar_avaliacoes_anteriores(2025, '2', aluno=self.aluno)
+        copia = Avaliacao.objects.get(relatorio=novo)
+        self.assertEqual((copia.competencia_id, copia.nivel, copia.observacao_especifica),
+                         (self.avaliacao.competencia_id, None, ''))
+
+        copia.delete()
+        clonar_avaliacoes_anteriores(2025, '2', com_niveis=True, aluno=self.aluno)
+        copia = Avaliacao.objects.get(relatorio=novo)
+        self.assertEqual((copia.nivel, copia.observacao_especifica), ('4', ''))
+
+    def test_clone_ignora_competencias_ja_presentes(self):
+        outra = Competencia.objects.create(codigo='EF01LP02', componente='PORT', anos_aplicacao='1', habilidade='Escrever.')
+        Avaliacao.objects.create(relatorio=self.relatorio, competencia=outra, nivel='2')
+        novo = Relatorio.objects.create(aluno=self.aluno, professor=self.professor, ano=2025, trimestre='2')
+        Avaliacao.objects.create(relatorio=novo, competencia=self.avaliacao.competencia, nivel='5')
+
+        self.assertEqual(clonar_avaliacoes_anteriores(2025, '2', com_niveis=True, aluno=self.aluno), 1)
+        self.assertEqual(
+            dict(Avaliacao.objects.filter(relatorio=novo).values_list('competencia__codigo', 'nivel')),
+            {'EF01LP01': '5', 'EF01LP02': '2'},
+        )
+        # Segunda execução: nada novo a copiar
+        self.assertEqual(clonar_avaliacoes_anteriores(2025, '2', aluno=self.aluno), 0)
+
+    def test_clone_nao_altera_relatorio_fora_de_edicao(self):
+        Relatorio.objects.create(aluno=self.aluno, professor=self.professor, ano=2025, trimestre='2', status='ANALISE')
+
+        self.assertEqual(clonar_avaliacoes_anteriores(2025, '2', aluno=self.aluno), 0)
+
+    def test_clone_da_turma_cria_relatorios_do_professor(self):
+        turma = self.aluno.turma
+        colega = Aluno.objects.create(matricula=2, nome_completo='Colega', turma=turma)
+        antigo = Relatorio.objects.create(aluno=colega, professor=self.coordenador, ano=2025, trimestre='1')
+        Avaliacao.objects.create(relatorio=antigo, competencia=self.avaliacao.competencia, nivel='3')
+        outro = CustomUser.objects.create_user('prof2', password='x', role='PROFESSOR')
+        # Sem avaliações no 1º trimestre: não ganha um rascunho vazio
+        Aluno.objects.create(matricula=3, nome_completo='Sem Avaliações', turma=turma)
+
+        self.assertEqual(clonar_trimestre_anterior_turma(turma, 2025, '2', outro), 2)
+
+        novos = Relatorio.objects.filter(ano=2025, trimestre='2')
+        self.assertEqual(set(novos.values_list('aluno_id', 'professor_id', 'status')),
+                         {(self.aluno.pk, outro.pk, 'RASCUNHO'), (colega.pk, outro.pk, 'RASCUNHO')})
+        self.assertEqual(Avaliacao.objects.filter(relatorio__in=novos, nivel__isnull=True).count(), 2)
+
+    def test_view_do_aluno_clona_no_periodo_ativo(self):
+        ConfiguracaoSistema.objects.create(ano_letivo=2025, trimestre_ativo='2')
+        self.addCleanup(cache.clear)
+        self.client.force_login(self.professor)
+
+        resposta = self.client.post(reverse('clonar_trimestre_anterior', args=[self.aluno.pk]), {'com_niveis': '1'})
+
+        self.assertRedirects(resposta, reverse('avaliar_aluno', args=[self.aluno.pk]), fetch_redirect_response=False)
+        novo = Relatorio.objects.get(aluno=self.aluno, ano=2025, trimestre='2')
+        self.assertEqual(list(novo.avaliacoes.values_list('nivel', flat=True)), ['4'])
+
+    def test_view_do_aluno_sem_nada_a_copiar_nao_cria_relatorio(self):
+        ConfiguracaoSistema.objects.create(ano_letivo=2025, trimestre_ativo='2')
+        self.addCleanup(cache.clear)
+        self.client.force_login(self.professor)
+        novato = Aluno.objects.create(matricula=3, nome_completo='Novato', turma=self.aluno.turma)
+
+        self.client.post(reverse('clonar_trimestre_anterior', args=[novato.pk]))
+
+        self.assertFalse(Relatorio.objects.filter(aluno=novato).exists())
+
+
+class ConcorrenciaRelatorioTests(DadosRelatorioMixin, TransactionTestCase):
+    THREADS = 8
+
+    def setUp(self):
+        self.criar_dados()
+
+    def test_decisoes_simultaneas_apenas_uma_vence(self):
+        Relatorio.objects.filter(pk=self.relatorio.pk).update(status='ANALISE')
+
+        def decidir(i):
+            status = 'APROVADO' if i % 2 else 'CORRECAO'
+            try:
+                _com_retentativa(lambda: alterar_status_relatorio(
+                    Relatorio.objects.get(pk=self.relatorio.pk), status, self.coordenador, versao=1
+                ))
+                return status
+            except ConflitoVersao:
+                return None
+
+        vencedores = [r for r in _em_threads(self.THREADS, decidir) if r]
+
+        self.assertEqual(len(vencedores), 1)
+        self.relatorio.refresh_from_db()
+        self.assertEqual(self.relatorio.status, vencedores[0])
+        self.assertEqual(self.relatorio.versao, 2)
+        self.assertEqual(TransicaoRelatorio.objects.count(), 1)
+
+    def test_salvamentos_simultaneos_nao_perdem_escrita(self):
+        gravacoes_por_thread = 5
+
+        def tentar_gravar(i):
+            atual = Avaliacao.objects.get(pk=self.avaliacao.pk)
+            texto = atual.observacao_especifica + str(i)
+            gravados, _ = salvar_avaliacoes_com_versao(self.relatorio, {atual.id: (atual.versao, None, texto)})
+            return gravados
+
+        def editar(i):
+            for _ in range(gravacoes_por_thread):
+                while not _com_retentativa(lambda: tentar_gravar(i)):
+                    pass
+
+        _em_threads(self.THREADS, editar)
+
+        self.avaliacao.refresh_from_db()
+        total = self.THREADS * gravacoes_por_thread
+        self.assertEqual(len(self.avaliacao.observacao_especifica), total)
+        self.assertEqual(self.avaliacao.versao, 1 + total)
+        for i in range(self.THREADS):
+            self.assertEqual(self.avaliacao.observacao_especifica.count(str(i)), gravacoes_por_thread)
+
+    def test_primeira_gravacao_simultanea_cria_um_relatorio(self):
+        novato = Aluno.objects.create(matricula=2, nome_completo='Novato', turma=self.relatorio.aluno.turma)
+
+        ids = _em_threads(self.THREADS, lambda i: _com_retentativa(
+            lambda: obter_relatorio_para_escrita(novato, 2025, '2', self.professor).pk
+        ))
+
+        self.assertEqual(len(set(ids)), 1)
+        self.assertEqual(Relatorio.objects.filter(aluno=novato).count(), 1)
+
+
+class RelatorioSobDemandaTests(DadosRelatorioMixin, TestCase):
+    def setUp(self):
+        self.criar_dados()
+        self.novato = Aluno.objects.create(matricula=2, nome_completo='Novato', turma=self.relatorio.aluno.turma)
+        self.client.force_login(self.professor)
+
+    def test_relatorio_virtual_nao_grava_nada(self):
+        with self.assertNumQueries(0):
+            virtual = relatorio_virtual(self.novato, 2025, '1', self.professor)
+
+        self.assertIsNone(virtual.pk)
+        self.assertEqual(
+            (virtual.status, virtual.versao, virtual.turma_id, virtual.professor),
+            ('RASCUNHO', 1, self.novato.turma_id, self.professor),
+        )
+
+    def test_telas_de_consulta_nao_criam_relatorio(self):
+        resposta = self.client.get(reverse('avaliar_aluno', args=[self.novato.pk]))
+        self.assertIsNone(resposta.context['relatorio'].pk)
+
+        resposta = self.client.get(reverse('iniciar_materia', args=[self.novato.pk, 'PORT']))
+        self.assertIsNone(resposta.context['relatorio'].pk)
+
+        self.assertFalse(Relatorio.objects.filter(aluno=self.novato).exists())
+
+    def test_iniciar_materia_cria_um_unico_relatorio(self):
+        url = reverse('iniciar_materia', args=[self.novato.pk, 'PORT'])
+
+        self.client.post(url, {'versao': '1', 'btn_adicionar': '', 'termo_busca': 'EF01LP01'})
+        self.client.post(url, {'btn_adicionar_todas': ''})
+
+        relatorio = Relatorio.objects.get(aluno=self.novato)
+        self.assertEqual((relatorio.ano, relatorio.trimestre, relatorio.professor), (2025, '1', self.professor))
+        self.assertEqual(relatorio.avaliacoes.count(), 1)
+
+
+class AdminConsultasTests(TestCase):
+    """O número de consultas de cada página do admin não pode crescer com o número de linhas."""
+    PAGINAS = [
+        'admin:academic_turma_changelist',
+        'admin:academic_aluno_changelist',
+        'admin:academic_relatorio_changelist',
+        'admin:academic_avaliacao_changelist',
+        'admin:academic_sugestaoatividade_changelist',
+    ]
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser('admin', 'admin@escola.br', 'x')
+        self.client.force_login(self.admin)
+        self.criados = 0
+
+    def criar_linhas(self, qtd):
+        for _ in range(qtd):
+            i = self.criados = self.criados + 1
+            professor = CustomUser.objects.create_user(f'prof{i}', password='x', role='PROFESSOR')
+            turma = Turma.objects.create(nome=f'T{i}', serie_curricular='1', ano_letivo=2025)
+            turma.professores.add(professor)
+            aluno = Aluno.objects.create(matricula=i, nome_completo=f'Aluno {i}', turma=turma)
+            competencia = Competencia.objects.create(
+                codigo=f'EF01LP{i:03d}', componente='PORT', anos_aplicacao='1', habilidade='Ler.'
+            )
+            SugestaoAtividade.objects.create(
+                titulo=f'Sugestão {i}', descricao='.', nivel_alvo='3', status='APROVADO',
+                competencia=competencia, professor_autor=professor,
+            )
+            relatorio = Relatorio.objects.create(aluno=aluno, professor=professor, ano=2025, trimestre='1')
+            Avaliacao.objects.create(relatorio=relatorio, competencia=competencia, nivel='3')
+        return relatorio
+
+    def contar_consultas(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        return len(ctx)
+
+    def test_listagens_com_consultas_constantes(self):
+        self.criar_linhas(2)
+        for pagina in self.PAGINAS:
+            self.contar_consultas(reverse(pagina))  # aquece caches de processo (ContentType etc.)
+        poucas = {pagina: self.contar_consultas(reverse(pagina)) for pagina in self.PAGINAS}
+        self.criar_linhas(20)
+        for pagina in self.PAGINAS:
+            with self.subTest(pagina=pagina):
+                muitas = self.contar_consultas(reverse(pagina))
+                self.assertEqual(muitas, poucas[pagina])
+                self.assertLessEqual(muitas, 12)
+
+    def test_edicao_do_relatorio_com_inline_constante(self):
+        relatorio = self.criar_linhas(1)
+        url = reverse('admin:academic_relatorio_change', args=[relatorio.pk])
+        self.contar_consultas(url)  # aquece caches de processo (ContentType etc.)
+        poucas = self.contar_consultas(url)
+
+        outras = [
+            Competencia.objects.create(codigo=f'EF01MA{i:03d}', componente='MAT', anos_aplicacao='1', habilidade='.')
+            for i in range(15)
+        ]
+        Avaliacao.objects.bulk_create([Avaliacao(relatorio=relatorio, competencia=c) for c in outras])
+
+        self.assertEqual(self.contar_consultas(url), poucas)
+
+
+class CatalogoCompetenciasTests(DadosRelatorioMixin, TestCase):
+    def setUp(self):
+        self.criar_dados()
+        Competencia.objects.filter(codigo='EF01LP01').update(
+            habilidade='Ler ' * 200, or_pedagogicas='Orientações longas.', desc_saeb='D1'
+        )
+        self.client.force_login(self.coordenador)
+
+    def test_listagem_nao_le_as_colunas_longas(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resposta = self.client.get(reverse('gestao_competencias'))
+
+        self.assertEqual(resposta.status_code, 200)
+        consultas = [q['sql'] for q in ctx.captured_queries if '"academic_competencia"' in q['sql']]
+        self.assertTrue(consultas)
+        for sql in consultas:
+            for campo in CAMPOS_DETALHE_COMPETENCIA:
+                self.assertNotIn(f'"{campo}"', sql)
+            # A habilidade só entra cortada (SUBSTR), nunca a coluna inteira
+            self.assertEqual(sql.count('"habilidade"'), sql.upper().count('SUBSTR('))
+
+    def test_detalhe_carrega_os_campos_pedagogicos(self):
+        competencia = Competencia.objects.get(codigo='EF01LP01')
+
+        resposta = self.client.get(reverse('competencia_detalhe', args=[competencia.id]))
+
+        self.assertContains(resposta, 'Orientações longas.')
+        self.assertContains(resposta, 'D1')
+        self.assertEqual(resposta.context['comp'].habilidade, 'Ler ' * 200)
+
+
+class ReplicaLeituraTests(SimpleTestCase):
+    def setUp(self):
+        self.roteador = RoteadorReplica()
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.pasta = pasta.name
+
+    def banco_da_view(self):
+        rotas = {}
+
+        @usar_replica
+        def view(request):
+            rotas['leitura'] = self.roteador.db_for_read(Relatorio)
+            rotas['escrita'] = self.roteador.db_for_write(Relatorio)
+
+        view(RequestFactory().get('/'))
+        return rotas
+
+    def test_fora_das_views_marcadas_tudo_vai_ao_primario(self):
+        self.assertEqual(self.roteador.db_for_read(Relatorio), 'default')
+        self.assertTrue(self.roteador.allow_migrate('default', 'academic'))
+        self.assertFalse(self.roteador.allow_migrate('replica', 'academic'))
+
+    def test_view_marcada_le_da_replica_e_grava_no_primario(self):
+        replica = os.path.join(self.pasta, 'replica.sqlite3')
+        open(replica, 'w').close()
+        with override_settings(REPLICA_DB=replica):
+            self.assertEqual(self.banco_da_view(), {'leitura': 'replica', 'escrita': 'default'})
+        self.assertEqual(self.roteador.db_for_read(Relatorio), 'default')
+
+    def test_sem_copia_da_replica_a_leitura_fica_no_primario(self):
+        with override_settings(REPLICA_DB=os.path.join(self.pasta, 'inexistente.sqlite3')):
+            self.assertEqual(self.banco_da_view()['leitura'], 'default')
+
+    def test_atualizar_replica_copia_o_banco(self):
+        origem = os.path.join(self.pasta, 'origem.sqlite3')
+        destino = os.path.join(self.pasta, 'replica.sqlite3')
+        with sqlite3.connect(origem) as banco:
+            banco.execute('CREATE TABLE t (x INTEGER)')
+            banco.executemany('INSERT INTO t VALUES (?)', [(i,) for i in range(100)])
+
+        atualizar_replica(origem, destino)
+
+        copia = sqlite3.connect(destino)
+        self.addCleanup(copia.close)
+        self.assertEqual(copia.execute('SELECT COUNT(*), SUM(x) FROM t').fetchone(), (100, 4950))
+
+
+class ArquivamentoTests(DadosRelatorioMixin, TestCase):
+    databases = {'default', 'arquivo'}
+
+    def setUp(self):
+        cache.delete('anos_arquivados')
+        self.addCleanup(cache.delete, 'anos_arquivados')
+        self.addCleanup(cache.delete, 'configuracao_sistema')
+        self.criar_dados()
+        ConfiguracaoSistema.objects.create(ano_letivo=2027, trimestre_ativo='1')
+        SugestaoAtividade.objects.create(
+            titulo='Leitura', descricao='.', nivel_alvo='4', status='APROVADO',
+            competencia=self.avaliacao.competencia, professor_autor=self.professor,
+        )
+        Avaliacao.objects.filter(pk=self.avaliacao.pk).update(nivel='4')
+        alterar_status_relatorio(self.relatorio, 'ANALISE', self.professor)
+        aprovar_relatorio(self.relatorio, self.coordenador)
+        # Ano seguinte, ainda no banco principal: regressão de 4 para 2
+        seguinte = Relatorio.objects.create(aluno=self.relatorio.aluno, professor=self.professor, ano=2026, trimestre='1')
+        Avaliacao.objects.create(relatorio=seguinte, competencia=self.avaliacao.competencia, nivel='2')
+        reconstruir_consolidados()
+
+    def arquivar(self, ano):
+        with self.captureOnCommitCallbacks(execute=True):
+            return executar_arquivamento(planejar_arquivamento(ano))
+
+    def test_ano_recente_nao_pode_ser_arquivado(self):
+        self.assertIsNotNone(planejar_arquivamento(2026)['bloqueio'])
+        self.assertIsNone(planejar_arquivamento(2025)['bloqueio'])
+
+    def test_ano_sai_do_principal_e_continua_consultavel(self):
+        evolucao_antes = evolucao_longitudinal(relatorio__aluno=self.relatorio.aluno)
+
+        resultado = self.arquivar(2025)
+
+        self.assertEqual((resultado['qtd_relatorios'], resultado['qtd_avaliacoes'], resultado['qtd_ligacoes']), (1, 1, 1))
+        self.assertFalse(Relatorio.objects.filter(ano=2025).exists())
+        self.assertFalse(Avaliacao.objects.filter(relatorio__ano=2025).exists())
+        self.assertEqual(Relatorio.objects.using('arquivo').get().pk, self.relatorio.pk)
+        self.assertFalse(CustomUser.objects.using('arquivo').get(pk=self.professor.pk).has_usable_password())
+        self.assertEqual(planejar_arquivamento(2025)['bloqueio'], 'O ano 2025 já está arquivado.')
+
+        # Evolução, histórico e visualização leem o arquivo sem mudar o resultado
+        self.assertEqual(evolucao_longitudinal(relatorio__aluno=self.relatorio.aluno), evolucao_antes)
+        self.assertEqual(evolucao_antes[1][0]['regressoes'], 1)
+
+        self.client.force_login(self.coordenador)
+        resposta = self.client.get(reverse('historico_coordenacao'), {'ano': 2025})
+        self.assertEqual([r.pk for r in resposta.context['relatorios']], [self.relatorio.pk])
+        self.assertIn(2025, resposta.context['anos_disponiveis'])
+        resposta = self.client.get(reverse('visualizar_relatorio', args=[self.relatorio.pk]))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.context['sugestoes_map'][self.avaliacao.pk]), 1)
+
+    def test_reconstrucao_preserva_consolidados_arquivados(self):
+        self.arquivar(2025)
+
+        reconstruir_consolidados()
+        self.assertTrue(ConsolidadoCompetencia.objects.filter(ano=2025).exists())
+        reconstruir_consolidados(2025)
+        self.assertEqual(ConsolidadoCompetencia.objects.get(ano=2025).qtd_nivel_4, 1)
+
+
+class SnapshotTests(DadosRelatorioMixin, TestCase):
+    def setUp(self):
+        self.criar_dados()
+        alterar_status_relatorio(self.relatorio, 'ANALISE', self.professor)
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.caminho = os.path.join(pasta.name, 'snapshot.jsonl.gz')
+
+    def estado(self):
+        return (
+            list(Relatorio.objects.values_list('id', 'status', 'versao', 'data_atualizacao')),
+            list(Avaliacao.objects.values_list('id', 'nivel', 'observacao_especifica')),
+            list(TransicaoRelatorio.objects.values_list('id', 'para_status', 'data_hora')),
+            list(CustomUser.objects.values_list('id', 'username', 'password')),
+        )
+
+    def test_restauracao_devolve_exatamente_o_que_foi_exportado(self):
+        original = self.estado()
+        exportar_snapshot(self.caminho)
+
+        Avaliacao.objects.update(nivel='5', observacao_especifica='depois do backup')
+        TransicaoRelatorio.objects.all().delete()
+
+        with self.assertRaises(ErroSnapshot):
+            restaurar_snapshot(self.caminho)
+        restaurar_snapshot(self.caminho, substituir=True)
+
+        self.assertEqual(self.estado(), original)
+
+    def test_arquivo_adulterado_nao_altera_nada(self):
+        exportar_snapshot(self.caminho)
+        with gzip.open(self.caminho, 'rt', encoding='utf-8') as entrada:
+            conteudo = entrada.read()
+        with gzip.open(self.caminho, 'wt', encoding='utf-8') as saida:
+            saida.write(conteudo.replace('"Aluno Teste"', '"Aluno Trocado"'))
+        Avaliacao.objects.update(nivel='2')
+        antes = self.estado()
+
+        with self.assertRaisesMessage(ErroSnapshot, 'academic.Aluno'):
+            restaurar_snapshot(self.caminho, substituir=True)
+
+        self.assertEqual(self.estado(), antes)
+
+
+class TesteCargaTests(SimpleTestCase):
+    """
+    Execução mínima do 'teste_carga' num processo novo: o comando troca o banco
+    da conexão por uma cópia em arquivo, o que não combina com o banco de testes
+    em memória. A escola temporária dá ao processo bancos próprios e descartáveis.
+    """
+    SCRIPT = """
+import django
+django.setup()
+from django.core.management import call_command
+call_command('migrar_escolas', verbosity=0)
+call_command('teste_carga', professores=1, coordenadores=1, alunos=2, competencias=1,
+             salvamentos=1, devolucao=0, duracao=60, semente=1)
+"""
+
+    def test_carga_minima_resume_as_rotas(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            arquivo_escolas = os.path.join(pasta, 'escolas.json')
+            with open(arquivo_escolas, 'w', encoding='utf-8') as arquivo:
+                json.dump([{'slug': 'carga', 'dominios': ['carga.test']}], arquivo)
+            env = {
+                **os.environ, 'DJANGO_SETTINGS_MODULE': 'core.settings', 'SMARTWORKFLOW_ESCOLA': 'carga',
+                'SMARTWORKFLOW_ESCOLAS': arquivo_escolas, 'SMARTWORKFLOW_ESCOLAS_DIR': pasta,
+            }
+            saida = subprocess.run(
+                [sys.executable, '-c', self.SCRIPT], capture_output=True, text=True, check=True, env=env
+            ).stdout
+
+        self.assertIn('Relatórios ao final (2): APROVADO: 2', saida)
+        for rota in ('POST avaliar_materia', 'POST enviar_relatorio_final', 'POST decisao_relatorio'):
+            self.assertRegex(saida, rf'{rota} +\d+ ')
+        self.assertRegex(saida, r'TOTAL: \d+ requisições .*, 0 erros, 0 erros de banco travado')
+
+
+class OrcamentoInicializacaoTests(SimpleTestCase):
+    """
+    Custo de subir um worker, medido pelo comando 'medir_inicializacao' num
+    processo novo. A pilha de PDF fora da inicialização é verificada à risca;
+    tempo e memória só com margem larga, porque dependem da máquina. O
+    orçamento rígido (0,75s / 75 MB) é o padrão do comando.
+    """
+
+    SCRIPT = """
+import json, sys
+import django
+django.setup()
+import academic.utils, academic.views
+print(json.dumps(sorted({nome.split('.')[0] for nome in sys.modules} & set(%r))))
+"""
+
+    def test_views_e_utils_nao_importam_a_pilha_de_pdf(self):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'core.settings'}
+        saida = subprocess.run(
+            [sys.executable, '-c', self.SCRIPT % (MODULOS_SOB_DEMANDA,)],
+            capture_output=True, text=True, check=True, env=env,
+        )
+        self.assertEqual(json.loads(saida.stdout.strip().splitlines()[-1]), [])
+
+    def test_pdf_fica_fora_da_inicializacao(self):
+        saida = StringIO()
+        call_command('medir_inicializacao', '--orcamento-segundos', '5', '--orcamento-mb', '200', stdout=saida)
+        self.assertIn('DENTRO DO ORÇAMENTO', saida.getvalue())
+
+    def test_comando_falha_acima_do_orcamento(self):
+        with self.assertRaisesMessage(CommandError, 'Fora do orçamento'):
+            call_command('medir_inicializacao', '--execucoes', '1', '--orcamento-segundos', '0', stdout=StringIO())
+
+
+class MetricasTests(DadosRelatorioMixin, TestCase):
+    def setUp(self):
+        self.criar_dados()
+        cache.delete('metricas_relatorios_por_status')
+        self.addCleanup(cache.delete, 'metricas_relatorios_por_status')
+
+    def raspar(self, **extra):
+        return self.client.get(reverse('metricas'), REMOTE_ADDR='127.0.0.1', **extra)
+
+    def test_expoe_latencia_por_view_e_relatorios_por_status(self):
+        self.client.force_login(self.coordenador)
+        self.client.get(reverse('dashboard'))
+
+        resposta = self.raspar()
+
+        self.assertEqual(resposta['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        texto = resposta.content.decode()
+        self.assertIn('smartworkflow_requisicao_segundos_bucket{view="dashboard",metodo="GET",status="2xx",le="+Inf"}', texto)
+        self.assertIn('smartworkflow_requisicao_consultas_count{view="dashboard"}', texto)
+        self.assertIn('smartworkflow_relatorios{ano="2025",trimestre="1",status="RASCUNHO"} 1', texto)
+
+    def test_contagem_de_status_vem_do_cache(self):
+        self.raspar()
+        Relatorio.objects.filter(pk=self.relatorio.pk).update(status='ANALISE')
+
+        with CaptureQueriesContext(connection) as ctx:
+            texto = self.raspar().content.decode()
+
+        self.assertFalse([q for q in ctx.captured_queries if 'academic_relatorio' in q['sql']])
+        self.assertIn('status="RASCUNHO"} 1', texto)
+        self.assertIn('smartworkflow_fila_analise 0', texto)
+
+    def consolidacoes_medidas(self):
+        serie = 'smartworkflow_consolidacao_segundos_count '
+        linhas = [l for l in self.raspar().content.decode().splitlines() if l.startswith(serie)]
+        return int(linhas[0].split()[-1]) if linhas else 0
+
+    def test_consolidacao_apos_commit_e_medida(self):
+        antes = self.consolidacoes_medidas()
+        with self.captureOnCommitCallbacks(execute=True):
+            Avaliacao.objects.get(pk=self.avaliacao.pk).save()
+
+        self.assertEqual(self.consolidacoes_medidas(), antes + 1)
+        self.assertTrue(ConsolidadoCompetencia.objects.filter(competencia=self.avaliacao.competencia).exists())
+
+    def test_acesso_restrito(self):
+        self.assertEqual(self.client.get(reverse('metricas'), REMOTE_ADDR='10.0.0.5').status_code, 403)
+        with override_settings(METRICAS_TOKEN='segredo'):
+            self.assertEqual(self.raspar().status_code, 403)
+            resposta = self.client.get(
+                reverse('metricas'), REMOTE_ADDR='10.0.0.5', HTTP_AUTHORIZATION='Bearer segredo'
+            )
+            self.assertEqual(resposta.status_code, 200)
+
+
+class BuscaNomeTests(DadosRelatorioMixin, TestCase):
+    def setUp(self):
+        self.criar_dados()
+        turma = Turma.objects.get()
+        self.joao = Aluno.objects.create(matricula=2, nome_completo='João da Silva', turma=turma)
+        Aluno.objects.create(matricula=3, nome_completo='Maria Conceição', turma=turma)
+
+    def buscar(self, termo):
+        return set(Aluno.objects.filter(filtro_busca_nome(termo)).values_list('nome_completo', flat=True))
+
+    def test_chave_mantida_no_save(self):
+        self.assertEqual(self.joao.nome_busca, 'joao da silva')
+        self.joao.nome_completo = 'João D’Ávila'
+        self.joao.save(update_fields=['nome_completo'])
+        self.joao.refresh_from_db()
+        self.assertEqual(self.joao.nome_busca, 'joao d avila')
+
+        self.professor.first_name = 'Inês'
+        self.professor.save()
+        self.assertEqual(CustomUser.objects.get(pk=self.professor.pk).nome_busca, 'ines prof')
+
+    def test_busca_ignora_acentos_e_casa_inicio_das_palavras(self):
+        self.assertEqual(self.buscar('JOAO sil'), {'João da Silva'})
+        self.assertEqual(self.buscar('conceicao'), {'Maria Conceição'})
+        self.assertEqual(self.buscar('ilva'), set())
+        self.assertEqual(self.buscar('%'), set())
+
+    def test_prefixo_usa_indice(self):
+        sql, params = Aluno.objects.filter(nome_busca__startswith='joao').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plano = ' '.join(str(linha[-1]) for linha in cursor.fetchall())
+        self.assertIn('USING INDEX', plano)
+        self.assertIn('nome_busca', plano)
+
+    def test_historico_da_coordenacao_busca_sem_acentos(self):
+        Relatorio.objects.create(aluno=self.joao, professor=self.professor, ano=2025, trimestre='1')
+        self.client.force_login(self.coordenador)
+
+        resposta = self.client.get(reverse('historico_coordenacao'), {'q': 'joão'})
+
+        self.assertEqual([r.aluno_id for r in resposta.context['relatorios']], [self.joao.pk])
+
+
+# Os dois bancos de teste fazem o papel dos bancos de duas escolas
+ESCOLAS_TESTE = [
+    {'slug': 'norte', 'nome': 'EM Norte', 'dominios': ['norte.test'], 'banco': 'default', 'banco_arquivo': 'arquivo'},
+    {'slug': 'sul', 'nome': 'EM Sul', 'dominios': ['sul.test'], 'banco': 'arquivo', 'banco_arquivo': 'default'},
+]
+
+
+@override_settings(ESCOLAS=ESCOLAS_TESTE, ALLOWED_HOSTS=['norte.test', 'sul.test', 'outra.test'])
+class EscolasTests(TestCase):
+    databases = {'default', 'arquivo'}
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.coordenadores = {}
+        for slug, ano in (('norte', 2030), ('sul', 2031)):
+            with na_escola(escola_por_slug(slug)):
+                ConfiguracaoSistema.objects.create(ano_letivo=ano, trimestre_ativo='2')
+                self.coordenadores[slug] = CustomUser.objects.create_user(
+                    'coord', password='x', role='ADMINISTRADOR'
+                )
+                turma = Turma.objects.create(nome=f'Turma {slug}', serie_curricular='1', ano_letivo=ano)
+                Aluno.objects.create(matricula=1, nome_completo=f'Aluno {slug}', turma=turma)
+
+    def test_cada_escola_usa_o_proprio_banco(self):
+        self.assertEqual(Aluno.objects.using('default').get().nome_completo, 'Aluno norte')
+        self.assertEqual(Aluno.objects.using('arquivo').get().nome_completo, 'Aluno sul')
+
+    def test_configuracao_e_cache_por_escola(self):
+        for slug, ano in (('norte', 2030), ('sul', 2031)):
+            with na_escola(escola_por_slug(slug)):
+                self.assertEqual(get_periodo_atual(), (ano, '2'))
+
+        with na_escola(escola_por_slug('sul')):
+            ConfiguracaoSistema.objects.update(ano_letivo=2099)
+            # Mudança sem save(): o cache da escola ainda vale
+            self.assertEqual(get_periodo_atual(), (2031, '2'))
+        with na_escola(escola_por_slug('norte')):
+            self.assertEqual(get_periodo_atual(), (2030, '2'))
+
+    def test_dominio_define_a_escola_da_requisicao(self):
+        for slug in ('norte', 'sul'):
+            with na_escola(escola_por_slug(slug)):
+                self.client.force_login(self.coordenadores[slug])
+            resposta = self.client.get(reverse('gestao_escolar'), HTTP_HOST=f'{slug}.test')
+            self.assertEqual(
+                [aluno.nome_completo for aluno in resposta.context['alunos']], [f'Aluno {slug}']
+            )
+
+        self.assertEqual(self.client.get(reverse('gestao_escolar'), HTTP_HOST='outra.test').status_code, 404)
+
+
+class SugestoesSemelhantesTests(DadosRelatorioMixin, TestCase):
+    TEXTO = (
+        'Roda de leitura com cartazes de rimas: cada aluno escolhe uma palavra do poema, '
+        'procura outra que rime no cartaz da turma e lê as duas em voz alta para o grupo.'
+    )
+
+    def setUp(self):
+        self.criar_dados()
+        self.competencia = self.avaliacao.competencia
+
+    def sugerir(self, titulo, descricao, nivel='3', status='PENDENTE'):
+        return SugestaoAtividade.objects.create(
+            titulo=titulo, descricao=descricao, nivel_alvo=nivel, status=status,
+            competencia=self.competencia, professor_autor=self.professor,
+        )
+
+    def test_quase_duplicata_da_mesma_competencia_e_nivel(self):
+        original = self.sugerir('Roda de rimas', self.TEXTO, status='APROVADO')
+        copia = self.sugerir('Roda de rimas!', self.TEXTO.replace('voz alta', 'voz  alta') + ' Adaptado.')
+        self.sugerir('Roda de rimas', self.TEXTO, nivel='4')
+        self.sugerir('Bingo de números', 'Cartela com números até 50; o professor sorteia e os alunos marcam.')
+
+        self.assertEqual([s for s, _ in sugestoes_semelhantes(copia)], [original])
+
+        # Texto reescrito: o índice acompanha a gravação
+        original.descricao = 'Caça ao tesouro com pistas escritas espalhadas pela escola.'
+        original.save()
+        self.assertEqual(sugestoes_semelhantes(copia), [])
+
+    def test_detalhe_mostra_semelhantes(self):
+        original = self.sugerir('Roda de rimas', self.TEXTO, status='APROVADO')
+        copia = self.sugerir('Roda de rimas', self.TEXTO + ' Versão 2.')
+        self.client.force_login(self.coordenador)
+
+        resposta = self.client.get(reverse('detalhe_sugestao', args=[copia.pk]))
+
+        self.assertEqual([s for s, _ in resposta.context['semelhantes']], [original])
+        self.assertContains(resposta, 'Sugestões semelhantes já existentes')
+
+    def test_deduplicacao_em_lote_mantem_a_aprovada(self):
+        pendente = self.sugerir('Roda de rimas', self.TEXTO + ' Versão 2.')
+        aprovada = self.sugerir('Roda de rimas', self.TEXTO, status='APROVADO')
+        outra = self.sugerir('Bingo de números', 'Cartela com números até 50; o professor sorteia e os alunos marcam.')
+        # Sugestão anterior ao índice: o comando indexa antes de agrupar
+        SugestaoAtividade.objects.filter(pk=pendente.pk).update(assinatura='')
+        BandaSugestao.objects.filter(sugestao=pendente).delete()
+
+        call_command('deduplicar_sugestoes', '--confirmar', stdout=StringIO())
+
+        status = dict(SugestaoAtividade.objects.values_list('pk', 'status'))
+        self.assertEqual(
+            (status[aprovada.pk], status[pendente.pk], status[outra.pk]), ('APROVADO', 'REJEITADA', 'PENDENTE')
+        )
+
+
+class RecomendacoesCompetenciasTests(DadosRelatorioMixin, TestCase):
+    def setUp(self):
+        self.criar_dados()
+        self.addCleanup(cache.clear)
+        turma = self.relatorio.aluno.turma
+        comp = self.comp = {'EF01LP01': self.avaliacao.competencia}
+        for codigo, componente in [('EF01LP02', 'PORT'), ('EF01LP03', 'PORT'), ('EF01LP04', 'PORT'), ('EF01MA01', 'MAT')]:
+            comp[codigo] = Competencia.objects.create(
+                codigo=codigo, componente=componente, anos_aplicacao='1', habilidade=f'Habilidade {codigo}.'
+            )
+        # Aluno promovido na virada: o relatório de 2025 conta para o 1º ano
+        turma_2026 = Turma.objects.create(nome='2A', serie_curricular='2', ano_letivo=2026)
+        historico = [
+            (turma, ['EF01LP01', 'EF01LP02', 'EF01MA01']),
+            (turma, ['EF01LP01', 'EF01LP02']),
+            (turma, ['EF01LP03', 'EF01LP04']),
+            (turma_2026, ['EF01LP01', 'EF01LP03']),
+        ]
+        for matricula, (turma_aluno, codigos) in enumerate(historico, start=2):
+            aluno = Aluno.objects.create(matricula=matricula, nome_completo=f'Aluno {matricula}', turma=turma_aluno)
+            relatorio = Relatorio.objects.create(aluno=aluno, professor=self.professor, ano=2025, trimestre='1')
+            for codigo in codigos:
+                Avaliacao.objects.create(relatorio=relatorio, competencia=comp[codigo])
+        call_command('recalcular_recomendacoes', stdout=StringIO())
+
+    def codigos(self, recomendadas):
+        return [c['codigo'] for c in recomendadas]
+
+    def test_recomenda_pela_coocorrencia_e_completa_com_as_populares(self):
+        indice = get_indice_recomendacoes()
+
+        # LP02 saiu com LP01 em 2 de 4 relatórios, LP03 em 1; LP04 entra por popularidade
+        self.assertEqual(
+            self.codigos(indice.recomendar('1', 'PORT', [self.comp['EF01LP01'].id])),
+            ['EF01LP02', 'EF01LP03', 'EF01LP04'],
+        )
+        self.assertEqual(self.codigos(indice.recomendar('1', 'MAT', [])), ['EF01MA01'])
+        self.assertEqual(indice.recomendar('2', 'PORT', []), [])
+        self.assertFalse(CoocorrenciaCompetencia.objects.filter(
+            competencia=self.comp['EF01LP01'], relacionada=self.comp['EF01MA01']
+        ).exists())
+
+    def test_tela_da_materia_nao_consulta_o_historico(self):
+        self.client.force_login(self.professor)
+        url = reverse('avaliar_materia', args=[self.relatorio.id, 'PORT'])
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(url)
+
+        self.assertEqual(self.codigos(resposta.context['recomendadas']), ['EF01LP02', 'EF01LP03', 'EF01LP04'])
+        self.assertContains(resposta, 'Costumam ser avaliadas juntas')
+        self.assertFalse(any('coocorrencia' in q['sql'] for q in consultas.captured_queries))
@@ -1,23 +1,67 @@
+import gzip
+import hashlib
+import json
+import random
+import time
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, time as dtime, timedelta
 from io import BytesIO
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
 from django.http import HttpResponse
 from django.template.loader import get_template
+from django.db import connections, transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Window
+from django.db.models.functions import Lag, TruncDate
 from django.utils import timezone
-from xhtml2pdf import pisa
-from .models import ConfiguracaoSistema
+from core.metricas import CONSOLIDACAO_SEGUNDOS, PDF_BYTES, PDF_SEGUNDOS, registrar_cache
+from core.replica import banco_arquivo, banco_principal
+from .models import (
+    CustomUser, ConfiguracaoSistema, Turma, Aluno, Relatorio, Avaliacao, Competencia,
+    ConsolidadoCompetencia, TransicaoRelatorio, SugestaoAtividade, AnoArquivado, chave_busca,
+    normalizar_texto, BandaSugestao, CoocorrenciaCompetencia
+)
 # ==============================================================================
 # 1. UTILITÁRIOS DE PERÍODO E CONFIGURAÇÃO
 # ==============================================================================
 
+CACHE_CONFIGURACAO = 'configuracao_sistema'
+
+def configuracao_atual():
+    """
+    ConfiguracaoSistema da escola atual (ou None), lida do cache: quase toda
+    tela consulta o período ativo. Cada escola tem a sua (banco e chave de
+    cache próprios); os signals invalidam a cópia a cada gravação.
+    """
+    config = cache.get(CACHE_CONFIGURACAO)
+    registrar_cache('configuracao', config is not None)
+    if config is None:
+        # False em cache: "sem configuração" também é resposta
+        config = ConfiguracaoSistema.objects.first() or False
+        cache.set(CACHE_CONFIGURACAO, config, None)
+    return config or None
+
+def invalidar_configuracao():
+    cache.delete(CACHE_CONFIGURACAO)
+
+def configuracao_para_escrita():
+    """A mesma linha que configuracao_atual() lê (a primeira), criada se ainda não existir."""
+    return ConfiguracaoSistema.objects.first() or ConfiguracaoSistema.objects.create()
+
 def get_periodo_atual():
     """Retorna tupla (ano, trimestre) baseada na configuração ativa."""
-    config = ConfiguracaoSistema.objects.first()
+    config = configuracao_atual()
     if config:
         return config.ano_letivo, config.trimestre_ativo
     return 2025, '1'
 
 def periodo_edicao_aberto():
     """Verifica se a data atual está dentro do prazo de edição."""
-    config = ConfiguracaoSistema.objects.first()
+    config = configuracao_atual()
     if not config or (not config.data_inicio and not config.data_fim):
         return True
     
@@ -35,7 +79,11 @@ def periodo_edicao_aberto():
 def render_to_pdf(template_src, context_dict={}):
     """
     Converte um template HTML do Django em um arquivo PDF.
+    Único ponto de geração de PDF do projeto: o xhtml2pdf (e o reportlab por
+    trás dele) só é importado na primeira chamada, não no início de cada worker.
     """
+    from xhtml2pdf import pisa
+
     # 1. Carrega o template HTML
     template = get_template(template_src)
     
@@ -47,13 +95,1546 @@ def render_to_pdf(template_src, context_dict={}):
     
     # 4. Converte HTML para PDF com codificação UTF-8
     # Usamos o encoding para evitar que acentos fiquem bugados
+    inicio = time.perf_counter()
     pdf = pisa.pisaDocument(BytesIO(html.encode("UTF-8")), result)
+    PDF_SEGUNDOS.observar(time.perf_counter() - inicio)
     
     # 5. Retorna o Response se a geração for bem-sucedida
     if not pdf.err:
+        PDF_BYTES.observar(result.tell())
         response = HttpResponse(result.getvalue(), content_type='application/pdf')
         # Opcional: Força o download em vez de abrir no navegador
         # response['Content-Disposition'] = 'attachment; filename="relatorio.pdf"'
         return response
     
-    return None
\ No newline at end of file
+    return None
+
+# ==============================================================================
+# 3. VIRADA DE ANO LETIVO (CLONAGEM DE TURMAS E PROMOÇÃO DE ALUNOS)
+# ==============================================================================
+
+SERIE_FINAL = Turma.SERIES[-1][0]
+
+def _serie_seguinte(serie):
+    """Retorna a série seguinte ('1' -> '2') ou None para a última série."""
+    if serie == SERIE_FINAL:
+        return None
+    return str(int(serie) + 1)
+
+def planejar_virada_ano(ano_origem=None):
+    """
+    Monta a prévia da virada de ano letivo SEM gravar nada no banco.
+
+    Cada turma do ano de origem é clonada para o ano seguinte (mesmo nome,
+    série, turno e professores). Os alunos de uma turma da série N são
+    promovidos para o clone de uma turma da série N+1, pareando pelo turno e
+    pela ordem alfabética do nome (1º A -> 2º A). Alunos da última série
+    ficam na turma antiga como concluintes.
+    """
+    if ano_origem is None:
+        ano_origem, _ = get_periodo_atual()
+    ano_origem = int(ano_origem)
+    ano_destino = ano_origem + 1
+
+    turmas = list(
+        Turma.objects.filter(ano_letivo=ano_origem)
+        .annotate(qtd_alunos=Count('alunos'))
+        .prefetch_related('professores')
+        .order_by('serie_curricular', 'turno', 'nome')
+    )
+
+    # Agrupa as turmas por (série, turno) para parear origem e destino
+    por_serie_turno = {}
+    por_serie = {}
+    for turma in turmas:
+        por_serie_turno.setdefault((turma.serie_curricular, turma.turno), []).append(turma)
+        por_serie.setdefault(turma.serie_curricular, []).append(turma)
+
+    itens = []
+    total_promovidos = 0
+    total_concluintes = 0
+    total_sem_destino = 0
+
+    for turma in turmas:
+        serie_destino = _serie_seguinte(turma.serie_curricular)
+        destino = None
+
+        if serie_destino:
+            irmas = por_serie_turno[(turma.serie_curricular, turma.turno)]
+            candidatas = por_serie_turno.get((serie_destino, turma.turno)) or por_serie.get(serie_destino, [])
+            if candidatas:
+                posicao = min(irmas.index(turma), len(candidatas) - 1)
+                destino = candidatas[posicao]
+
+        if serie_destino is None:
+            total_concluintes += turma.qtd_alunos
+        elif destino is None:
+            total_sem_destino += turma.qtd_alunos
+        else:
+            total_promovidos += turma.qtd_alunos
+
+        itens.append({
+            'turma': turma,
+            'destino': destino,
+            'concluinte': serie_destino is None,
+            'qtd_alunos': turma.qtd_alunos,
+            'professores': list(turma.professores.all()),
+        })
+
+    bloqueio = None
+    if not turmas:
+        bloqueio = f"Não existem turmas cadastradas em {ano_origem}."
+    elif Turma.objects.filter(ano_letivo=ano_destino).exists():
+        bloqueio = f"Já existem turmas cadastradas em {ano_destino}. A virada já foi executada?"
+
+    # Impressão digital do que a prévia mostra: a confirmação só executa este mesmo plano
+    conteudo = [ano_origem] + [
+        [item['turma'].id, item['destino'].id if item['destino'] else None, item['qtd_alunos'],
+         sorted(prof.id for prof in item['professores'])]
+        for item in itens
+    ]
+    assinatura = hashlib.sha256(json.dumps(conteudo).encode()).hexdigest()
+
+    return {
+        'ano_origem': ano_origem,
+        'ano_destino': ano_destino,
+        'assinatura': assinatura,
+        'itens': itens,
+        'total_turmas': len(turmas),
+        'total_promovidos': total_promovidos,
+        'total_concluintes': total_concluintes,
+        'total_sem_destino': total_sem_destino,
+        'bloqueio': bloqueio,
+    }
+
+def executar_virada_ano(plano):
+    """
+    Aplica um plano gerado por planejar_virada_ano() em uma única transação:
+    cria as turmas em lote, copia os vínculos de professores em lote, move os
+    alunos com um UPDATE por turma e ativa o 1º trimestre do novo ano.
+    """
+    if plano['bloqueio']:
+        raise ValueError(plano['bloqueio'])
+
+    ProfessorTurma = Turma.professores.through
+
+    with transaction.atomic(using=banco_principal()):
+        clones = {}
+        novas_turmas = []
+        for item in plano['itens']:
+            origem = item['turma']
+            nova = Turma(
+                nome=origem.nome,
+                serie_curricular=origem.serie_curricular,
+                ano_letivo=plano['ano_destino'],
+                turno=origem.turno,
+            )
+            clones[origem.id] = nova
+            novas_turmas.append(nova)
+
+        Turma.objects.bulk_create(novas_turmas)
+
+        ProfessorTurma.objects.bulk_create([
+            ProfessorTurma(turma_id=clones[item['turma'].id].id, customuser_id=prof.id)
+            for item in plano['itens']
+            for prof in item['professores']
+        ])
+
+        promovidos = 0
+        for item in plano['itens']:
+            if item['destino'] is None:
+                continue
+            promovidos += Aluno.objects.filter(turma_id=item['turma'].id).update(
+                turma_id=clones[item['destino'].id].id
+            )
+
+        config = configuracao_para_escrita()
+        config.ano_letivo = plano['ano_destino']
+        config.trimestre_ativo = '1'
+        config.data_inicio = None
+        config.data_fim = None
+        config.save()
+
+    return {'turmas_criadas': len(novas_turmas), 'alunos_promovidos': promovidos}
+
+# ==============================================================================
+# 4. CONSOLIDADOS DE COMPETÊNCIA (ROLLUPS PARA A COORDENAÇÃO)
+# ==============================================================================
+
+def _agregados_por_nivel():
+    """Expressões de contagem por nível usadas no recálculo e na reconstrução."""
+    agregados = {
+        f'qtd_nivel_{nivel}': Count('id', filter=Q(nivel=nivel))
+        for nivel, _ in Avaliacao.NIVEIS
+    }
+    agregados['qtd_sem_nivel'] = Count('id', filter=Q(nivel__isnull=True) | Q(nivel=''))
+    return agregados
+
+def chave_consolidado(relatorio_id, competencia_id):
+    """Resolve a chave (ano, trimestre, turma_id, competencia_id) de uma avaliação."""
+    dados = Relatorio.objects.filter(pk=relatorio_id).values_list('ano', 'trimestre', 'turma_id').first()
+    if dados is None:
+        return None
+    return (*dados, competencia_id)
+
+def atualizar_consolidados(chaves):
+    """
+    Recalcula somente as linhas de rollup afetadas. Cada chave cobre uma
+    turma e uma competência, então o recálculo lê poucas dezenas de avaliações.
+    """
+    for ano, trimestre, turma_id, competencia_id in set(chaves):
+        filtro = {'ano': ano, 'trimestre': trimestre, 'turma_id': turma_id, 'competencia_id': competencia_id}
+        dados = Avaliacao.objects.filter(
+            relatorio__ano=ano,
+            relatorio__trimestre=trimestre,
+            relatorio__turma_id=turma_id,
+            competencia_id=competencia_id,
+        ).aggregate(componente=Max('competencia__componente'), **_agregados_por_nivel())
+
+        componente = dados.pop('componente')
+        if componente is None:
+            # Nenhuma avaliação restante para esta chave
+            ConsolidadoCompetencia.objects.filter(**filtro).delete()
+            continue
+
+        ConsolidadoCompetencia.objects.update_or_create(
+            **filtro, defaults={'componente': componente, **dados}
+        )
+
+def chaves_consolidado_relatorio(relatorio, competencia_ids):
+    """Chaves de rollup de várias competências do mesmo relatório (sem consulta por item)."""
+    return [(relatorio.ano, relatorio.trimestre, relatorio.turma_id, cid) for cid in competencia_ids]
+
+def agendar_consolidacao(chaves):
+    """
+    Agenda o recálculo para depois do commit (não roda se houver rollback).
+    Uma falha no recálculo não desfaz nem derruba a gravação já confirmada.
+    """
+    chaves = [chave for chave in chaves if chave]
+    if chaves:
+        def consolidar():
+            inicio = time.perf_counter()
+            atualizar_consolidados(chaves)
+            CONSOLIDACAO_SEGUNDOS.observar(time.perf_counter() - inicio)
+
+        transaction.on_commit(consolidar, using=banco_principal(), robust=True)
+
+def reconstruir_consolidados(ano=None):
+    """
+    Reconstrói a tabela de consolidados a partir das avaliações (GROUP BY único).
+    Sem 'ano', os anos arquivados são preservados; um ano arquivado informado
+    explicitamente é reconstruído a partir do banco de arquivo.
+    """
+    avaliacoes = Avaliacao.objects.all()
+    consolidados = ConsolidadoCompetencia.objects.all()
+    if ano:
+        avaliacoes = Avaliacao.objects.using(banco_do_ano(ano)).filter(relatorio__ano=ano)
+        consolidados = consolidados.filter(ano=ano)
+    else:
+        consolidados = consolidados.exclude(ano__in=anos_arquivados())
+
+    linhas = avaliacoes.values(
+        'relatorio__ano', 'relatorio__trimestre', 'relatorio__turma_id',
+        'competencia_id', 'competencia__componente',
+    ).annotate(**_agregados_por_nivel()).order_by()
+
+    novos = []
+    for linha in linhas.iterator():
+        novos.append(ConsolidadoCompetencia(
+            ano=linha.pop('relatorio__ano'),
+            trimestre=linha.pop('relatorio__trimestre'),
+            turma_id=linha.pop('relatorio__turma_id'),
+            competencia_id=linha.pop('competencia_id'),
+            componente=linha.pop('competencia__componente'),
+            **linha,
+        ))
+
+    with transaction.atomic(using=banco_principal()):
+        consolidados.delete()
+        ConsolidadoCompetencia.objects.bulk_create(novos, batch_size=500)
+
+    return len(novos)
+
+# ==============================================================================
+# 5. EVOLUÇÃO LONGITUDINAL (TODOS OS TRIMESTRES E ANOS)
+# ==============================================================================
+
+def _registros_evolucao(banco, filtros):
+    """Níveis de um banco com o nível do período anterior ao lado (LAG)."""
+    return (
+        Avaliacao.objects.using(banco).filter(**filtros)
+        .exclude(nivel__isnull=True).exclude(nivel='')
+        .annotate(nivel_anterior=Window(
+            Lag('nivel'),
+            partition_by=[F('relatorio__aluno_id'), F('competencia_id')],
+            order_by=[F('relatorio__ano').asc(), F('relatorio__trimestre').asc()],
+        ))
+        .values(
+            'relatorio__aluno', 'relatorio__aluno__nome_completo',
+            'competencia', 'competencia__codigo', 'competencia__componente',
+            'relatorio__ano', 'relatorio__trimestre', 'nivel', 'nivel_anterior',
+        )
+        .order_by('relatorio__aluno__nome_completo', 'competencia__codigo', 'relatorio__ano', 'relatorio__trimestre')
+    )
+
+def evolucao_longitudinal(**filtros):
+    """
+    Retorna (periodos, linhas) com o nível de cada (aluno, competência) em
+    todos os trimestres/anos. Uma única consulta com LAG() por banco traz o
+    nível do período anterior ao lado do atual, o que marca as regressões sem
+    uma consulta por período; o pivot é montado em memória. Anos arquivados
+    (sempre os mais antigos) são lidos antes, e o primeiro nível de cada par
+    no banco principal é comparado com o último do arquivo.
+    """
+    bancos = [banco_arquivo(), None] if anos_arquivados() else [None]
+    ultimo_nivel = {}
+
+    linhas = {}
+    periodos = set()
+    registros = (r for banco in bancos for r in _registros_evolucao(banco, filtros))
+    for r in registros:
+        periodo = (r['relatorio__ano'], r['relatorio__trimestre'])
+        periodos.add(periodo)
+
+        chave = (r['relatorio__aluno'], r['competencia'])
+        anterior = r['nivel_anterior'] or ultimo_nivel.get(chave)
+        ultimo_nivel[chave] = r['nivel']
+
+        linha = linhas.setdefault(chave, {
+            'aluno_pk': r['relatorio__aluno'],
+            'aluno_nome': r['relatorio__aluno__nome_completo'],
+            'codigo': r['competencia__codigo'],
+            'componente': r['competencia__componente'],
+            'niveis': {},
+            'regressoes': 0,
+        })
+
+        regrediu = bool(anterior) and int(r['nivel']) < int(anterior)
+        linha['niveis'][periodo] = {'nivel': r['nivel'], 'regrediu': regrediu}
+        if regrediu:
+            linha['regressoes'] += 1
+
+    periodos = sorted(periodos)
+    for linha in linhas.values():
+        linha['celulas'] = [linha['niveis'].get(periodo) for periodo in periodos]
+
+    linhas = sorted(linhas.values(), key=lambda linha: (linha['aluno_nome'], linha['codigo']))
+    return [{'ano': ano, 'trimestre': tri} for ano, tri in periodos], linhas
+
+# ==============================================================================
+# 6. ÍNDICE DE PREFIXOS DO CATÁLOGO BNCC (AUTOCOMPLETE)
+# ==============================================================================
+
+PALAVRAS_IGNORADAS = {
+    'a', 'o', 'as', 'os', 'e', 'de', 'da', 'do', 'das', 'dos', 'em', 'na', 'no',
+    'nas', 'nos', 'com', 'por', 'para', 'que', 'um', 'uma', 'ao', 'aos', 'entre',
+}
+CHAVE_VERSAO_CATALOGO = 'catalogo_bncc_versao'
+
+def _palavras_chave(texto):
+    palavras = chave_busca(texto).split()
+    return {p for p in palavras if len(p) >= 3 and p not in PALAVRAS_IGNORADAS}
+
+def invalidar_indice_catalogo():
+    """Marca o catálogo como alterado; cada processo reconstrói o índice na próxima busca."""
+    cache.set(CHAVE_VERSAO_CATALOGO, timezone.now().timestamp(), None)
+
+class IndicePrefixosBNCC:
+    """
+    Arrays ordenados de (chave normalizada -> id) por componente. A busca por
+    prefixo é um bisect seguido de varredura contígua, sem tocar no banco.
+    """
+
+    def __init__(self, versao):
+        self.versao = versao
+        self.competencias = {}
+        self.por_componente = {}
+
+        entradas = {}
+        for comp in Competencia.objects.only('id', 'codigo', 'componente', 'anos_aplicacao', 'habilidade'):
+            self.competencias[comp.id] = {
+                'id': comp.id,
+                'codigo': comp.codigo,
+                'habilidade': comp.habilidade,
+                'anos': {ano.strip() for ano in comp.anos_aplicacao.split(',') if ano.strip()},
+            }
+            chaves = _palavras_chave(comp.habilidade)
+            chaves.add(normalizar_texto(comp.codigo))
+            lista = entradas.setdefault(comp.componente, [])
+            lista.extend((chave, comp.id) for chave in chaves)
+
+        for componente, lista in entradas.items():
+            lista.sort()
+            self.por_componente[componente] = ([c for c, _ in lista], [i for _, i in lista])
+
+    def _ids_com_prefixo(self, componente, prefixo):
+        chaves, ids = self.por_componente.get(componente, ([], []))
+        encontrados = set()
+        posicao = bisect_left(chaves, prefixo)
+        while posicao < len(chaves) and chaves[posicao].startswith(prefixo):
+            encontrados.add(ids[posicao])
+            posicao += 1
+        return encontrados
+
+    def buscar(self, termo, componente, serie=None, limite=10):
+        termos = chave_busca(termo).split()
+        if not termos:
+            return []
+
+        # Todos os termos digitados precisam casar (interseção dos prefixos)
+        candidatos = None
+        for t in termos:
+            ids = self._ids_com_prefixo(componente, t)
+            candidatos = ids if candidatos is None else candidatos & ids
+            if not candidatos:
+                return []
+
+        resultados = [self.competencias[i] for i in candidatos]
+        if serie:
+            resultados = [c for c in resultados if str(serie) in c['anos']]
+        resultados.sort(key=lambda c: c['codigo'])
+        return [
+            {'id': c['id'], 'codigo': c['codigo'], 'habilidade': c['habilidade']}
+            for c in resultados[:limite]
+        ]
+
+# Um índice por banco: cada escola tem o próprio catálogo
+_indices_bncc = {}
+
+def get_indice_catalogo():
+    """Retorna o índice em memória, reconstruindo-o se o catálogo mudou."""
+    banco = banco_principal()
+    indice = _indices_bncc.get(banco)
+    versao = cache.get(CHAVE_VERSAO_CATALOGO)
+    reaproveitado = indice is not None and indice.versao == versao
+    registrar_cache('indice_catalogo', reaproveitado)
+    if not reaproveitado:
+        indice = _indices_bncc[banco] = IndicePrefixosBNCC(versao)
+    return indice
+
+# ==============================================================================
+# 7. INCLUSÃO DE COMPETÊNCIAS EM LOTE
+# ==============================================================================
+
+def competencias_da_serie(componente, serie):
+    """Competências do componente cuja lista 'anos_aplicacao' contém a série."""
+    return Competencia.objects.filter(
+        componente=componente,
+        anos_aplicacao__regex=rf'(^|,)\s*{int(serie)}\s*(,|$)',
+    )
+
+def adicionar_avaliacoes_em_lote(relatorio, competencia_ids):
+    """
+    Insere várias avaliações em um único INSERT. Competências já presentes
+    são ignoradas pela restrição única (relatorio, competencia).
+    Retorna quantas avaliações novas foram criadas.
+    """
+    competencia_ids = list(competencia_ids)
+    antes = relatorio.avaliacoes.count()
+    Avaliacao.objects.bulk_create(
+        [Avaliacao(relatorio=relatorio, competencia_id=cid) for cid in competencia_ids],
+        ignore_conflicts=True,
+    )
+    # bulk_create não dispara signals: os consolidados são agendados aqui
+    agendar_consolidacao(chaves_consolidado_relatorio(relatorio, competencia_ids))
+    return relatorio.avaliacoes.count() - antes
+
+# ==============================================================================
+# 8. CLONAGEM DAS AVALIAÇÕES DO TRIMESTRE ANTERIOR
+# ==============================================================================
+
+STATUS_EDITAVEIS = ('RASCUNHO', 'CORRECAO')
+
+def periodo_anterior(ano, trimestre):
+    """(2026, '2') -> (2026, '1'); (2026, '1') -> (2025, '3')."""
+    if str(trimestre) == '1':
+        return int(ano) - 1, '3'
+    return int(ano), str(int(trimestre) - 1)
+
+def clonar_avaliacoes_anteriores(ano, trimestre, com_niveis=False, aluno=None, turma=None):
+    """
+    Copia as avaliações do período anterior para os relatórios editáveis do
+    período (ano, trimestre) com um único INSERT ... SELECT, pareando o
+    relatório antigo e o novo pelo aluno. Competências já presentes são
+    ignoradas pela restrição única. As observações nunca são copiadas e as
+    cópias começam na versão 1 (o default de 'versao' só existe no Python).
+    Informe 'aluno' OU 'turma'. Retorna o número de avaliações inseridas.
+    """
+    ano_ant, tri_ant = periodo_anterior(ano, trimestre)
+    q = connections[banco_principal()].ops.quote_name
+    avaliacao, relatorio = q(Avaliacao._meta.db_table), q(Relatorio._meta.db_table)
+
+    if aluno is not None:
+        filtro_sql, filtro_param = 'antigo.aluno_id = %s', aluno.pk
+        destinos = {'relatorio__aluno': aluno}
+    else:
+        filtro_sql, filtro_param = 'novo.turma_id = %s', turma.pk
+        destinos = {'relatorio__turma': turma}
+
+    sql = f"""
+        INSERT INTO {avaliacao} (relatorio_id, competencia_id, nivel, observacao_especifica, versao)
+        SELECT novo.id, av.competencia_id, {'av.nivel' if com_niveis else 'NULL'}, '', 1
+        FROM {avaliacao} av
+        JOIN {relatorio} antigo ON antigo.id = av.relatorio_id
+        JOIN {relatorio} novo ON novo.aluno_id = antigo.aluno_id
+             AND novo.ano = %s AND novo.trimestre = %s AND novo.status IN (%s, %s)
+        WHERE antigo.ano = %s AND antigo.trimestre = %s AND {filtro_sql}
+        ON CONFLICT DO NOTHING
+    """
+    params = [int(ano), str(trimestre), *STATUS_EDITAVEIS, ano_ant, tri_ant, filtro_param]
+
+    with transaction.atomic(using=banco_principal()):
+        with connections[banco_principal()].cursor() as cursor:
+            cursor.execute(sql, params)
+            inseridas = cursor.rowcount
+
+    # INSERT ... SELECT não dispara signals: agenda os consolidados afetados
+    if inseridas:
+        chaves = Avaliacao.objects.filter(
+            relatorio__ano=ano, relatorio__trimestre=trimestre, **destinos,
+        ).values_list('relatorio__turma_id', 'competencia_id').distinct()
+        agendar_consolidacao([(int(ano), str(trimestre), turma_id, cid) for turma_id, cid in chaves])
+
+    return inseridas
+
+def alunos_com_avaliacoes_anteriores(alunos, ano, trimestre):
+    """Matrículas (de 'alunos') com ao menos uma avaliação no período anterior a (ano, trimestre)."""
+    ano_ant, tri_ant = periodo_anterior(ano, trimestre)
+    return alunos.filter(
+        relatorio__ano=ano_ant, relatorio__trimestre=tri_ant, relatorio__avaliacoes__isnull=False,
+    ).values_list('pk', flat=True).distinct()
+
+def clonar_trimestre_anterior_turma(turma, ano, trimestre, professor, com_niveis=False):
+    """
+    Versão para a turma inteira: cria em lote os relatórios que ainda não
+    existem no período, só para os alunos com algo a copiar, e clona as
+    avaliações de todos eles, tudo na mesma transação.
+    """
+    with transaction.atomic(using=banco_principal()):
+        Relatorio.objects.bulk_create(
+            [
+                Relatorio(aluno_id=pk, turma=turma, ano=ano, trimestre=trimestre, professor=professor, status='RASCUNHO')
+                for pk in alunos_com_avaliacoes_anteriores(turma.alunos.all(), ano, trimestre)
+            ],
+            ignore_conflicts=True,
+        )
+        return clonar_avaliacoes_anteriores(ano, trimestre, com_niveis, turma=turma)
+
+# ==============================================================================
+# 9. GRADE DE AVALIAÇÃO DA TURMA (UPSERT EM LOTE)
+# ==============================================================================
+
+def salvar_grade_avaliacao(turma, ano, trimestre, professor, niveis):
+    """
+    Grava a grade inteira da turma. 'niveis' é um dict {(aluno_pk, competencia_id): nivel}.
+    Em uma transação: cria em lote os relatórios que faltam e faz um único
+    upsert das avaliações (INSERT ... ON CONFLICT (relatorio, competencia) DO UPDATE).
+    Relatórios fora de edição (ANALISE/APROVADO) são ignorados.
+    Retorna (avaliacoes_gravadas, alunos_bloqueados).
+    """
+    alunos_pks = {aluno_pk for aluno_pk, _ in niveis}
+
+    with transaction.atomic(using=banco_principal()):
+        Relatorio.objects.bulk_create(
+            [
+                Relatorio(aluno_id=pk, turma=turma, ano=ano, trimestre=trimestre, professor=professor, status='RASCUNHO')
+                for pk in alunos_pks
+            ],
+            ignore_conflicts=True,
+        )
+        relatorios = dict(
+            Relatorio.objects.filter(aluno_id__in=alunos_pks, ano=ano, trimestre=trimestre)
+            .values_list('aluno_id', 'id')
+        )
+        # Reserva os relatórios editáveis antes de ler: decisões da coordenação
+        # tomadas sobre a versão anterior passam a falhar por conflito.
+        Relatorio.objects.filter(id__in=relatorios.values(), status__in=STATUS_EDITAVEIS).update(
+            versao=F('versao') + 1
+        )
+        editaveis = set(
+            Relatorio.objects.filter(id__in=relatorios.values(), status__in=STATUS_EDITAVEIS)
+            .values_list('aluno_id', flat=True)
+        )
+
+        avaliacoes = [
+            Avaliacao(relatorio_id=relatorios[aluno_pk], competencia_id=comp_id, nivel=nivel)
+            for (aluno_pk, comp_id), nivel in niveis.items()
+            if aluno_pk in editaveis
+        ]
+        Avaliacao.objects.bulk_create(
+            avaliacoes,
+            update_conflicts=True,
+            unique_fields=['relatorio', 'competencia'],
+            update_fields=['nivel'],
+            batch_size=500,
+        )
+        Avaliacao.objects.filter(
+            relatorio_id__in=[relatorios[pk] for pk in editaveis],
+            competencia_id__in={comp_id for _, comp_id in niveis},
+        ).update(versao=F('versao') + 1)
+
+    agendar_consolidacao({(int(ano), str(trimestre), turma.pk, comp_id) for _, comp_id in niveis})
+    return len(avaliacoes), alunos_pks - editaveis
+
+# ==============================================================================
+# 10. TRANSIÇÕES DE STATUS DO RELATÓRIO
+# ==============================================================================
+
+class ConflitoVersao(Exception):
+    """O registro foi alterado por outra pessoa depois de ter sido lido."""
+
+
+def _versao_lida(registro, versao):
+    """
+    Versão informada pelo formulário (padrão: a do registro lido). Um valor que
+    não é número não corresponde a nenhuma versão gravada: é um conflito.
+    """
+    if versao is None:
+        return registro.versao
+    try:
+        return int(versao)
+    except (TypeError, ValueError):
+        raise ConflitoVersao(f"Versão inválida: {versao!r}.") from None
+
+
+@contextmanager
+def relatorio_reservado(relatorio, versao=None):
+    """
+    Abre a transação de uma gravação no relatório reservando-o antes:
+    UPDATE ... WHERE status editável AND versao = n SET versao = versao + 1.
+    'versao' é a que o usuário viu na tela (padrão: a lida nesta requisição).
+    Se o relatório mudou ou saiu de edição, nada é gravado e levanta ConflitoVersao.
+    """
+    versao = _versao_lida(relatorio, versao)
+
+    with transaction.atomic(using=banco_principal()):
+        reservado = Relatorio.objects.filter(pk=relatorio.pk, status__in=STATUS_EDITAVEIS, versao=versao).update(
+            versao=F('versao') + 1, data_atualizacao=timezone.now()
+        )
+        if not reservado:
+            raise ConflitoVersao("O relatório foi alterado ou saiu de edição enquanto você editava.")
+        relatorio.versao = versao + 1
+        yield relatorio
+
+
+def alterar_status_relatorio(relatorio, novo_status, usuario, versao=None, **campos):
+    """
+    Muda o status do relatório (e campos extras, ex: feedback_coordenacao) e
+    registra a transição na mesma transação. 'versao' é a versão que o usuário
+    viu na tela (padrão: a lida nesta requisição); se o relatório mudou desde
+    então, nada é gravado e levanta ConflitoVersao.
+    """
+    versao = _versao_lida(relatorio, versao)
+    de_status = relatorio.status
+
+    with transaction.atomic(using=banco_principal()):
+        alterados = Relatorio.objects.filter(pk=relatorio.pk, versao=versao).update(
+            status=novo_status,
+            versao=F('versao') + 1,
+            data_atualizacao=timezone.now(),
+            **campos,
+        )
+        if not alterados:
+            raise ConflitoVersao(
+                f"O relatório de {relatorio.aluno.nome_completo} foi alterado por outra pessoa."
+            )
+
+        TransicaoRelatorio.objects.create(
+            relatorio=relatorio,
+            ano=relatorio.ano,
+            trimestre=relatorio.trimestre,
+            de_status=de_status,
+            para_status=novo_status,
+            usuario=usuario,
+        )
+
+    relatorio.status = novo_status
+    relatorio.versao = versao + 1
+    for campo, valor in campos.items():
+        setattr(relatorio, campo, valor)
+    return relatorio
+
+
+def salvar_avaliacoes_com_versao(relatorio, alteracoes):
+    """
+    Grava notas e observações de um relatório em edição. 'alteracoes' é um
+    dict {avaliacao_id: (versao_lida, nivel, observacao)}; nivel None mantém o atual.
+    Cada linha só é gravada se ainda estiver na versão lida. O relatório também
+    é reservado (status editável) e tem a versão incrementada, o que invalida
+    decisões da coordenação tomadas sobre a versão anterior.
+    Retorna (ids_gravados, ids_em_conflito).
+    """
+    gravados, conflitos = [], []
+
+    with transaction.atomic(using=banco_principal()):
+        reservado = Relatorio.objects.filter(pk=relatorio.pk, status__in=STATUS_EDITAVEIS).update(
+            versao=F('versao') + 1, data_atualizacao=timezone.now()
+        )
+        if not reservado:
+            raise ConflitoVersao("O relatório saiu de edição enquanto você editava.")
+
+        for av_id, (versao, nivel, observacao) in alteracoes.items():
+            # Versão que não é número nunca bate com a gravada: conflito da linha
+            if not str(versao).isdigit():
+                conflitos.append(av_id)
+                continue
+            campos = {'observacao_especifica': observacao or ''}
+            if nivel:
+                campos['nivel'] = nivel
+            alterados = Avaliacao.objects.filter(pk=av_id, relatorio=relatorio, versao=versao).update(
+                versao=F('versao') + 1, **campos
+            )
+            (gravados if alterados else conflitos).append(av_id)
+
+        # update() não dispara post_save: agenda os rollups explicitamente
+        competencia_ids = Avaliacao.objects.filter(pk__in=gravados).values_list('competencia_id', flat=True)
+        agendar_consolidacao(chaves_consolidado_relatorio(relatorio, competencia_ids))
+
+    return gravados, conflitos
+
+
+CACHE_CONTAGEM_STATUS = 'metricas_relatorios_por_status'
+
+def contagem_relatorios_por_status():
+    """
+    {(ano, trimestre, status): qtd} para o /metrics. Um GROUP BY em cache por
+    um minuto: as raspagens não recontam a tabela a cada vez.
+    """
+    contagem = cache.get(CACHE_CONTAGEM_STATUS)
+    registrar_cache('contagem_status', contagem is not None)
+    if contagem is None:
+        contagem = {
+            (linha['ano'], linha['trimestre'], linha['status']): linha['qtd']
+            for linha in Relatorio.objects.values('ano', 'trimestre', 'status').annotate(qtd=Count('id')).order_by()
+        }
+        cache.set(CACHE_CONTAGEM_STATUS, contagem, 60)
+    return contagem
+
+def _percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return None
+    indice = min(len(valores_ordenados) - 1, int(round(p * (len(valores_ordenados) - 1))))
+    return valores_ordenados[indice]
+
+
+def metricas_fluxo_relatorios(ano, trimestre, dias=30):
+    """
+    Vazão e tempo de espera da análise no período, lidos apenas do histórico
+    de transições (varreduras por faixa no índice ano/trimestre/status/data).
+    """
+    inicio = timezone.now() - timedelta(days=dias)
+    base = TransicaoRelatorio.objects.filter(ano=ano, trimestre=trimestre, data_hora__gte=inicio)
+
+    # 1. Totais e série diária de envios, aprovações e devoluções
+    totais = dict(base.values_list('para_status').annotate(n=Count('id')).order_by())
+    por_dia = {}
+    for linha in (base.annotate(dia=TruncDate('data_hora'))
+                  .values('dia', 'para_status').annotate(n=Count('id')).order_by('dia')):
+        por_dia.setdefault(linha['dia'], {})[linha['para_status']] = linha['n']
+    serie = [
+        {'dia': dia, 'enviados': c.get('ANALISE', 0),
+         'aprovados': c.get('APROVADO', 0), 'devolvidos': c.get('CORRECAO', 0)}
+        for dia, c in por_dia.items()
+    ]
+
+    # 2. Tempo de espera: cada decisão contra o envio imediatamente anterior
+    ultimo_envio = TransicaoRelatorio.objects.filter(
+        relatorio=OuterRef('relatorio'), para_status='ANALISE', data_hora__lte=OuterRef('data_hora'),
+    ).order_by('-data_hora').values('data_hora')[:1]
+    decisoes = (base.filter(para_status__in=['APROVADO', 'CORRECAO'])
+                .annotate(enviado_em=Subquery(ultimo_envio))
+                .values_list('data_hora', 'enviado_em'))
+    esperas = sorted(
+        (decidido - enviado).total_seconds() / 3600
+        for decidido, enviado in decisoes if enviado
+    )
+    espera = {
+        'qtd': len(esperas),
+        'media': sum(esperas) / len(esperas) if esperas else None,
+        'mediana': _percentil(esperas, 0.5),
+        'p90': _percentil(esperas, 0.9),
+        'maximo': esperas[-1] if esperas else None,
+    }
+
+    # 3. Fila atual: relatórios em análise e há quanto tempo aguardam
+    agora = timezone.now()
+    fila = (TransicaoRelatorio.objects
+            .filter(ano=ano, trimestre=trimestre, para_status='ANALISE', relatorio__status='ANALISE')
+            .values('relatorio', 'relatorio__aluno__nome_completo', 'relatorio__professor__first_name',
+                    'relatorio__professor__username')
+            .annotate(enviado_em=Max('data_hora'))
+            .order_by('enviado_em'))
+    fila = [
+        {**item, 'horas': (agora - item['enviado_em']).total_seconds() / 3600}
+        for item in fila
+    ]
+
+    return {
+        'inicio': inicio,
+        'totais': {
+            'enviados': totais.get('ANALISE', 0),
+            'aprovados': totais.get('APROVADO', 0),
+            'devolvidos': totais.get('CORRECAO', 0),
+        },
+        'serie': serie,
+        'espera': espera,
+        'fila': fila,
+    }
+
+# ==============================================================================
+# 11. RELATÓRIO SOB DEMANDA (CRIADO SÓ NA PRIMEIRA GRAVAÇÃO)
+# ==============================================================================
+
+def relatorio_virtual(aluno, ano, trimestre, professor):
+    """
+    Relatório "não iniciado" para exibição: mesmo formato de um rascunho, mas
+    sem gravar nada (pk None). Mantém as telas de consulta somente leitura.
+    """
+    return Relatorio(
+        aluno=aluno, turma_id=aluno.turma_id, ano=ano, trimestre=trimestre, professor=professor, status='RASCUNHO'
+    )
+
+
+def obter_relatorio_para_escrita(aluno, ano, trimestre, professor):
+    """
+    Busca ou cria o relatório no momento da primeira gravação real. A restrição
+    única (aluno, trimestre, ano) decide corridas: quem perde o INSERT relê a
+    linha criada pelo outro, então nunca surgem relatórios duplicados.
+    """
+    relatorio, _ = Relatorio.objects.get_or_create(
+        aluno=aluno, ano=ano, trimestre=trimestre,
+        defaults={'turma_id': aluno.turma_id, 'professor': professor, 'status': 'RASCUNHO'},
+    )
+    return relatorio
+
+# ==============================================================================
+# 12. SUGESTÕES DE ATIVIDADE DO RELATÓRIO (SORTEADAS E FIXADAS NA APROVAÇÃO)
+# ==============================================================================
+
+SUGESTOES_POR_AVALIACAO = 2
+
+def escolher_sugestoes(avaliacoes):
+    """
+    Sorteia até duas sugestões aprovadas compatíveis com a competência e o
+    nível de cada avaliação. Uma única consulta para o relatório inteiro.
+    Retorna {avaliacao_id: [sugestões]}.
+    """
+    avaliacoes = [av for av in avaliacoes if av.nivel]
+    candidatas = {}
+    for sugestao in SugestaoAtividade.objects.filter(
+        status='APROVADO', competencia_id__in={av.competencia_id for av in avaliacoes}
+    ):
+        candidatas.setdefault((sugestao.competencia_id, sugestao.nivel_alvo), []).append(sugestao)
+
+    escolhidas = {}
+    for av in avaliacoes:
+        compativeis = candidatas.get((av.competencia_id, av.nivel))
+        if compativeis:
+            escolhidas[av.id] = _sortear_distintas(compativeis, SUGESTOES_POR_AVALIACAO)
+    return escolhidas
+
+
+def _sortear_distintas(compativeis, qtd):
+    """Sorteia até 'qtd' sugestões, pulando as quase-duplicatas das já sorteadas (seção 16)."""
+    escolhidas, assinaturas = [], []
+    for sugestao in random.sample(compativeis, len(compativeis)):
+        assinatura = _assinatura_de_texto(sugestao.assinatura)
+        if all(semelhanca_assinaturas(assinatura, outra) < LIMIAR_SEMELHANCA for outra in assinaturas):
+            escolhidas.append(sugestao)
+            assinaturas.append(assinatura)
+            if len(escolhidas) == qtd:
+                break
+    return escolhidas
+
+
+def materializar_sugestoes(relatorio):
+    """Grava (substituindo as anteriores) as sugestões sorteadas de cada avaliação."""
+    Ligacao = Avaliacao.sugestoes_escolhidas.through
+    Ligacao.objects.filter(avaliacao__relatorio=relatorio).delete()
+    Ligacao.objects.bulk_create([
+        Ligacao(avaliacao_id=av_id, sugestaoatividade_id=sugestao.id)
+        for av_id, sugestoes in escolher_sugestoes(relatorio.avaliacoes.all()).items()
+        for sugestao in sugestoes
+    ])
+
+
+def aprovar_relatorio(relatorio, usuario, versao=None):
+    """Aprova e fixa as sugestões na mesma transação (ver alterar_status_relatorio)."""
+    with transaction.atomic(using=banco_principal()):
+        alterar_status_relatorio(relatorio, 'APROVADO', usuario, versao, feedback_coordenacao='')
+        materializar_sugestoes(relatorio)
+    return relatorio
+
+
+def sugestoes_do_relatorio(relatorio, avaliacoes):
+    """
+    Relatório aprovado: lê as sugestões fixadas (uma consulta com JOIN), então
+    a tela e o PDF mostram sempre as mesmas. Demais status: prévia sorteada.
+    """
+    if relatorio.status != 'APROVADO':
+        return escolher_sugestoes(avaliacoes)
+
+    Ligacao = Avaliacao.sugestoes_escolhidas.through
+    sugestoes = {}
+    for ligacao in (Ligacao.objects.using(relatorio._state.db).filter(avaliacao__relatorio=relatorio)
+                    .select_related('sugestaoatividade').order_by('id')):
+        sugestoes.setdefault(ligacao.avaliacao_id, []).append(ligacao.sugestaoatividade)
+    return sugestoes
+
+# ==============================================================================
+# 13. ARQUIVAMENTO DE ANOS ENCERRADOS (BANCO FRIO)
+# ==============================================================================
+
+CACHE_ANOS_ARQUIVADOS = 'anos_arquivados'
+LOTE_ARQUIVO = 1000
+
+def anos_arquivados():
+    """Conjunto dos anos já movidos para o arquivo (em cache até o próximo arquivamento)."""
+    anos = cache.get(CACHE_ANOS_ARQUIVADOS)
+    registrar_cache('anos_arquivados', anos is not None)
+    if anos is None:
+        anos = frozenset(AnoArquivado.objects.values_list('ano', flat=True))
+        cache.set(CACHE_ANOS_ARQUIVADOS, anos, None)
+    return anos
+
+def banco_do_ano(ano):
+    """
+    Alias para .using() nas consultas de um ano: o arquivo para anos
+    arquivados; None deixa o roteador decidir (primário ou réplica).
+    """
+    return banco_arquivo() if ano and int(ano) in anos_arquivados() else None
+
+def relatorio_ou_arquivado(relatorio_id):
+    """
+    Busca o relatório no banco principal e, se houver anos arquivados, no
+    arquivo (os ids não se repetem entre os dois). None se não existir.
+    """
+    relatorio = Relatorio.objects.filter(id=relatorio_id).first()
+    if relatorio is None and anos_arquivados():
+        relatorio = Relatorio.objects.using(banco_arquivo()).filter(id=relatorio_id).first()
+    return relatorio
+
+def planejar_arquivamento(ano):
+    """Prévia do arquivamento de um ano letivo, com o motivo de bloqueio (se houver)."""
+    ano_ativo, _ = get_periodo_atual()
+    relatorios = Relatorio.objects.filter(ano=ano)
+    plano = {
+        'ano': ano,
+        'qtd_relatorios': relatorios.count(),
+        'qtd_pendentes': relatorios.exclude(status='APROVADO').count(),
+        'qtd_avaliacoes': Avaliacao.objects.filter(relatorio__ano=ano).count(),
+        'qtd_transicoes': TransicaoRelatorio.objects.filter(relatorio__ano=ano).count(),
+        'bloqueio': None,
+    }
+
+    if ano in anos_arquivados():
+        plano['bloqueio'] = f"O ano {ano} já está arquivado."
+    elif ano >= ano_ativo - 1:
+        # O 1º trimestre do ano ativo clona o 3º do ano anterior (seção 8)
+        plano['bloqueio'] = (
+            f"Só anos anteriores a {ano_ativo - 1} podem ser arquivados: "
+            f"o ano ativo ({ano_ativo}) e o anterior continuam em uso."
+        )
+    elif not plano['qtd_relatorios']:
+        plano['bloqueio'] = f"Nenhum relatório encontrado em {ano}."
+    return plano
+
+def _copiar_para_arquivo(queryset, preparar=None):
+    """Copia as linhas do queryset para o arquivo em lotes; linhas já copiadas são ignoradas."""
+    gerenciador = queryset.model._base_manager.db_manager(banco_arquivo())
+    lote = []
+    for obj in queryset.order_by('pk').iterator(chunk_size=LOTE_ARQUIVO):
+        if preparar:
+            preparar(obj)
+        lote.append(obj)
+        if len(lote) == LOTE_ARQUIVO:
+            gerenciador.bulk_create(lote, ignore_conflicts=True)
+            lote = []
+    gerenciador.bulk_create(lote, ignore_conflicts=True)
+
+def executar_arquivamento(plano):
+    """
+    Move o ano para o banco de arquivo em duas etapas:
+    1. Copia (transação no arquivo) relatórios, avaliações, sugestões fixadas e
+       transições, junto com as linhas que elas referenciam (usuários sem
+       senha, turmas, alunos, competências e sugestões).
+    2. Confere as contagens e só então apaga do banco principal, com DELETEs
+       diretos (sem signals: os consolidados do ano continuam valendo).
+    Rodar de novo após uma falha é seguro: linhas já copiadas são ignoradas.
+    """
+    ano = plano['ano']
+    arquivo = banco_arquivo()
+    Ligacao = Avaliacao.sugestoes_escolhidas.through
+    relatorios = Relatorio.objects.filter(ano=ano)
+    avaliacoes = Avaliacao.objects.filter(relatorio__ano=ano)
+    ligacoes = Ligacao.objects.filter(avaliacao__relatorio__ano=ano)
+    transicoes = TransicaoRelatorio.objects.filter(relatorio__ano=ano)
+
+    sugestao_ids = ligacoes.values('sugestaoatividade_id')
+    aluno_ids = relatorios.values('aluno_id')
+    usuario_ids = (
+        set(relatorios.values_list('professor_id', flat=True).distinct())
+        | set(transicoes.exclude(usuario=None).values_list('usuario_id', flat=True).distinct())
+        | set(SugestaoAtividade.objects.filter(id__in=sugestao_ids)
+              .exclude(professor_autor=None).values_list('professor_autor_id', flat=True))
+    )
+
+    with transaction.atomic(using=arquivo):
+        _copiar_para_arquivo(
+            CustomUser.objects.filter(id__in=usuario_ids), preparar=CustomUser.set_unusable_password
+        )
+        _copiar_para_arquivo(Turma.objects.filter(
+            Q(id__in=Aluno.objects.filter(pk__in=aluno_ids).values('turma_id'))
+            | Q(id__in=relatorios.values('turma_id'))
+        ))
+        _copiar_para_arquivo(Aluno.objects.filter(pk__in=aluno_ids))
+        _copiar_para_arquivo(Competencia.objects.filter(
+            Q(id__in=avaliacoes.values('competencia_id'))
+            | Q(id__in=SugestaoAtividade.objects.filter(id__in=sugestao_ids).values('competencia_id'))
+        ))
+        _copiar_para_arquivo(SugestaoAtividade.objects.filter(id__in=sugestao_ids))
+        _copiar_para_arquivo(relatorios)
+        _copiar_para_arquivo(avaliacoes)
+        _copiar_para_arquivo(ligacoes)
+        _copiar_para_arquivo(transicoes)
+
+    contagens = {
+        'qtd_relatorios': (relatorios, Relatorio.objects.using(arquivo).filter(ano=ano)),
+        'qtd_avaliacoes': (avaliacoes, Avaliacao.objects.using(arquivo).filter(relatorio__ano=ano)),
+        'qtd_ligacoes': (ligacoes, Ligacao.objects.using(arquivo).filter(avaliacao__relatorio__ano=ano)),
+        'qtd_transicoes': (transicoes, TransicaoRelatorio.objects.using(arquivo).filter(relatorio__ano=ano)),
+    }
+    resultado = {}
+    for chave, (principal, copiados) in contagens.items():
+        resultado[chave] = principal.count()
+        if copiados.count() != resultado[chave]:
+            raise RuntimeError(
+                f"Cópia de {ano} para o arquivo incompleta ({chave}); nada foi apagado do banco principal."
+            )
+
+    q = connections[banco_principal()].ops.quote_name
+    ligacao_tb, avaliacao_tb, transicao_tb, relatorio_tb = (
+        q(Ligacao._meta.db_table), q(Avaliacao._meta.db_table),
+        q(TransicaoRelatorio._meta.db_table), q(Relatorio._meta.db_table),
+    )
+    do_ano = f"SELECT id FROM {relatorio_tb} WHERE ano = %s"
+    with transaction.atomic(using=banco_principal()):
+        with connections[banco_principal()].cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {ligacao_tb} WHERE avaliacao_id IN "
+                f"(SELECT id FROM {avaliacao_tb} WHERE relatorio_id IN ({do_ano}))", [ano]
+            )
+            cursor.execute(f"DELETE FROM {avaliacao_tb} WHERE relatorio_id IN ({do_ano})", [ano])
+            cursor.execute(f"DELETE FROM {transicao_tb} WHERE relatorio_id IN ({do_ano})", [ano])
+            cursor.execute(f"DELETE FROM {relatorio_tb} WHERE ano = %s", [ano])
+        AnoArquivado.objects.create(
+            ano=ano, qtd_relatorios=resultado['qtd_relatorios'], qtd_avaliacoes=resultado['qtd_avaliacoes']
+        )
+        transaction.on_commit(lambda: cache.delete(CACHE_ANOS_ARQUIVADOS), using=banco_principal())
+
+    return resultado
+
+# ==============================================================================
+# 14. SNAPSHOT DO BANCO (BACKUP E RESTAURAÇÃO EM STREAMING)
+# ==============================================================================
+
+FORMATO_SNAPSHOT = 'smartworkflow-snapshot'
+VERSAO_SNAPSHOT = 1
+LOTE_SNAPSHOT = 2000
+
+class ErroSnapshot(Exception):
+    """Arquivo de snapshot inválido, corrompido ou incompatível com o esquema atual."""
+
+def modelos_snapshot():
+    """
+    Modelos do app e suas tabelas M2M automáticas, em ordem de dependência
+    (tabelas referenciadas antes das que as referenciam).
+    """
+    modelos = list(apps.get_app_config('academic').get_models())
+    for modelo in list(modelos):
+        for campo in modelo._meta.local_many_to_many:
+            through = campo.remote_field.through
+            # M2M com tabelas de fora do app (grupos e permissões do auth) ficam de fora
+            if through._meta.auto_created and campo.related_model in modelos:
+                modelos.append(through)
+
+    ordenados, pendentes = [], modelos
+    while pendentes:
+        for modelo in pendentes:
+            dependencias = {
+                campo.related_model for campo in modelo._meta.concrete_fields
+                if campo.is_relation and campo.related_model in modelos and campo.related_model is not modelo
+            }
+            if dependencias.issubset(ordenados):
+                ordenados.append(modelo)
+                pendentes = [m for m in pendentes if m is not modelo]
+                break
+        else:
+            raise ErroSnapshot('Dependência circular entre os modelos do snapshot.')
+    return ordenados
+
+class _CodificadorSnapshot(DjangoJSONEncoder):
+    """Como o do Django, mas sem truncar os microssegundos (a restauração é exata)."""
+    def default(self, o):
+        if isinstance(o, (datetime, dtime)):
+            return o.isoformat()
+        return super().default(o)
+
+def _linha_json(valores):
+    return json.dumps(valores, cls=_CodificadorSnapshot, ensure_ascii=False, separators=(',', ':'))
+
+def exportar_snapshot(caminho, using=None):
+    """
+    Grava o banco em JSONL compactado (gzip): um cabeçalho, e por modelo a
+    lista de colunas, uma linha por registro (tupla de valores crus, sem
+    instanciar objetos) e um rodapé com a contagem e o SHA-256 das linhas.
+    Tudo é lido dentro de uma única transação (mesmo instante do banco).
+    Sem 'using', usa o banco principal da escola atual. Retorna {modelo: linhas}.
+    """
+    using = using or banco_principal()
+    modelos = modelos_snapshot()
+    resumo = {}
+    with gzip.open(caminho, 'wt', encoding='utf-8', compresslevel=6) as saida, transaction.atomic(using=using):
+        saida.write(_linha_json({
+            'formato': FORMATO_SNAPSHOT,
+            'versao': VERSAO_SNAPSHOT,
+            'criado_em': timezone.now(),
+            'modelos': [modelo._meta.label for modelo in modelos],
+        }) + '\n')
+
+        for modelo in modelos:
+            campos = [campo.attname for campo in modelo._meta.concrete_fields]
+            saida.write(_linha_json({'modelo': modelo._meta.label, 'campos': campos}) + '\n')
+
+            soma, qtd = hashlib.sha256(), 0
+            linhas = modelo._base_manager.using(using).order_by('pk').values_list(*campos)
+            for valores in linhas.iterator(chunk_size=LOTE_SNAPSHOT):
+                texto = _linha_json(valores)
+                soma.update(texto.encode())
+                saida.write(texto + '\n')
+                qtd += 1
+
+            saida.write(_linha_json({'fim': modelo._meta.label, 'linhas': qtd, 'sha256': soma.hexdigest()}) + '\n')
+            resumo[modelo._meta.label] = qtd
+    return resumo
+
+def restaurar_snapshot(caminho, substituir=False, using=None):
+    """
+    Restaura um snapshot numa única transação: INSERTs em lote (executemany)
+    na ordem de dependência, com os valores gravados no arquivo (inclusive
+    ids e datas automáticas). O banco precisa estar vazio, a não ser com
+    'substituir', que apaga os dados atuais antes. Contagem ou checksum
+    divergente desfaz tudo (ErroSnapshot). Retorna {modelo: linhas}.
+    """
+    using = using or banco_principal()
+    ordem = modelos_snapshot()
+    por_rotulo = {modelo._meta.label: modelo for modelo in ordem}
+    conexao = connections[using]
+    q = conexao.ops.quote_name
+    resumo = {}
+
+    with gzip.open(caminho, 'rt', encoding='utf-8') as entrada, transaction.atomic(using=using):
+        try:
+            cabecalho = json.loads(next(entrada))
+        except (OSError, StopIteration, ValueError):
+            raise ErroSnapshot('Arquivo vazio ou que não é um snapshot.')
+        if cabecalho.get('formato') != FORMATO_SNAPSHOT or cabecalho.get('versao') != VERSAO_SNAPSHOT:
+            raise ErroSnapshot('Formato de snapshot desconhecido.')
+        desconhecidos = set(cabecalho['modelos']) - set(por_rotulo)
+        if desconhecidos:
+            raise ErroSnapshot(f"Modelos inexistentes neste esquema: {', '.join(sorted(desconhecidos))}.")
+
+        with conexao.cursor() as cursor:
+            if substituir:
+                # DELETE direto, das tabelas dependentes para as referenciadas (sem
+                # signals). Linhas de fora do snapshot que apontam para estas tabelas
+                # (log do admin, grupos dos usuários) não teriam mais a quem apontar.
+                externos = [
+                    modelo for modelo in apps.get_models(include_auto_created=True)
+                    if modelo not in ordem and any(
+                        campo.is_relation and campo.related_model in ordem
+                        for campo in modelo._meta.concrete_fields
+                    )
+                ]
+                for modelo in externos + ordem[::-1]:
+                    cursor.execute(f"DELETE FROM {q(modelo._meta.db_table)}")
+            elif any(modelo._base_manager.using(using).exists() for modelo in ordem):
+                raise ErroSnapshot('O banco de destino já tem dados; use a opção de substituir.')
+
+            for linha in entrada:
+                secao = json.loads(linha)
+                modelo = por_rotulo[secao['modelo']]
+                colunas = {campo.attname: campo for campo in modelo._meta.concrete_fields}
+                if set(secao['campos']) != set(colunas):
+                    raise ErroSnapshot(f"As colunas de {secao['modelo']} não conferem com o esquema atual.")
+                campos = [colunas[nome] for nome in secao['campos']]
+
+                sql = "INSERT INTO {} ({}) VALUES ({})".format(
+                    q(modelo._meta.db_table),
+                    ', '.join(q(campo.column) for campo in campos),
+                    ', '.join(['%s'] * len(campos)),
+                )
+                soma, qtd, lote, rodape = hashlib.sha256(), 0, [], None
+                for linha in entrada:
+                    if linha.startswith('{'):
+                        rodape = json.loads(linha)
+                        break
+                    texto = linha.rstrip('\n')
+                    soma.update(texto.encode())
+                    lote.append([
+                        campo.get_db_prep_save(campo.to_python(valor), conexao)
+                        for campo, valor in zip(campos, json.loads(texto))
+                    ])
+                    qtd += 1
+                    if len(lote) == LOTE_SNAPSHOT:
+                        cursor.executemany(sql, lote)
+                        lote = []
+                if lote:
+                    cursor.executemany(sql, lote)
+
+                if rodape is None or (rodape['linhas'], rodape['sha256']) != (qtd, soma.hexdigest()):
+                    raise ErroSnapshot(f"Contagem ou checksum de {secao['modelo']} não confere; nada foi restaurado.")
+                resumo[secao['modelo']] = qtd
+
+            # Sequências de ids (no-op no SQLite, necessário em outros bancos)
+            for sql in conexao.ops.sequence_reset_sql(no_style(), ordem):
+                cursor.execute(sql)
+
+        # Caches derivados do banco antigo
+        transaction.on_commit(
+            lambda: (cache.delete(CACHE_ANOS_ARQUIVADOS), invalidar_indice_catalogo(), invalidar_configuracao()),
+            using=using,
+        )
+
+    return resumo
+
+# ==============================================================================
+# 15. BUSCA DE ALUNOS E PROFESSORES SEM ACENTOS
+# ==============================================================================
+def filtro_busca_nome(termo, campo='nome_busca'):
+    """
+    Q que casa 'joao sil' com 'João da Silva': cada palavra digitada, sem
+    acentos, precisa iniciar uma palavra do nome. Quando ela inicia o nome, o
+    LIKE 'joao%' vira uma busca por faixa no índice da chave; nas demais
+    palavras o LIKE percorre só o índice (estreito), não a tabela.
+    """
+    palavras = chave_busca(termo).split()
+    if not palavras:
+        return Q(pk__in=[])
+    filtro = Q()
+    for palavra in palavras:
+        filtro &= Q(**{f'{campo}__startswith': palavra}) | Q(**{f'{campo}__contains': ' ' + palavra})
+    return filtro
+
+# ==============================================================================
+# 16. ÍNDICE DE QUASE-DUPLICATAS DAS SUGESTÕES (MINHASH + LSH)
+# ==============================================================================
+# Título + descrição viram trechos de 5 caracteres (sem acentos); cada trecho
+# gera 64 hashes de 32 bits (SHAKE-128) e a assinatura guarda o menor valor de
+# cada posição. A fração de posições iguais entre duas assinaturas estima a
+# semelhança (Jaccard) dos textos. As 64 posições são cortadas em 16 bandas
+# de 4: textos com semelhança acima de 0,6 repetem alguma banda em ~90% dos
+# casos (acima de 0,7, em ~99%), e só os que repetem são comparados (nenhuma
+# comparação de todos contra todos).
+
+TAMANHO_TRECHO = 5
+NUM_PERMUTACOES = 64
+LINHAS_POR_BANDA = 4
+LIMIAR_SEMELHANCA = 0.6
+LOTE_INDICE = 2000
+STATUS_SUGESTAO_REJEITADA = ('REJEITADA', 'REJEITADO')  # a view de moderação grava 'REJEITADO'
+
+def assinatura_minhash(titulo, descricao):
+    """Lista de NUM_PERMUTACOES inteiros de 32 bits ([] para texto vazio)."""
+    texto = chave_busca(titulo, descricao)
+    if not texto:
+        return []
+    trechos = {texto[i:i + TAMANHO_TRECHO] for i in range(max(1, len(texto) - TAMANHO_TRECHO + 1))}
+    # Os 64 hashes de um trecho saem de uma única chamada; o mínimo por posição roda em C
+    hashes = (array('I', hashlib.shake_128(trecho.encode()).digest(4 * NUM_PERMUTACOES)) for trecho in trechos)
+    return list(map(min, zip(*hashes)))
+
+def _assinatura_em_texto(assinatura):
+    return ''.join(f'{valor:08x}' for valor in assinatura)
+
+def _assinatura_de_texto(texto):
+    return [int(texto[i:i + 8], 16) for i in range(0, len(texto), 8)]
+
+def semelhanca_assinaturas(a, b):
+    """Estimativa do Jaccard entre os textos: fração de posições iguais."""
+    if not a or len(a) != len(b):
+        return 0.0
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+def chaves_bandas(assinatura):
+    """Um inteiro de 64 bits por banda (a posição da banda entra no hash)."""
+    chaves = []
+    for inicio in range(0, len(assinatura), LINHAS_POR_BANDA):
+        banda = f'{inicio}:' + _assinatura_em_texto(assinatura[inicio:inicio + LINHAS_POR_BANDA])
+        chaves.append(int.from_bytes(hashlib.blake2b(banda.encode(), digest_size=8).digest(), 'big', signed=True))
+    return chaves
+
+def indexar_sugestao(sugestao):
+    """
+    Atualiza a assinatura e as bandas de uma sugestão (chamado pelos signals a
+    cada gravação). Sem mudança de texto, competência ou nível, não grava nada.
+    """
+    texto = _assinatura_em_texto(assinatura_minhash(sugestao.titulo, sugestao.descricao))
+    bandas = BandaSugestao.objects.filter(sugestao=sugestao)
+    esperadas = NUM_PERMUTACOES // LINHAS_POR_BANDA if texto else 0
+    if texto == sugestao.assinatura and bandas.filter(
+        competencia_id=sugestao.competencia_id, nivel_alvo=sugestao.nivel_alvo
+    ).count() == esperadas:
+        return
+
+    with transaction.atomic(using=banco_principal()):
+        SugestaoAtividade.objects.filter(pk=sugestao.pk).update(assinatura=texto)
+        sugestao.assinatura = texto
+        bandas.delete()
+        BandaSugestao.objects.bulk_create([
+            BandaSugestao(
+                sugestao_id=sugestao.pk, competencia_id=sugestao.competencia_id,
+                nivel_alvo=sugestao.nivel_alvo, chave=chave,
+            )
+            for chave in chaves_bandas(_assinatura_de_texto(texto))
+        ])
+
+def sugestoes_semelhantes(sugestao, limite=5):
+    """
+    Sugestões (não rejeitadas) da mesma competência e nível parecidas com esta:
+    lista de (sugestão, semelhança) da mais parecida para a menos. Uma consulta
+    no índice de bandas traz as candidatas.
+    """
+    if not sugestao.assinatura:
+        indexar_sugestao(sugestao)
+    assinatura = _assinatura_de_texto(sugestao.assinatura)
+    if not assinatura:
+        return []
+
+    candidatas = (
+        SugestaoAtividade.objects
+        .filter(id__in=BandaSugestao.objects.filter(
+            competencia_id=sugestao.competencia_id, nivel_alvo=sugestao.nivel_alvo,
+            chave__in=chaves_bandas(assinatura),
+        ).values('sugestao_id'))
+        .exclude(pk=sugestao.pk)
+        .exclude(status__in=STATUS_SUGESTAO_REJEITADA)
+        .select_related('professor_autor')
+    )
+    semelhantes = [
+        (candidata, semelhanca)
+        for candidata in candidatas
+        if (semelhanca := semelhanca_assinaturas(assinatura, _assinatura_de_texto(candidata.assinatura)))
+        >= LIMIAR_SEMELHANCA
+    ]
+    semelhantes.sort(key=lambda par: (-par[1], par[0].pk))
+    return semelhantes[:limite]
+
+def reindexar_sugestoes(todas=False):
+    """Indexa as sugestões ainda sem assinatura (ou todas). Retorna quantas foram processadas."""
+    sugestoes = SugestaoAtividade.objects.exclude(status__in=STATUS_SUGESTAO_REJEITADA)
+    if not todas:
+        sugestoes = sugestoes.filter(assinatura='')
+    total = 0
+    for sugestao in sugestoes.order_by('pk').iterator(chunk_size=LOTE_INDICE):
+        indexar_sugestao(sugestao)
+        total += 1
+    return total
+
+def grupos_quase_duplicados():
+    """
+    Agrupa as sugestões não rejeitadas que são quase-duplicatas. Percorre o
+    índice ordenado por (competência, nível, chave): cada balde com mais de
+    uma sugestão compara seus membros só com o primeiro do balde (união de
+    conjuntos liga o resto). Retorna listas de sugestões, a mantida primeiro
+    (aprovada antes de pendente; entre iguais, a mais antiga).
+    """
+    ativas = SugestaoAtividade.objects.exclude(status__in=STATUS_SUGESTAO_REJEITADA).exclude(assinatura='')
+    linhas = (
+        BandaSugestao.objects.filter(sugestao__in=ativas)
+        .order_by('competencia_id', 'nivel_alvo', 'chave', 'sugestao_id')
+        .values_list('competencia_id', 'nivel_alvo', 'chave', 'sugestao_id')
+    )
+
+    baldes, balde, chave_atual = [], [], None
+    for competencia_id, nivel, chave, sugestao_id in linhas.iterator(chunk_size=LOTE_INDICE):
+        if (competencia_id, nivel, chave) != chave_atual:
+            if len(balde) > 1:
+                baldes.append(balde)
+            balde, chave_atual = [], (competencia_id, nivel, chave)
+        balde.append(sugestao_id)
+    if len(balde) > 1:
+        baldes.append(balde)
+
+    envolvidas = {sugestao_id for balde in baldes for sugestao_id in balde}
+    assinaturas = {
+        pk: _assinatura_de_texto(texto)
+        for pk, texto in ativas.filter(pk__in=envolvidas).values_list('pk', 'assinatura')
+    }
+
+    pai = {}
+    def raiz(pk):
+        while pai.setdefault(pk, pk) != pk:
+            pk = pai[pk]
+        return pk
+
+    for primeira, *demais in baldes:
+        for outra in demais:
+            if semelhanca_assinaturas(assinaturas[primeira], assinaturas[outra]) >= LIMIAR_SEMELHANCA:
+                pai[raiz(outra)] = raiz(primeira)
+
+    membros = {}
+    for pk in list(pai):
+        membros.setdefault(raiz(pk), []).append(pk)
+    grupos = [grupo for grupo in membros.values() if len(grupo) > 1]
+    por_id = SugestaoAtividade.objects.select_related('competencia').in_bulk(
+        [pk for grupo in grupos for pk in grupo]
+    )
+    grupos = [
+        sorted((por_id[pk] for pk in grupo), key=lambda s: (s.status != 'APROVADO', s.data_envio, s.pk))
+        for grupo in grupos
+    ]
+    return sorted(grupos, key=lambda grupo: grupo[0].pk)
+
+# ==============================================================================
+# 17. RECOMENDAÇÕES DE COMPETÊNCIAS POR CO-OCORRÊNCIA
+# ==============================================================================
+
+CHAVE_VERSAO_RECOMENDACOES = 'recomendacoes_competencias_versao'
+# Vizinhas gravadas por (série, competência): a matriz fica esparsa e o índice pequeno
+VIZINHAS_POR_COMPETENCIA = 20
+
+def invalidar_recomendacoes():
+    """Publica uma nova matriz; cada processo reconstrói o índice na próxima tela."""
+    cache.set(CHAVE_VERSAO_RECOMENDACOES, timezone.now().timestamp(), None)
+
+def _pares_do_componente(componente, series_validas):
+    """Contagens {(série, competência, relacionada): relatórios} de um componente."""
+    pares = Avaliacao.objects.filter(
+        competencia__componente=componente,
+        relatorio__avaliacoes__competencia__componente=componente,
+    ).values(
+        'relatorio__ano', 'relatorio__turma__ano_letivo', 'relatorio__turma__serie_curricular',
+        'competencia_id', 'relatorio__avaliacoes__competencia_id',
+    ).annotate(qtd=Count('id')).order_by()
+
+    contagens = {}
+    for linha in pares.iterator():
+        # Relatórios anteriores à turma gravada herdaram a turma atual do aluno;
+        # a virada promove uma série por ano letivo
+        serie = str(
+            int(linha['relatorio__turma__serie_curricular'])
+            - (linha['relatorio__turma__ano_letivo'] - linha['relatorio__ano'])
+        )
+        if serie not in series_validas:
+            continue
+        chave = (serie, linha['competencia_id'], linha['relatorio__avaliacoes__competencia_id'])
+        contagens[chave] = contagens.get(chave, 0) + linha['qtd']
+    return contagens
+
+def recalcular_recomendacoes():
+    """
+    Recalcula a matriz de co-ocorrência com um GROUP BY sobre o auto-join das
+    avaliações (pares de competências do mesmo relatório), um componente por
+    vez para limitar a memória. Retorna quantas linhas foram gravadas.
+    """
+    series_validas = {serie for serie, _ in Turma.SERIES}
+    novos = []
+    for componente, _ in Competencia.COMPONENTES:
+        vizinhas = {}
+        for (serie, competencia_id, relacionada_id), qtd in _pares_do_componente(componente, series_validas).items():
+            if competencia_id == relacionada_id:
+                novos.append(CoocorrenciaCompetencia(
+                    serie_curricular=serie, competencia_id=competencia_id, relacionada_id=relacionada_id, qtd=qtd,
+                ))
+            else:
+                vizinhas.setdefault((serie, competencia_id), []).append((qtd, relacionada_id))
+
+        for (serie, competencia_id), lista in vizinhas.items():
+            lista.sort(key=lambda item: (-item[0], item[1]))
+            novos.extend(
+                CoocorrenciaCompetencia(
+                    serie_curricular=serie, competencia_id=competencia_id, relacionada_id=relacionada_id, qtd=qtd,
+                )
+                for qtd, relacionada_id in lista[:VIZINHAS_POR_COMPETENCIA]
+            )
+
+    with transaction.atomic(using=banco_principal()):
+        CoocorrenciaCompetencia.objects.all().delete()
+        CoocorrenciaCompetencia.objects.bulk_create(novos, batch_size=500)
+
+    invalidar_recomendacoes()
+    return len(novos)
+
+class IndiceRecomendacoes:
+    """
+    Matriz de co-ocorrência em dicionários por (série, competência). A
+    pontuação de uma candidata soma, para cada competência já escolhida, a
+    fração dos relatórios dela em que a candidata também foi avaliada.
+    """
+
+    def __init__(self, versao):
+        self.versao = versao
+        self.frequencia = {}
+        self.vizinhas = {}
+        self.populares = {}
+        self.competencias = {}
+
+        linhas = CoocorrenciaCompetencia.objects.values_list(
+            'serie_curricular', 'competencia_id', 'relacionada_id', 'qtd'
+        )
+        for serie, competencia_id, relacionada_id, qtd in linhas:
+            if competencia_id == relacionada_id:
+                self.frequencia[(serie, competencia_id)] = qtd
+            else:
+                self.vizinhas.setdefault((serie, competencia_id), []).append((relacionada_id, qtd))
+
+        for comp in Competencia.objects.filter(
+            pk__in={cid for _, cid in self.frequencia}
+        ).only('id', 'codigo', 'componente', 'habilidade'):
+            self.competencias[comp.id] = {
+                'id': comp.id,
+                'codigo': comp.codigo,
+                'componente': comp.componente,
+                'habilidade': comp.habilidade,
+            }
+
+        # Mais avaliadas de cada (série, componente): completam a lista quando falta histórico
+        for (serie, competencia_id), qtd in self.frequencia.items():
+            comp = self.competencias.get(competencia_id)
+            if comp is not None:
+                self.populares.setdefault((serie, comp['componente']), []).append((qtd, comp['codigo'], competencia_id))
+        for chave, lista in self.populares.items():
+            lista.sort(key=lambda item: (-item[0], item[1]))
+            self.populares[chave] = [competencia_id for _, _, competencia_id in lista]
+
+    def recomendar(self, serie, componente, presentes, limite=6):
+        presentes = set(presentes)
+        pontos = {}
+        for competencia_id in presentes:
+            total = self.frequencia.get((serie, competencia_id))
+            for relacionada_id, qtd in self.vizinhas.get((serie, competencia_id), ()):
+                if relacionada_id not in presentes and relacionada_id in self.competencias:
+                    pontos[relacionada_id] = pontos.get(relacionada_id, 0) + qtd / total
+
+        escolhidas = sorted(pontos, key=lambda cid: (-pontos[cid], self.competencias[cid]['codigo']))[:limite]
+        for competencia_id in self.populares.get((serie, componente), ()):
+            if len(escolhidas) >= limite:
+                break
+            if competencia_id not in presentes and competencia_id not in pontos:
+                escolhidas.append(competencia_id)
+        return [self.competencias[cid] for cid in escolhidas]
+
+# Um índice por banco, como o do catálogo
+_indices_recomendacoes = {}
+
+def get_indice_recomendacoes():
+    """Retorna o índice em memória, reconstruindo-o se a matriz foi recalculada."""
+    banco = banco_principal()
+    indice = _indices_recomendacoes.get(banco)
+    versao = cache.get(CHAVE_VERSAO_RECOMENDACOES)
+    reaproveitado = indice is not None and indice.versao == versao
+    registrar_cache('indice_recomendacoes', reaproveitado)
+    if not reaproveitado:
+        indice = _indices_recomendacoes[banco] = IndiceRecomendacoes(versao)
+    return indice
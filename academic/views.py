@@ -4,17 +4,29 @@ from django.contrib.auth import get_user_model
 from django.contrib import messages
 from django.urls import reverse
 from django.db.models import Q
+from django.db.models.functions import Substr
+from django.core.paginator import Paginator
 from datetime import date
-import random
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, JsonResponse
+from core.replica import banco_arquivo, usar_replica
 
 # Importações dos modelos e utilitários
 from .models import (
     Turma, Aluno, Relatorio, Competencia, 
-    Avaliacao, SugestaoAtividade, ConfiguracaoSistema
+    Avaliacao, SugestaoAtividade, ConfiguracaoSistema, ConsolidadoCompetencia,
+    PresetCompetencias
 )
 from .forms import TurmaForm, AlunoForm, ProfessorForm, CompetenciaForm
-from .utils import get_periodo_atual, render_to_pdf
+from .utils import (
+    get_periodo_atual, configuracao_atual, configuracao_para_escrita, render_to_pdf,
+    planejar_virada_ano, executar_virada_ano, evolucao_longitudinal, get_indice_catalogo, competencias_da_serie,
+    adicionar_avaliacoes_em_lote, clonar_avaliacoes_anteriores, clonar_trimestre_anterior_turma,
+    alunos_com_avaliacoes_anteriores,
+    salvar_grade_avaliacao, alterar_status_relatorio, metricas_fluxo_relatorios,
+    salvar_avaliacoes_com_versao, ConflitoVersao, relatorio_reservado, relatorio_virtual, obter_relatorio_para_escrita,
+    aprovar_relatorio, sugestoes_do_relatorio, anos_arquivados, banco_do_ano, relatorio_ou_arquivado,
+    filtro_busca_nome, sugestoes_semelhantes, get_indice_recomendacoes
+)
 
 User = get_user_model()
 
@@ -235,7 +247,8 @@ def turma_detail(request, turma_id):
         'alunos': alunos_data,
         'ano_atual': ano_ativo,
         'trimestre_atual': tri_exibido,
-        'trimestre_sistema': tri_ativo 
+        'trimestre_sistema': tri_ativo,
+        'materias_grade': codigos_materias,
     })
 
 # ==============================================================================
@@ -244,7 +257,7 @@ def turma_detail(request, turma_id):
 @login_required
 def avaliar_aluno(request, aluno_pk):
     aluno = get_object_or_404(Aluno, pk=aluno_pk)
-    config = ConfiguracaoSistema.objects.first()
+    config = configuracao_atual()
     ano_atual = config.ano_letivo if config else 2025
     trimestre_atual = config.trimestre_ativo if config else '1'
 
@@ -254,23 +267,16 @@ def avaliar_aluno(request, aluno_pk):
     # 2. Define se o período visualizado é o que está aberto para edição
     is_periodo_ativo = str(trimestre_solicitado) == str(trimestre_atual)
 
-    # 3. Busca ou Cria o relatório
-    # Se for o período ativo, garantimos que o relatório exista (get_or_create)
-    if is_periodo_ativo:
-        relatorio, created = Relatorio.objects.get_or_create(
-            aluno=aluno,
-            ano=ano_atual,
-            trimestre=trimestre_atual,
-            defaults={
-                'professor': request.user,
-                'status': 'RASCUNHO'
-            }
-        )
-    else:
-        # Se for histórico, apenas tentamos buscar. Se não existir, relatorio será None
-        relatorio = Relatorio.objects.filter(
-            aluno=aluno, ano=ano_atual, trimestre=trimestre_solicitado
-        ).first()
+    # 3. Busca o relatório (somente leitura: esta tela nunca grava)
+    relatorio = Relatorio.objects.filter(
+        aluno=aluno, ano=ano_atual, trimestre=trimestre_solicitado
+    ).first()
+
+    # No período ativo, um relatório ainda não iniciado é exibido como rascunho
+    # virtual; ele só é criado na primeira gravação (ver iniciar_materia).
+    # No histórico, se não existir, relatorio continua None.
+    if relatorio is None and is_periodo_ativo:
+        relatorio = relatorio_virtual(aluno, ano_atual, trimestre_atual, request.user)
 
     definicoes_materias = [
         ('PORT', 'Língua Portuguesa', 'bi-book'),
@@ -286,7 +292,12 @@ def avaliar_aluno(request, aluno_pk):
     lista_materias_processada = []
     
     # 4. Processamento das matérias (apenas se houver um relatório para este período)
-    if relatorio:
+    if relatorio and relatorio.pk is None:
+        lista_materias_processada = [
+            {'codigo': codigo, 'nome': nome, 'icone': icone, 'concluido': False, 'tem_notas': False}
+            for codigo, nome, icone in definicoes_materias
+        ]
+    elif relatorio:
         for codigo, nome, icone in definicoes_materias:
             avaliacoes_materia = Avaliacao.objects.filter(
                 relatorio=relatorio, 
@@ -324,10 +335,14 @@ def avaliar_aluno(request, aluno_pk):
 # ==============================================================================
 # 4. AVALIAR UMA MATÉRIA (Adicionar, Excluir e Salvar Notas)
 # ==============================================================================
+def _conflito_de_edicao(request, relatorio, materia_codigo):
+    messages.error(request, "Este relatório foi alterado em outra tela ou saiu de edição. Nada foi gravado; confira a versão atual.")
+    return redirect('avaliar_materia', relatorio_id=relatorio.id, materia_codigo=materia_codigo)
+
 @login_required
 def avaliar_materia(request, relatorio_id, materia_codigo):
     relatorio = get_object_or_404(Relatorio, id=relatorio_id)
-    config = ConfiguracaoSistema.objects.first()
+    config = configuracao_atual()
 
     trimestre_ativo = config.trimestre_ativo if config else '1'
     ano_ativo = config.ano_letivo if config else 2025
@@ -343,6 +358,9 @@ def avaliar_materia(request, relatorio_id, materia_codigo):
             messages.error(request, "Este relatório está bloqueado para edições.")
             return redirect('avaliar_aluno', aluno_pk=relatorio.aluno.pk)
 
+        # Versão do relatório exibida na tela: toda gravação a confere (relatorio_reservado)
+        versao = request.POST.get('versao') or None
+
         # AÇÃO 1: ADICIONAR COMPETÊNCIA
         if 'btn_adicionar' in request.POST:
             termo = request.POST.get('termo_busca', '').strip()
@@ -356,18 +374,70 @@ def avaliar_materia(request, relatorio_id, materia_codigo):
                     componente=materia_codigo, # Garante que não adicione código de MAT em PORT
                 )
                 
-                Avaliacao.objects.get_or_create(relatorio=relatorio, competencia=nova_comp)
+                with relatorio_reservado(relatorio, versao):
+                    Avaliacao.objects.get_or_create(relatorio=relatorio, competencia=nova_comp)
                 messages.success(request, f"Competência {nova_comp.codigo} adicionada!")
             
             except Competencia.DoesNotExist:
                 messages.error(request, f"Habilidade '{termo}' não encontrada para o {serie_aluno}º ano nesta disciplina.")
+            except ConflitoVersao:
+                return _conflito_de_edicao(request, relatorio, materia_codigo)
             
             return redirect('avaliar_materia', relatorio_id=relatorio.id, materia_codigo=materia_codigo)
 
+        # AÇÃO 1.1: ADICIONAR TODAS AS COMPETÊNCIAS DA SÉRIE (um único INSERT)
+        elif 'btn_adicionar_todas' in request.POST:
+            serie_aluno = relatorio.aluno.turma.serie_curricular
+            ids = competencias_da_serie(materia_codigo, serie_aluno).values_list('id', flat=True)
+            try:
+                with relatorio_reservado(relatorio, versao):
+                    total = adicionar_avaliacoes_em_lote(relatorio, ids)
+            except ConflitoVersao:
+                return _conflito_de_edicao(request, relatorio, materia_codigo)
+            messages.success(request, f"{total} competência(s) do {serie_aluno}º ano adicionada(s).")
+            return redirect('avaliar_materia', relatorio_id=relatorio.id, materia_codigo=materia_codigo)
+
+        # AÇÃO 1.2: APLICAR UM PRESET SALVO PELO PROFESSOR
+        elif 'btn_aplicar_preset' in request.POST:
+            preset = get_object_or_404(
+                PresetCompetencias,
+                id=request.POST.get('preset_id'),
+                professor=request.user,
+                componente=materia_codigo,
+            )
+            ids = preset.competencias.values_list('id', flat=True)
+            try:
+                with relatorio_reservado(relatorio, versao):
+                    total = adicionar_avaliacoes_em_lote(relatorio, ids)
+            except ConflitoVersao:
+                return _conflito_de_edicao(request, relatorio, materia_codigo)
+            messages.success(request, f"Preset '{preset.nome}' aplicado: {total} competência(s) adicionada(s).")
+            return redirect('avaliar_materia', relatorio_id=relatorio.id, materia_codigo=materia_codigo)
+
+        # AÇÃO 1.3: SALVAR A LISTA ATUAL COMO PRESET
+        elif 'btn_salvar_preset' in request.POST:
+            nome_preset = request.POST.get('nome_preset', '').strip()
+            if not nome_preset:
+                messages.error(request, "Informe um nome para o preset.")
+            else:
+                preset, _ = PresetCompetencias.objects.get_or_create(
+                    professor=request.user, nome=nome_preset, componente=materia_codigo
+                )
+                preset.competencias.set(
+                    Avaliacao.objects.filter(relatorio=relatorio, competencia__componente=materia_codigo)
+                    .values_list('competencia_id', flat=True)
+                )
+                messages.success(request, f"Preset '{nome_preset}' salvo com {preset.competencias.count()} competência(s).")
+            return redirect('avaliar_materia', relatorio_id=relatorio.id, materia_codigo=materia_codigo)
+
         # AÇÃO 2: EXCLUIR COMPETÊNCIA
         elif 'btn_excluir' in request.POST:
             av_id = request.POST.get('btn_excluir')
-            Avaliacao.objects.filter(id=av_id, relatorio=relatorio).delete()
+            try:
+                with relatorio_reservado(relatorio, versao):
+                    Avaliacao.objects.filter(id=av_id, relatorio=relatorio).delete()
+            except ConflitoVersao:
+                return _conflito_de_edicao(request, relatorio, materia_codigo)
             messages.success(request, "Competência removida.")
             return redirect('avaliar_materia', relatorio_id=relatorio.id, materia_codigo=materia_codigo)
 
@@ -376,17 +446,32 @@ def avaliar_materia(request, relatorio_id, materia_codigo):
             avaliacoes_atuais = Avaliacao.objects.filter(
                 relatorio=relatorio, 
                 competencia__componente=materia_codigo
-            )
-            
+            ).select_related('competencia')
+
+            # Captura os dados dinâmicos do template (ID da competência no nome do campo)
+            # junto com a versão de cada avaliação exibida na tela
+            alteracoes = {}
             for av in avaliacoes_atuais:
-                # Captura os dados dinâmicos do template (ID da competência no nome do campo)
-                nivel = request.POST.get(f'nivel_{av.competencia.id}')
-                obs = request.POST.get(f'obs_{av.competencia.id}')
-                
-                if nivel:
-                    av.nivel = nivel
-                av.observacao_especifica = obs
-                av.save()
+                cid = av.competencia.id
+                versao = request.POST.get(f'versao_{cid}')
+                if versao is None:
+                    continue  # competência adicionada depois que a tela foi aberta
+                alteracoes[av.id] = (versao, request.POST.get(f'nivel_{cid}'), request.POST.get(f'obs_{cid}'))
+
+            try:
+                _, conflitos = salvar_avaliacoes_com_versao(relatorio, alteracoes)
+            except ConflitoVersao:
+                messages.error(request, "Este relatório foi enviado ou decidido enquanto você editava. Nada foi gravado.")
+                return redirect('avaliar_aluno', aluno_pk=relatorio.aluno.pk)
+
+            if conflitos:
+                codigos = [av.competencia.codigo for av in avaliacoes_atuais if av.id in conflitos]
+                messages.warning(
+                    request,
+                    f"As competências {', '.join(codigos)} foram alteradas em outra tela e não foram gravadas. "
+                    "Os valores atuais foram recarregados; as demais alterações foram salvas."
+                )
+                return redirect('avaliar_materia', relatorio_id=relatorio.id, materia_codigo=materia_codigo)
 
             messages.success(request, "Alterações salvas com sucesso!")
             return redirect('avaliar_aluno', aluno_pk=relatorio.aluno.pk)
@@ -397,11 +482,60 @@ def avaliar_materia(request, relatorio_id, materia_codigo):
         competencia__componente=materia_codigo
     ).select_related('competencia').order_by('competencia__codigo')
 
+    presets = PresetCompetencias.objects.filter(
+        professor=request.user, componente=materia_codigo
+    ).order_by('nome') if pode_editar else []
+
+    # Recomendações vêm do índice em memória (matriz recalculada em lote)
+    recomendadas = get_indice_recomendacoes().recomendar(
+        relatorio.aluno.turma.serie_curricular, materia_codigo, [av.competencia_id for av in avaliacoes]
+    ) if pode_editar else []
+
     return render(request, 'form_avaliacao.html', {
         'relatorio': relatorio,
         'materia_codigo': materia_codigo,
         'avaliacoes': avaliacoes,
-        'pode_editar': pode_editar
+        'pode_editar': pode_editar,
+        'presets': presets,
+        'recomendadas': recomendadas,
+        'autocomplete_url': reverse('autocomplete_competencias', args=[relatorio.id, materia_codigo]),
+    })
+
+# ==============================================================================
+# 4.1 INICIAR UMA MATÉRIA (Relatório ainda não criado)
+# ==============================================================================
+@login_required
+def iniciar_materia(request, aluno_pk, materia_codigo):
+    """
+    Tela da matéria para um aluno sem relatório no período ativo. O GET mostra
+    o formulário vazio sem gravar nada; o primeiro POST cria o relatório e segue
+    o fluxo normal de avaliar_materia.
+    """
+    aluno = get_object_or_404(Aluno.objects.select_related('turma'), pk=aluno_pk)
+    ano_ativo, tri_ativo = get_periodo_atual()
+
+    relatorio = Relatorio.objects.filter(aluno=aluno, ano=ano_ativo, trimestre=tri_ativo).first()
+
+    if request.method == 'POST':
+        if relatorio is None:
+            relatorio = obter_relatorio_para_escrita(aluno, ano_ativo, tri_ativo, request.user)
+        return avaliar_materia(request, relatorio.id, materia_codigo)
+
+    if relatorio is not None:
+        return redirect('avaliar_materia', relatorio_id=relatorio.id, materia_codigo=materia_codigo)
+
+    presets = PresetCompetencias.objects.filter(
+        professor=request.user, componente=materia_codigo
+    ).order_by('nome')
+
+    return render(request, 'form_avaliacao.html', {
+        'relatorio': relatorio_virtual(aluno, ano_ativo, tri_ativo, request.user),
+        'materia_codigo': materia_codigo,
+        'avaliacoes': [],
+        'pode_editar': True,
+        'presets': presets,
+        'recomendadas': get_indice_recomendacoes().recomendar(aluno.turma.serie_curricular, materia_codigo, []),
+        'autocomplete_url': reverse('autocomplete_competencias_aluno', args=[aluno.pk, materia_codigo]),
     })
 
 # ==============================================================================
@@ -479,26 +613,16 @@ def aprovar_sugestao(request, sugestao_id, decisao):
 # ==============================================================================
 @login_required
 def visualizar_relatorio(request, relatorio_id):
-    relatorio = get_object_or_404(Relatorio, id=relatorio_id)
+    # Relatórios de anos arquivados continuam acessíveis (somente leitura)
+    relatorio = relatorio_ou_arquivado(relatorio_id)
+    if relatorio is None:
+        raise Http404
     # Carrega avaliações com select_related para performance
-    avaliacoes = Avaliacao.objects.filter(relatorio=relatorio).select_related('competencia')
+    avaliacoes = Avaliacao.objects.using(relatorio._state.db).filter(relatorio=relatorio).select_related('competencia')
     
     # Dicionário: { avaliacao_id : lista_de_sugestoes }
-    sugestoes_por_avaliacao = {}
-    
-    for avaliacao in avaliacoes:
-        # A MÁGICA: Busca sugestões que batem com a Competência E com o Nível da nota
-        # Ajustado status para 'APROVADO' (conforme o Model)
-        sugestoes_compativeis = list(SugestaoAtividade.objects.filter(
-            competencia=avaliacao.competencia,
-            nivel_alvo=avaliacao.nivel,
-            status='APROVADO'
-        ))
-        
-        # Sorteia até 2 sugestões pedagógicas para o relatório
-        if sugestoes_compativeis:
-            sugestoes_escolhidas = random.sample(sugestoes_compativeis, min(len(sugestoes_compativeis), 2))
-            sugestoes_por_avaliacao[avaliacao.id] = sugestoes_escolhidas
+    # Aprovado: as sugestões fixadas na aprovação; antes disso, uma prévia sorteada
+    sugestoes_por_avaliacao = sugestoes_do_relatorio(relatorio, avaliacoes)
             
     return render(request, 'relatorio_final.html', {
         'relatorio': relatorio,
@@ -551,8 +675,11 @@ def enviar_relatorio_final(request, relatorio_id):
         
         # --- FLUXO DE SUCESSO ---
         # Alterado para 'ANALISE' para manter consistência com o Dashboard e Models
-        relatorio.status = 'ANALISE' 
-        relatorio.save()
+        try:
+            alterar_status_relatorio(relatorio, 'ANALISE', request.user)
+        except ConflitoVersao:
+            messages.error(request, "O relatório foi alterado enquanto era enviado. Confira as notas e envie novamente.")
+            return redirect('avaliar_aluno', aluno_pk=relatorio.aluno.pk)
         
         messages.success(request, f"Sucesso! O relatório de {relatorio.aluno.nome_completo} foi enviado para análise.")
         return redirect('turma_detail', turma_id=relatorio.aluno.turma.id)
@@ -577,11 +704,17 @@ def limpar_materia(request, relatorio_id, materia_codigo):
         return redirect('avaliar_aluno', aluno_pk=relatorio.aluno.pk)
         
     if request.method == 'POST':
-        # Remove fisicamente todas as avaliações dessa matéria específica
-        Avaliacao.objects.filter(
-            relatorio=relatorio, 
-            competencia__componente=materia_codigo
-        ).delete()
+        # Remove fisicamente todas as avaliações dessa matéria específica,
+        # desde que o relatório ainda esteja na versão exibida
+        try:
+            with relatorio_reservado(relatorio, request.POST.get('versao') or None):
+                Avaliacao.objects.filter(
+                    relatorio=relatorio, 
+                    competencia__componente=materia_codigo
+                ).delete()
+        except ConflitoVersao:
+            messages.error(request, "Este relatório foi alterado em outra tela ou saiu de edição. Nada foi removido.")
+            return redirect('avaliar_aluno', aluno_pk=relatorio.aluno.pk)
         messages.success(request, f"As avaliações de {materia_codigo} foram removidas com sucesso.")
         
     return redirect('avaliar_aluno', aluno_pk=relatorio.aluno.pk)
@@ -598,7 +731,9 @@ def detalhe_sugestao(request, sugestao_id):
     
     sugestao = get_object_or_404(SugestaoAtividade, id=sugestao_id)
     return render(request, 'sugestao_detail.html', {
-        'sugestao': sugestao
+        'sugestao': sugestao,
+        # Quase-duplicatas já no banco (mesma competência e nível), pelo índice MinHash
+        'semelhantes': sugestoes_semelhantes(sugestao),
     })
 
 # ==============================================================================
@@ -614,12 +749,16 @@ def decisao_relatorio(request, relatorio_id):
     if request.method == 'POST':
         relatorio = get_object_or_404(Relatorio, id=relatorio_id)
         acao = request.POST.get('acao') # 'aprovar' ou 'corrigir'
+        # Versão que a coordenação leu na tela; se o professor salvou depois, a decisão é recusada
+        versao = request.POST.get('versao') or None
         
         if acao == 'aprovar':
-            relatorio.status = 'APROVADO'
-            # Limpa qualquer feedback anterior para manter o histórico limpo
-            relatorio.feedback_coordenacao = '' 
-            relatorio.save()
+            # Aprova, limpa o feedback anterior e fixa as sugestões exibidas no relatório
+            try:
+                aprovar_relatorio(relatorio, request.user, versao)
+            except ConflitoVersao:
+                messages.error(request, "O professor alterou este relatório enquanto você o analisava. Revise a versão atual antes de decidir.")
+                return redirect('visualizar_relatorio', relatorio_id=relatorio.id)
             messages.success(request, f"O relatório de {relatorio.aluno.nome_completo} foi APROVADO.")
             
         elif acao == 'corrigir':
@@ -629,9 +768,11 @@ def decisao_relatorio(request, relatorio_id):
                 messages.error(request, "Atenção: Você precisa descrever o que deve ser corrigido.")
                 return redirect('visualizar_relatorio', relatorio_id=relatorio.id)
             
-            relatorio.status = 'CORRECAO'
-            relatorio.feedback_coordenacao = motivo
-            relatorio.save()
+            try:
+                alterar_status_relatorio(relatorio, 'CORRECAO', request.user, versao, feedback_coordenacao=motivo)
+            except ConflitoVersao:
+                messages.error(request, "O professor alterou este relatório enquanto você o analisava. Revise a versão atual antes de decidir.")
+                return redirect('visualizar_relatorio', relatorio_id=relatorio.id)
             messages.warning(request, f"Relatório devolvido para o professor. Motivo: {motivo}")
 
     return redirect('dashboard')
@@ -645,8 +786,8 @@ def configuracoes_sistema(request):
         messages.error(request, "Acesso restrito.")
         return redirect('dashboard')
     
-    # Busca a única instância de configuração ou cria a primeira (id=1)
-    config, created = ConfiguracaoSistema.objects.get_or_create(id=1)
+    # Busca a mesma instância lida por configuracao_atual() ou cria a primeira
+    config = configuracao_para_escrita()
     
     if request.method == 'POST':
         try:
@@ -675,25 +816,88 @@ def gestao_escolar(request):
     if request.user.role not in ['ADMINISTRADOR', 'COORDENADOR']:
         messages.error(request, "Acesso restrito.")
         return redirect('dashboard')
-    
-    # Buscas otimizadas com select_related e order_by
+
+    # 1. Filtros de cada aba (aplicados no banco, não no template)
+    q_turma = request.GET.get('q_turma', '').strip()
+    q_aluno = request.GET.get('q_aluno', '').strip()
+    q_prof = request.GET.get('q_prof', '').strip()
+    filtro_turma = request.GET.get('turma', '')
+
     turmas = Turma.objects.all().order_by('nome')
-    alunos = Aluno.objects.all().select_related('turma').order_by('nome_completo')
-    
-    # Busca apenas usuários com papel de PROFESSOR
+    if q_turma:
+        turmas = turmas.filter(nome__icontains=q_turma)
+
+    alunos = Aluno.objects.all().select_related('turma').only(
+        'pk', 'nome_completo', 'turma__id', 'turma__nome'
+    ).order_by('nome_completo')
+    if q_aluno:
+        filtro = filtro_busca_nome(q_aluno)
+        if q_aluno.isdigit():
+            filtro |= Q(pk=q_aluno)
+        alunos = alunos.filter(filtro)
+    if filtro_turma.isdigit():
+        alunos = alunos.filter(turma_id=filtro_turma)
+
+    # Busca apenas usuários com papel de PROFESSOR (vínculos em um único prefetch)
     User = get_user_model()
-    professores = User.objects.filter(role='PROFESSOR').order_by('first_name')
-    
+    professores = User.objects.filter(role='PROFESSOR').prefetch_related('turmas').order_by('first_name')
+    if q_prof:
+        professores = professores.filter(filtro_busca_nome(q_prof))
+
+    # 2. Paginação independente por aba
+    por_pagina = 25
+    pagina_turmas = Paginator(turmas, por_pagina).get_page(request.GET.get('pagina_turmas'))
+    pagina_alunos = Paginator(alunos, por_pagina).get_page(request.GET.get('pagina_alunos'))
+    pagina_profs = Paginator(professores, por_pagina).get_page(request.GET.get('pagina_profs'))
+
     # Instancia formulários vazios para os modais de criação
     return render(request, 'gestao_escolar.html', {
-        'turmas': turmas,
-        'alunos': alunos,
-        'professores': professores,
+        'turmas': pagina_turmas,
+        'alunos': pagina_alunos,
+        'professores': pagina_profs,
+        'opcoes_turma': Turma.objects.order_by('nome').values_list('id', 'nome'),
+        'aba_ativa': request.GET.get('tab', 'turmas'),
+        'q_turma': q_turma,
+        'q_aluno': q_aluno,
+        'q_prof': q_prof,
+        'filtro_turma': filtro_turma,
         'form_turma': TurmaForm(),
         'form_aluno': AlunoForm(),
         'form_professor': ProfessorForm()
     })
 
+@login_required
+def gestao_form_edicao(request, tipo, obj_id):
+    """
+    Fragmento HTML do formulário de edição, carregado sob demanda pelo modal
+    único da Gestão Escolar (em vez de um modal por registro na página).
+    """
+    if request.user.role not in ['ADMINISTRADOR', 'COORDENADOR']:
+        return HttpResponse(status=403)
+
+    if tipo == 'turma':
+        turma = get_object_or_404(Turma, id=obj_id)
+        return render(request, 'partials/edicao_turma.html', {
+            'turma': turma, 'form': TurmaForm(instance=turma),
+        })
+
+    if tipo == 'aluno':
+        aluno = get_object_or_404(Aluno, pk=obj_id)
+        return render(request, 'partials/edicao_aluno.html', {
+            'aluno': aluno, 'form': AlunoForm(instance=aluno),
+            'opcoes_turma': Turma.objects.order_by('nome').values_list('id', 'nome'),
+        })
+
+    if tipo == 'professor':
+        prof = get_object_or_404(User.objects.prefetch_related('turmas'), id=obj_id, role='PROFESSOR')
+        return render(request, 'partials/edicao_professor.html', {
+            'prof': prof,
+            'opcoes_turma': Turma.objects.order_by('nome').values_list('id', 'nome'),
+            'turmas_vinculadas': {t.id for t in prof.turmas.all()},
+        })
+
+    return HttpResponse(status=404)
+
 # ==============================================================================
 # 11. CRUD DE TURMAS
 # ==============================================================================
@@ -853,6 +1057,20 @@ def criar_sugestao_coordenador(request):
 # ==============================================================================
 # 16. GESTÃO E FILTRO DE COMPETÊNCIAS (BNCC)
 # ==============================================================================
+# Campos pedagógicos longos: nunca entram na listagem, só no fragmento de detalhe
+CAMPOS_DETALHE_COMPETENCIA = ['prat_linguagens', 'obj_conhecimento', 'cont_relacionado', 'or_pedagogicas', 'desc_saeb']
+
+def _competencias_listagem():
+    """
+    Projeção da tabela do catálogo: só as colunas exibidas e os primeiros 201
+    caracteres da habilidade (o suficiente para o truncatechars:200 da tabela).
+    """
+    return (
+        Competencia.objects.only('id', 'codigo', 'componente', 'anos_aplicacao')
+        .annotate(habilidade_resumo=Substr('habilidade', 1, 201))
+        .order_by('codigo')
+    )
+
 @login_required
 def gestao_competencias(request):
     """
@@ -869,7 +1087,7 @@ def gestao_competencias(request):
     filtro_materia = request.GET.get('filtro_materia')
     serie = request.GET.get('serie') # Novo filtro de Série/Ano
     
-    competencias = Competencia.objects.all().order_by('codigo')
+    competencias = _competencias_listagem()
     
     # 3. Aplicação de Filtros Dinâmicos
     # Filtro de busca textual (Código ou Descrição)
@@ -944,10 +1162,34 @@ def excluir_competencia(request, competencia_id):
         
     return redirect('gestao_competencias')
 
+@login_required
+@usar_replica
+def competencia_detalhe(request, competencia_id):
+    """Fragmento com a habilidade completa e os campos pedagógicos, carregado no modal."""
+    comp = get_object_or_404(Competencia, id=competencia_id)
+    campos = [
+        (Competencia._meta.get_field(nome).verbose_name, getattr(comp, nome))
+        for nome in CAMPOS_DETALHE_COMPETENCIA
+    ]
+    return render(request, 'partials/competencia_detalhe.html', {'comp': comp, 'campos': campos})
+
+@login_required
+def competencia_form_edicao(request, competencia_id):
+    """Formulário de edição carregado sob demanda (um único modal na página)."""
+    if request.user.role == 'PROFESSOR':
+        return HttpResponse(status=403)
+
+    comp = get_object_or_404(Competencia.objects.defer(*CAMPOS_DETALHE_COMPETENCIA), id=competencia_id)
+    return render(request, 'partials/edicao_competencia.html', {
+        'comp': comp,
+        'materias': ['PORT', 'MAT', 'CIEN', 'HIST', 'GEO', 'ARTE', 'EDFIS', 'REL'],
+    })
+
 # ==============================================================================
 # 18. CATÁLOGO BNCC (Visão de Consulta do Professor)
 # ==============================================================================
 @login_required
+@usar_replica
 def visualizar_competencias(request):
     """
     View idêntica à de gestão, mas com travas de segurança para modo leitura.
@@ -961,7 +1203,7 @@ def visualizar_competencias(request):
         aluno_pk = None
 
     # Busca baseada no código
-    competencias = Competencia.objects.all().order_by('codigo')
+    competencias = _competencias_listagem()
     
     if busca:
         competencias = competencias.filter(
@@ -990,19 +1232,23 @@ def visualizar_competencias(request):
     })
 
 @login_required
+@usar_replica
 def baixar_relatorio_pdf(request, relatorio_id):
     """
     View que gera e retorna o PDF do relatório para o navegador.
     """
     # 1. Busca o relatório e as avaliações (com select_related para ser rápido)
-    relatorio = get_object_or_404(Relatorio, id=relatorio_id)
-    avaliacoes = Avaliacao.objects.filter(relatorio=relatorio).select_related('competencia')
+    relatorio = relatorio_ou_arquivado(relatorio_id)
+    if relatorio is None:
+        raise Http404
+    avaliacoes = Avaliacao.objects.using(relatorio._state.db).filter(relatorio=relatorio).select_related('competencia')
 
     # 2. Prepara os dados (contexto) que o PDF vai usar
     # Deve ser o mesmo contexto que você usa na view 'visualizar_relatorio'
     context = {
         'relatorio': relatorio,
         'avaliacoes': avaliacoes,
+        'sugestoes_map': sugestoes_do_relatorio(relatorio, avaliacoes),
         'aluno': relatorio.aluno,
         'data_emissao': date.today(),
     }
@@ -1024,6 +1270,7 @@ def baixar_relatorio_pdf(request, relatorio_id):
     return HttpResponse("Erro ao gerar PDF", status=400)
 
 @login_required
+@usar_replica
 def historico_coordenacao(request):
     # 1. Trava de Segurança: Apenas gestão acessa o histórico global
     if request.user.role not in ['ADMINISTRADOR', 'COORDENADOR']:
@@ -1037,23 +1284,37 @@ def historico_coordenacao(request):
     busca = request.GET.get('q')
 
     # 3. Busca os anos e trimestres que possuem relatórios no banco para o filtro
-    anos_disponiveis = Relatorio.objects.values_list('ano', flat=True).distinct().order_by('-ano')
-    
-    relatorios = Relatorio.objects.all().select_related('aluno', 'professor', 'aluno__turma')
+    # (anos arquivados saem do banco principal, mas continuam consultáveis)
+    anos_disponiveis = sorted(
+        set(Relatorio.objects.values_list('ano', flat=True).distinct()) | anos_arquivados(), reverse=True
+    )
 
+    # Um ano filtrado vive em um único banco; sem ano, a busca cobre os dois
     if ano_filtro:
-        relatorios = relatorios.filter(ano=ano_filtro)
-    if tri_filtro:
-        relatorios = relatorios.filter(trimestre=tri_filtro)
-    if busca:
-        relatorios = relatorios.filter(
-            Q(aluno__nome_completo__icontains=busca) | 
-            Q(professor__first_name__icontains=busca)
-        )
+        bancos = [banco_do_ano(ano_filtro)]
+    else:
+        bancos = [None, banco_arquivo()] if anos_arquivados() else [None]
+
+    def buscar(banco):
+        relatorios = Relatorio.objects.using(banco).select_related('aluno', 'professor', 'aluno__turma')
+        if ano_filtro:
+            relatorios = relatorios.filter(ano=ano_filtro)
+        if tri_filtro:
+            relatorios = relatorios.filter(trimestre=tri_filtro)
+        if busca:
+            relatorios = relatorios.filter(
+                filtro_busca_nome(busca, 'aluno__nome_busca') |
+                filtro_busca_nome(busca, 'professor__nome_busca')
+            )
+        return relatorios
 
     # 4. Paginação ou Limite (Opcional, mas recomendado para histórico)
     if not ano_filtro and not tri_filtro and not busca:
-        relatorios = relatorios.none() # Não carrega nada sem filtro ativo
+        relatorios = Relatorio.objects.none() # Não carrega nada sem filtro ativo
+    elif len(bancos) == 1:
+        relatorios = buscar(bancos[0])
+    else:
+        relatorios = [rel for banco in bancos for rel in buscar(banco)]
 
     return render(request, 'historico_geral.html', {
         'relatorios': relatorios,
@@ -1061,4 +1322,351 @@ def historico_coordenacao(request):
         'ano_selecionado': ano_filtro,
         'tri_selecionado': tri_filtro,
         'busca_ativa': busca
-    })
\ No newline at end of file
+    })
+
+# ==============================================================================
+# 19. VIRADA DE ANO LETIVO (Prévia + Execução em Lote)
+# ==============================================================================
+@login_required
+def virada_ano_letivo(request):
+    if request.user.role not in ['ADMINISTRADOR', 'COORDENADOR']:
+        messages.error(request, "Acesso restrito.")
+        return redirect('dashboard')
+
+    # A prévia é recalculada no POST e só é executada se for igual à exibida
+    plano = planejar_virada_ano()
+
+    if request.method == 'POST':
+        if plano['bloqueio']:
+            messages.error(request, plano['bloqueio'])
+            return redirect('virada_ano_letivo')
+        if request.POST.get('assinatura') != plano['assinatura']:
+            messages.error(request, "Turmas, alunos ou professores mudaram desde a prévia. Confira a prévia atualizada.")
+            return redirect('virada_ano_letivo')
+
+        resultado = executar_virada_ano(plano)
+        messages.success(
+            request,
+            f"Ano letivo {plano['ano_destino']} iniciado: {resultado['turmas_criadas']} turmas criadas "
+            f"e {resultado['alunos_promovidos']} alunos promovidos."
+        )
+        return redirect('configuracoes_sistema')
+
+    return render(request, 'virada_ano.html', {'plano': plano})
+
+# ==============================================================================
+# 20. ANÁLISE POR COMPETÊNCIA (Mapa de Calor da Coordenação)
+# ==============================================================================
+def _distribuicao_niveis(consolidado):
+    """Prepara as barras de distribuição (nível, quantidade, percentual) de um consolidado."""
+    total = consolidado.total_avaliados
+    return [
+        {'nivel': nivel, 'qtd': qtd, 'pct': int(qtd / total * 100) if total else 0}
+        for nivel, qtd in enumerate(consolidado.contagens, start=1)
+    ]
+
+def _periodo_da_consulta(request):
+    """(ano, trimestre) de ?ano=&tri=; valores inválidos caem no período ativo."""
+    ano_ativo, tri_ativo = get_periodo_atual()
+    try:
+        ano = int(request.GET.get('ano') or ano_ativo)
+    except ValueError:
+        ano = ano_ativo
+    tri = request.GET.get('tri')
+    if tri not in dict(Relatorio.TRIMESTRES):
+        tri = tri_ativo
+    return ano, tri
+
+@login_required
+@usar_replica
+def analise_competencias(request):
+    """
+    Mapa de calor (turmas x competências) com drill-down por turma, competência
+    ou célula. Lê exclusivamente a tabela de consolidados, nunca as avaliações.
+    """
+    if request.user.role not in ['ADMINISTRADOR', 'COORDENADOR']:
+        messages.error(request, "Acesso restrito à coordenação.")
+        return redirect('dashboard')
+
+    ano, tri = _periodo_da_consulta(request)
+    componente = request.GET.get('componente') or 'PORT'
+    turma_id = request.GET.get('turma')
+    competencia_id = request.GET.get('competencia')
+
+    consolidados = list(
+        ConsolidadoCompetencia.objects.filter(ano=ano, trimestre=tri, componente=componente)
+        .select_related('turma', 'competencia')
+        .only(
+            'turma_id', 'competencia_id', 'qtd_nivel_1', 'qtd_nivel_2', 'qtd_nivel_3',
+            'qtd_nivel_4', 'qtd_nivel_5', 'qtd_sem_nivel',
+            'turma__nome', 'competencia__codigo', 'competencia__habilidade',
+        )
+    )
+
+    # 1. Eixos do mapa de calor
+    turmas = sorted({c.turma for c in consolidados}, key=lambda t: t.nome)
+    competencias = sorted({c.competencia for c in consolidados}, key=lambda c: c.codigo)
+    por_celula = {(c.turma_id, c.competencia_id): c for c in consolidados}
+
+    linhas = []
+    for turma in turmas:
+        celulas = []
+        for comp in competencias:
+            consolidado = por_celula.get((turma.id, comp.id))
+            celulas.append({
+                'competencia': comp,
+                'consolidado': consolidado,
+                'opacidade': f"{consolidado.percentual_desenvolvido / 100:.2f}" if consolidado else None,
+            })
+        linhas.append({'turma': turma, 'celulas': celulas})
+
+    # 2. Drill-down (turma, competência ou a célula específica)
+    detalhe = [
+        c for c in consolidados
+        if (not turma_id or str(c.turma_id) == turma_id)
+        and (not competencia_id or str(c.competencia_id) == competencia_id)
+    ] if (turma_id or competencia_id) else []
+    detalhe = [{'consolidado': c, 'niveis': _distribuicao_niveis(c)} for c in detalhe]
+
+    return render(request, 'analise_competencias.html', {
+        'linhas': linhas,
+        'competencias': competencias,
+        'detalhe': detalhe,
+        'ano_selecionado': str(ano),
+        'tri_selecionado': str(tri),
+        'componente_selecionado': componente,
+        'turma_selecionada': turma_id,
+        'competencia_selecionada': competencia_id,
+        'anos_disponiveis': ConsolidadoCompetencia.objects.values_list('ano', flat=True).distinct().order_by('-ano'),
+        'componentes': Competencia.COMPONENTES,
+    })
+
+# ==============================================================================
+# 21. EVOLUÇÃO LONGITUDINAL (Aluno e Turma em todos os trimestres)
+# ==============================================================================
+def _render_evolucao(request, titulo, voltar_url, filtros, turma=None, aluno=None):
+    componente = request.GET.get('componente')
+    so_regressoes = request.GET.get('regressoes') == '1'
+
+    if componente:
+        filtros['competencia__componente'] = componente
+
+    periodos, linhas = evolucao_longitudinal(**filtros)
+    total_regressoes = sum(linha['regressoes'] for linha in linhas)
+    if so_regressoes:
+        linhas = [linha for linha in linhas if linha['regressoes']]
+
+    return render(request, 'evolucao.html', {
+        'titulo': titulo,
+        'voltar_url': voltar_url,
+        'turma': turma,
+        'aluno': aluno,
+        'periodos': periodos,
+        'linhas': linhas,
+        'total_regressoes': total_regressoes,
+        'componente_selecionado': componente,
+        'so_regressoes': so_regressoes,
+        'componentes': Competencia.COMPONENTES,
+    })
+
+@login_required
+@usar_replica
+def evolucao_aluno(request, aluno_pk):
+    aluno = get_object_or_404(Aluno.objects.select_related('turma'), pk=aluno_pk)
+    return _render_evolucao(
+        request,
+        titulo=f"Evolução: {aluno.nome_completo}",
+        voltar_url=reverse('avaliar_aluno', args=[aluno.pk]),
+        filtros={'relatorio__aluno': aluno},
+        aluno=aluno,
+    )
+
+@login_required
+@usar_replica
+def evolucao_turma(request, turma_id):
+    turma = get_object_or_404(Turma, id=turma_id)
+    return _render_evolucao(
+        request,
+        titulo=f"Evolução da Turma {turma.nome}",
+        voltar_url=reverse('turma_detail', args=[turma.id]),
+        # Ids materializados: no arquivo, a turma gravada do aluno pode ser antiga
+        filtros={'relatorio__aluno__in': list(turma.alunos.values_list('pk', flat=True))},
+        turma=turma,
+    )
+
+# ==============================================================================
+# 22. AUTOCOMPLETE DE COMPETÊNCIAS (Índice de Prefixos em Memória)
+# ==============================================================================
+@login_required
+def autocomplete_competencias(request, relatorio_id, materia_codigo):
+    """
+    Sugere competências por prefixo de código ou palavra-chave da habilidade,
+    restritas ao componente e à série do aluno do relatório.
+    """
+    serie = Relatorio.objects.filter(id=relatorio_id).values_list(
+        'aluno__turma__serie_curricular', flat=True
+    ).first()
+    return _autocomplete_por_serie(request, serie, materia_codigo)
+
+@login_required
+def autocomplete_competencias_aluno(request, aluno_pk, materia_codigo):
+    """Mesmo autocomplete, para a tela de um relatório ainda não criado."""
+    serie = Aluno.objects.filter(pk=aluno_pk).values_list('turma__serie_curricular', flat=True).first()
+    return _autocomplete_por_serie(request, serie, materia_codigo)
+
+def _autocomplete_por_serie(request, serie, materia_codigo):
+    if serie is None:
+        return JsonResponse({'resultados': []}, status=404)
+
+    termo = request.GET.get('q', '').strip()
+    resultados = get_indice_catalogo().buscar(termo, materia_codigo, serie) if len(termo) >= 2 else []
+    return JsonResponse({'resultados': resultados})
+
+# ==============================================================================
+# 23. CLONAR AVALIAÇÕES DO TRIMESTRE ANTERIOR (Aluno ou Turma inteira)
+# ==============================================================================
+@login_required
+def clonar_trimestre_anterior(request, aluno_pk):
+    aluno = get_object_or_404(Aluno, pk=aluno_pk)
+    if request.method != 'POST':
+        return redirect('avaliar_aluno', aluno_pk=aluno.pk)
+
+    ano_ativo, tri_ativo = get_periodo_atual()
+    # Sem avaliações no trimestre anterior não há o que copiar: nenhum rascunho é criado
+    if not alunos_com_avaliacoes_anteriores(Aluno.objects.filter(pk=aluno.pk), ano_ativo, tri_ativo).exists():
+        messages.warning(request, "Nada para copiar: o trimestre anterior não possui competências para este aluno.")
+        return redirect('avaliar_aluno', aluno_pk=aluno.pk)
+
+    relatorio = obter_relatorio_para_escrita(aluno, ano_ativo, tri_ativo, request.user)
+    if relatorio.status not in ['RASCUNHO', 'CORRECAO']:
+        messages.error(request, "Este relatório está bloqueado para edições.")
+        return redirect('avaliar_aluno', aluno_pk=aluno.pk)
+
+    com_niveis = request.POST.get('com_niveis') == '1'
+    total = clonar_avaliacoes_anteriores(ano_ativo, tri_ativo, com_niveis, aluno=aluno)
+
+    if total:
+        messages.success(request, f"{total} competência(s) copiada(s) do trimestre anterior.")
+    else:
+        messages.warning(request, "Nada para copiar: o trimestre anterior não possui competências novas para este aluno.")
+    return redirect('avaliar_aluno', aluno_pk=aluno.pk)
+
+@login_required
+def clonar_trimestre_anterior_turma_view(request, turma_id):
+    turma = get_object_or_404(Turma, id=turma_id)
+    if request.method != 'POST':
+        return redirect('turma_detail', turma_id=turma.id)
+
+    if request.user.role == 'PROFESSOR' and not turma.professores.filter(id=request.user.id).exists():
+        messages.error(request, "Permissão negada.")
+        return redirect('dashboard')
+
+    ano_ativo, tri_ativo = get_periodo_atual()
+    com_niveis = request.POST.get('com_niveis') == '1'
+    total = clonar_trimestre_anterior_turma(turma, ano_ativo, tri_ativo, request.user, com_niveis)
+
+    messages.success(request, f"Turma {turma.nome}: {total} competência(s) copiada(s) do trimestre anterior.")
+    return redirect('turma_detail', turma_id=turma.id)
+
+# ==============================================================================
+# 24. GRADE DE AVALIAÇÃO DA TURMA (Alunos x Competências de uma Matéria)
+# ==============================================================================
+@login_required
+def grade_avaliacao(request, turma_id, materia_codigo):
+    """
+    Lança uma matéria para a turma inteira de uma vez. A tela carrega com um
+    número constante de consultas e o salvamento é um upsert em lote.
+    """
+    turma = get_object_or_404(Turma, id=turma_id)
+    if request.user.role == 'PROFESSOR' and not turma.professores.filter(id=request.user.id).exists():
+        messages.error(request, "Permissão negada.")
+        return redirect('dashboard')
+
+    ano_ativo, tri_ativo = get_periodo_atual()
+    alunos = list(Aluno.objects.filter(turma=turma).order_by('nome_completo').only('pk', 'nome_completo'))
+    catalogo = list(competencias_da_serie(materia_codigo, turma.serie_curricular).order_by('codigo').only('id', 'codigo', 'habilidade'))
+
+    # 1. Colunas: competências escolhidas ou, por padrão, as já usadas pela turma no período
+    selecionadas = {int(c) for c in request.GET.getlist('c') if c.isdigit()}
+    if not selecionadas:
+        selecionadas = set(
+            Avaliacao.objects.filter(
+                relatorio__aluno__turma=turma, relatorio__ano=ano_ativo,
+                relatorio__trimestre=tri_ativo, competencia__componente=materia_codigo,
+            ).values_list('competencia_id', flat=True).distinct()
+        )
+    colunas = [comp for comp in catalogo if comp.id in selecionadas]
+
+    if request.method == 'POST':
+        niveis = {}
+        for aluno in alunos:
+            for comp in colunas:
+                nivel = request.POST.get(f'nivel_{aluno.pk}_{comp.id}')
+                if nivel:
+                    niveis[(aluno.pk, comp.id)] = nivel
+
+        gravadas, bloqueados = salvar_grade_avaliacao(turma, ano_ativo, tri_ativo, request.user, niveis)
+        messages.success(request, f"Grade salva: {gravadas} avaliação(ões) gravada(s).")
+        if bloqueados:
+            messages.warning(request, f"{len(bloqueados)} aluno(s) com relatório em análise ou aprovado não foram alterados.")
+        return redirect(f"{request.path}?{request.GET.urlencode()}")
+
+    # 2. Estado atual da grade (relatórios e avaliações do período em duas consultas)
+    relatorios = {
+        r.aluno_id: r for r in Relatorio.objects.filter(
+            aluno__turma=turma, ano=ano_ativo, trimestre=tri_ativo
+        ).only('id', 'aluno_id', 'status')
+    }
+    atuais = {
+        (aluno_id, comp_id): nivel for aluno_id, comp_id, nivel in Avaliacao.objects.filter(
+            relatorio__in=[r.id for r in relatorios.values()], competencia_id__in=selecionadas,
+        ).values_list('relatorio__aluno_id', 'competencia_id', 'nivel')
+    }
+
+    linhas = []
+    for aluno in alunos:
+        relatorio = relatorios.get(aluno.pk)
+        linhas.append({
+            'aluno': aluno,
+            'bloqueado': relatorio is not None and relatorio.status not in ['RASCUNHO', 'CORRECAO'],
+            'celulas': [{'competencia': comp, 'nivel': atuais.get((aluno.pk, comp.id))} for comp in colunas],
+        })
+
+    return render(request, 'grade_avaliacao.html', {
+        'turma': turma,
+        'materia_codigo': materia_codigo,
+        'catalogo': catalogo,
+        'colunas': colunas,
+        'selecionadas': selecionadas,
+        'linhas': linhas,
+        'niveis': Avaliacao.NIVEIS,
+        'ano_ativo': ano_ativo,
+        'trimestre_ativo': tri_ativo,
+    })
+
+# ==============================================================================
+# 25. MÉTRICAS DO FLUXO DE RELATÓRIOS (Vazão e Tempo de Análise)
+# ==============================================================================
+@login_required
+@usar_replica
+def metricas_fluxo(request):
+    """
+    Quantos relatórios foram enviados, aprovados e devolvidos por dia e quanto
+    tempo cada um esperou na análise. Lê apenas o histórico de transições.
+    """
+    if request.user.role not in ['ADMINISTRADOR', 'COORDENADOR']:
+        messages.error(request, "Acesso restrito à coordenação.")
+        return redirect('dashboard')
+
+    ano, tri = _periodo_da_consulta(request)
+    try:
+        dias = max(1, min(int(request.GET.get('dias', 30)), 365))
+    except ValueError:
+        dias = 30
+
+    return render(request, 'metricas_fluxo.html', {
+        'metricas': metricas_fluxo_relatorios(ano, tri, dias),
+        'ano_selecionado': str(ano),
+        'tri_selecionado': str(tri),
+        'dias': dias,
+    })
@@ -0,0 +1,107 @@
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponseNotFound
+
+# Uma implantação pode atender todas as escolas de uma rede. Cada escola tem
+# os próprios bancos (principal e arquivo, criados em core/settings.py, seção
+# 3.1); a escola da requisição é escolhida pelo domínio e o RoteadorReplica
+# manda para os bancos dela as consultas da aplicação, do admin e das sessões.
+# Fora de uma requisição (manage.py), a escola vem de SMARTWORKFLOW_ESCOLA.
+
+_escola = ContextVar('escola', default=None)
+
+
+class Escola:
+    def __init__(self, slug, nome, dominios, banco, banco_arquivo):
+        self.slug = slug
+        self.nome = nome
+        self.dominios = tuple(d.lower() for d in dominios)
+        self.banco = banco
+        self.banco_arquivo = banco_arquivo
+
+    def __repr__(self):
+        return f'<Escola {self.slug}>'
+
+
+# (lista de settings.ESCOLAS que originou o registro, escolas por slug, por domínio)
+_registro = (None, {}, {})
+
+
+def _registro_escolas():
+    global _registro
+    config = getattr(settings, 'ESCOLAS', [])
+    if _registro[0] is not config:
+        por_slug = {
+            item['slug']: Escola(
+                item['slug'], item.get('nome', item['slug']), item.get('dominios', []),
+                item['banco'], item['banco_arquivo'],
+            )
+            for item in config
+        }
+        por_dominio = {dominio: escola for escola in por_slug.values() for dominio in escola.dominios}
+        _registro = (config, por_slug, por_dominio)
+    return _registro
+
+
+def escolas():
+    """Escolas configuradas; vazio em implantações de uma escola só."""
+    return list(_registro_escolas()[1].values())
+
+
+def escola_por_slug(slug):
+    escola = _registro_escolas()[1].get(slug)
+    if escola is None:
+        raise ImproperlyConfigured(f"Escola '{slug}' não está em SMARTWORKFLOW_ESCOLAS.")
+    return escola
+
+
+def escola_do_dominio(host):
+    return _registro_escolas()[2].get(host.split(':')[0].lower())
+
+
+def escola_atual():
+    """Escola da requisição (ou do manage.py); None com uma escola só."""
+    escola = _escola.get()
+    if escola is None and os.environ.get('SMARTWORKFLOW_ESCOLA'):
+        escola = escola_por_slug(os.environ['SMARTWORKFLOW_ESCOLA'])
+    return escola
+
+
+@contextmanager
+def na_escola(escola):
+    """Executa o bloco com os bancos e o cache da escola informada."""
+    token = _escola.set(escola)
+    try:
+        yield escola
+    finally:
+        _escola.reset(token)
+
+
+def chave_cache(key, key_prefix, version):
+    """KEY_FUNCTION do cache: cada escola enxerga só as próprias chaves."""
+    escola = escola_atual()
+    if escola is not None:
+        key_prefix = f'{key_prefix}:{escola.slug}' if key_prefix else escola.slug
+    return f'{key_prefix}:{version}:{key}'
+
+
+class EscolaMiddleware:
+    """Com escolas configuradas, o domínio da requisição define a escola; domínio desconhecido é 404."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not escolas():
+            request.escola = None
+            return self.get_response(request)
+
+        escola = escola_do_dominio(request.get_host())
+        if escola is None:
+            return HttpResponseNotFound('Escola não encontrada para este endereço.')
+        request.escola = escola
+        with na_escola(escola):
+            return self.get_response(request)
@@ -0,0 +1,205 @@
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from core.replica import bancos_da_requisicao
+
+# Métricas em memória, por processo, no formato texto do Prometheus. Registrar
+# um valor é uma soma sob um lock; o custo de formatar fica todo no /metrics.
+# Com vários workers, cada raspagem vê o processo que a atendeu.
+
+TIPO_CONTEUDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.trava = threading.Lock()
+        # Sem rótulos, a série existe desde o início (exporta 0 e não some)
+        self.series = {} if self.rotulos or self.tipo == 'histogram' else {(): 0}
+        REGISTRO.append(self)
+
+    def _chave(self, rotulos):
+        return tuple(str(rotulos[nome]) for nome in self.rotulos)
+
+    def _formatar_rotulos(self, chave, extra=()):
+        pares = list(zip(self.rotulos, chave)) + list(extra)
+        if not pares:
+            return ''
+        texto = ','.join(
+            '{}="{}"'.format(nome, valor.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+            for nome, valor in pares
+        )
+        return '{' + texto + '}'
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} {self.tipo}']
+        with self.trava:
+            series = sorted(self.series.items())
+        for chave, valor in series:
+            linhas.extend(self._linhas(chave, valor))
+        return linhas
+
+
+class Contador(_Metrica):
+    tipo = 'counter'
+
+    def inc(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self.trava:
+            self.series[chave] = self.series.get(chave, 0) + valor
+
+    def _linhas(self, chave, valor):
+        return [f'{self.nome}{self._formatar_rotulos(chave)} {valor}']
+
+
+class Medidor(_Metrica):
+    tipo = 'gauge'
+
+    def inc(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self.trava:
+            self.series[chave] = self.series.get(chave, 0) + valor
+
+    def dec(self, valor=1, **rotulos):
+        self.inc(-valor, **rotulos)
+
+    def substituir(self, valores):
+        """Troca todas as séries de uma vez: {(rótulo1, rótulo2, ...): valor}."""
+        series = {tuple(str(r) for r in chave): valor for chave, valor in valores.items()}
+        with self.trava:
+            self.series = series
+
+    def _linhas(self, chave, valor):
+        return [f'{self.nome}{self._formatar_rotulos(chave)} {valor}']
+
+
+class Histograma(_Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, limites, rotulos=()):
+        self.limites = tuple(limites)
+        super().__init__(nome, ajuda, rotulos)
+
+    def observar(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        posicao = bisect_left(self.limites, valor)
+        with self.trava:
+            contagens, soma = self.series.get(chave) or ((0,) * (len(self.limites) + 1), 0)
+            # Nova lista a cada observação: o /metrics formata fora do lock
+            contagens = list(contagens)
+            contagens[posicao] += 1
+            self.series[chave] = (contagens, soma + valor)
+
+    def _linhas(self, chave, valor):
+        contagens, soma = valor
+        linhas, acumulado = [], 0
+        for limite, qtd in zip(self.limites + ('+Inf',), contagens):
+            acumulado += qtd
+            rotulos = self._formatar_rotulos(chave, [('le', str(limite))])
+            linhas.append(f'{self.nome}_bucket{rotulos} {acumulado}')
+        linhas.append(f'{self.nome}_sum{self._formatar_rotulos(chave)} {soma}')
+        linhas.append(f'{self.nome}_count{self._formatar_rotulos(chave)} {acumulado}')
+        return linhas
+
+
+REGISTRO = []
+
+REQUISICAO_SEGUNDOS = Histograma(
+    'smartworkflow_requisicao_segundos', 'Duração das requisições por view.',
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10), rotulos=('view', 'metodo', 'status'),
+)
+REQUISICAO_CONSULTAS = Histograma(
+    'smartworkflow_requisicao_consultas', 'Consultas SQL executadas por requisição.',
+    (1, 2, 5, 10, 20, 50, 100, 200, 500), rotulos=('view',),
+)
+PDF_SEGUNDOS = Histograma(
+    'smartworkflow_pdf_segundos', 'Tempo de geração dos PDFs.', (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+PDF_BYTES = Histograma(
+    'smartworkflow_pdf_bytes', 'Tamanho dos PDFs gerados.',
+    (10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000),
+)
+CACHE_CONSULTAS = Contador(
+    'smartworkflow_cache_consultas_total', 'Leituras do cache da aplicação por resultado.', rotulos=('cache', 'resultado'),
+)
+CONSOLIDACAO_SEGUNDOS = Histograma(
+    'smartworkflow_consolidacao_segundos', 'Recálculos de consolidados executados após o commit.',
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+FILA_ANALISE = Medidor(
+    'smartworkflow_fila_analise', 'Relatórios aguardando decisão da coordenação (agregado em cache).',
+)
+RELATORIOS = Medidor(
+    'smartworkflow_relatorios', 'Relatórios por ano, trimestre e status (agregado em cache).',
+    rotulos=('ano', 'trimestre', 'status'),
+)
+
+
+def registrar_cache(nome, acerto):
+    CACHE_CONSULTAS.inc(cache=nome, resultado='acerto' if acerto else 'falha')
+
+
+class MetricasMiddleware:
+    """Duração e número de consultas SQL de cada requisição, por view."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        consultas = 0
+
+        def contar(execute, sql, params, many, context):
+            nonlocal consultas
+            consultas += 1
+            return execute(sql, params, many, context)
+
+        inicio = time.perf_counter()
+        with ExitStack() as pilha:
+            # Só os bancos da escola da requisição: a rede pode ter centenas de aliases
+            for alias in bancos_da_requisicao():
+                pilha.enter_context(connections[alias].execute_wrapper(contar))
+            response = self.get_response(request)
+        duracao = time.perf_counter() - inicio
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else 'nao_encontrada'
+        REQUISICAO_SEGUNDOS.observar(
+            duracao, view=view, metodo=request.method, status=f'{response.status_code // 100}xx'
+        )
+        REQUISICAO_CONSULTAS.observar(consultas, view=view)
+        return response
+
+
+def _acesso_permitido(request):
+    """Com SMARTWORKFLOW_METRICAS_TOKEN, exige 'Authorization: Bearer <token>'; sem ele, só localhost."""
+    token = getattr(settings, 'METRICAS_TOKEN', None)
+    if token:
+        recebido = request.headers.get('Authorization', '')
+        return hmac.compare_digest(recebido.encode(), f'Bearer {token}'.encode())
+    return request.META.get('REMOTE_ADDR') in ('127.0.0.1', '::1')
+
+
+def metricas(request):
+    if not _acesso_permitido(request):
+        return HttpResponseForbidden()
+
+    # Agregado do banco vem do cache (recalculado no máximo a cada minuto).
+    # Import local: academic.utils importa este módulo.
+    from academic.utils import contagem_relatorios_por_status
+    contagem = contagem_relatorios_por_status()
+    RELATORIOS.substituir(contagem)
+    FILA_ANALISE.substituir({(): sum(qtd for (_, _, status), qtd in contagem.items() if status == 'ANALISE')})
+
+    linhas = []
+    for metrica in REGISTRO:
+        linhas.extend(metrica.exportar())
+    return HttpResponse('\n'.join(linhas) + '\n', content_type=TIPO_CONTEUDO)
@@ -0,0 +1,36 @@
+import logging
+import time
+from collections import deque
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger('academic')
+
+class AvisoPerfilDevMiddleware:
+    """
+    Ativo apenas no perfil dev: se o servidor receber um volume de
+    requisições típico de produção, avisa uma única vez no log que o perfil
+    de desenvolvimento (DEBUG, sem cache de templates) está em uso.
+    """
+    janela_segundos = 10
+    limite_requisicoes = 50
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.instantes = deque(maxlen=self.limite_requisicoes)
+        self.avisado = False
+
+    def __call__(self, request):
+        if not self.avisado:
+            agora = time.monotonic()
+            self.instantes.append(agora)
+            if len(self.instantes) == self.limite_requisicoes and agora - self.instantes[0] < self.janela_segundos:
+                self.avisado = True
+                logger.warning(
+                    "Perfil 'dev' ativo sob carga (%s requisições em menos de %ss). "
+                    "Use SMARTWORKFLOW_PERFIL=producao em servidores reais.",
+                    self.limite_requisicoes, self.janela_segundos,
+                )
+        return self.get_response(request)
@@ -0,0 +1,96 @@
+import os
+import sqlite3
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from core.escolas import escola_atual, escolas
+
+# Alias da réplica em settings.DATABASES (criado junto com REPLICA_DB em core/settings.py)
+ALIAS_REPLICA = 'replica'
+# Banco frio dos anos letivos arquivados (academic.utils, seção 13)
+ALIAS_ARQUIVO = 'arquivo'
+
+_ler_da_replica = ContextVar('ler_da_replica', default=False)
+
+
+def banco_principal():
+    """Alias do banco principal da escola atual ('default' com uma escola só)."""
+    escola = escola_atual()
+    return escola.banco if escola else 'default'
+
+
+def banco_arquivo():
+    """Alias do banco de arquivo da escola atual."""
+    escola = escola_atual()
+    return escola.banco_arquivo if escola else ALIAS_ARQUIVO
+
+
+def bancos_da_requisicao():
+    """Aliases que a requisição atual pode consultar (os das outras escolas ficam de fora)."""
+    escola = escola_atual()
+    if escola:
+        return [escola.banco, escola.banco_arquivo]
+    das_escolas = {alias for e in escolas() for alias in (e.banco, e.banco_arquivo)}
+    return [alias for alias in settings.DATABASES if alias not in das_escolas]
+
+
+def replica_disponivel():
+    """A réplica está configurada e já recebeu a primeira cópia? (só sem escolas configuradas)"""
+    caminho = getattr(settings, 'REPLICA_DB', None)
+    return bool(caminho) and escola_atual() is None and os.path.exists(caminho)
+
+
+def usar_replica(view):
+    """
+    Marca uma view somente leitura (histórico, catálogo, análises, exportações):
+    as consultas feitas durante a requisição vão para a réplica. Views que
+    gravam ou precisam ler o que acabaram de gravar não usam este decorador.
+    """
+    @wraps(view)
+    def _view(request, *args, **kwargs):
+        token = _ler_da_replica.set(replica_disponivel())
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _ler_da_replica.reset(token)
+    return _view
+
+
+class RoteadorReplica:
+    """
+    Escritas sempre no primário da escola atual; leituras na réplica apenas
+    dentro de views marcadas com @usar_replica. A réplica não recebe
+    migrações: é uma cópia integral do primário. O banco de arquivo é migrado
+    à parte e só é lido ou gravado com .using() explícito.
+    """
+
+    def db_for_read(self, model, **hints):
+        # Relacionados de um objeto arquivado (relatorio.aluno etc.) vêm do arquivo
+        instancia = hints.get('instance')
+        if instancia is not None and instancia._state.db == banco_arquivo():
+            return instancia._state.db
+        return ALIAS_REPLICA if _ler_da_replica.get() else banco_principal()
+
+    def db_for_write(self, model, **hints):
+        return banco_principal()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != ALIAS_REPLICA
+
+
+def atualizar_replica(origem, destino):
+    """
+    Copia o SQLite primário para a réplica pela API de backup: a cópia é
+    consistente mesmo com escritas em andamento e os leitores da réplica
+    veem o conteúdo antigo ou o novo, nunca uma mistura.
+    """
+    fonte = sqlite3.connect(origem)
+    alvo = sqlite3.connect(destino)
+    try:
+        fonte.backup(alvo)
+    finally:
+        alvo.close()
+        fonte.close()
@@ -1,16 +1,27 @@
+import json
 import os
 from pathlib import Path
 
 # Caminho base do projeto
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# ==============================================================================
+# 0. PERFIL DE EXECUÇÃO (dev | producao)
+# ==============================================================================
+# Selecionado pela variável de ambiente SMARTWORKFLOW_PERFIL (padrão: dev)
+PERFIL = os.environ.get('SMARTWORKFLOW_PERFIL', 'dev')
+EM_PRODUCAO = PERFIL == 'producao'
+
 # SEGURANÇA: Mantenha a chave secreta em segurança!
-SECRET_KEY = 'django-insecure-&c@pw#kqu%c_bw&4_wc@v)zzuiewx-bp4l(^)^ngpksy82dx1$'
+SECRET_KEY = os.environ.get(
+    'DJANGO_SECRET_KEY',
+    'django-insecure-&c@pw#kqu%c_bw&4_wc@v)zzuiewx-bp4l(^)^ngpksy82dx1$'
+)
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = not EM_PRODUCAO
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [h for h in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if h]
 
 # ==============================================================================
 # 1. APLICATIVOS INSTALADOS
@@ -28,6 +39,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.escolas.EscolaMiddleware',  # primeiro: escolhe os bancos e o cache da escola
+    'core.metricas.MetricasMiddleware',  # mede o restante da requisição
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -37,6 +50,10 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+if not EM_PRODUCAO:
+    # Avisa no console quando o perfil dev recebe tráfego de produção
+    MIDDLEWARE.append('core.middleware.AvisoPerfilDevMiddleware')
+
 ROOT_URLCONF = 'core.urls'
 
 # ==============================================================================
@@ -58,6 +75,16 @@ TEMPLATES = [
     },
 ]
 
+if EM_PRODUCAO:
+    # Templates compilados uma única vez por processo
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'core.wsgi.application'
 
 # ==============================================================================
@@ -70,6 +97,92 @@ DATABASES = {
     }
 }
 
+if EM_PRODUCAO:
+    # Conexões persistentes + WAL: leitores não bloqueiam o escritor
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+        },
+    })
+
+# Réplica de leitura: cópia local do SQLite, atualizada periodicamente por
+# `manage.py atualizar_replica` (API de backup). Views de consulta marcadas
+# com @usar_replica leem dela; escritas continuam no banco principal.
+REPLICA_DB = os.environ.get('SMARTWORKFLOW_REPLICA_DB')
+if REPLICA_DB:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{REPLICA_DB}?mode=ro',  # somente leitura
+        'OPTIONS': {'timeout': 20},
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Banco frio: anos letivos encerrados são movidos para cá por
+# `manage.py arquivar_ano` e continuam legíveis pelo histórico e pela evolução.
+ARQUIVO_DB = os.environ.get('SMARTWORKFLOW_ARQUIVO_DB', BASE_DIR / 'db_arquivo.sqlite3')
+DATABASES['arquivo'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': ARQUIVO_DB,
+    'OPTIONS': {'timeout': 20},
+}
+
+# ==============================================================================
+# 3.1 ESCOLAS (UMA IMPLANTAÇÃO PARA A REDE)
+# ==============================================================================
+# Sem SMARTWORKFLOW_ESCOLAS a implantação atende uma escola, nos bancos acima.
+# Com ele (JSON: [{"slug": "centro", "nome": "EM Centro", "dominios": ["centro.exemplo.gov.br"]}]),
+# cada escola ganha o próprio SQLite e o próprio arquivo em SMARTWORKFLOW_ESCOLAS_DIR,
+# escolhidos pelo domínio da requisição (core/escolas.py). Os bancos são
+# criados e migrados por `manage.py migrar_escolas`.
+ESCOLAS = []
+if os.environ.get('SMARTWORKFLOW_ESCOLAS'):
+    with open(os.environ['SMARTWORKFLOW_ESCOLAS'], encoding='utf-8') as arquivo_escolas:
+        ESCOLAS = json.load(arquivo_escolas)
+ESCOLAS_DIR = Path(os.environ.get('SMARTWORKFLOW_ESCOLAS_DIR', BASE_DIR / 'escolas'))
+
+for escola in ESCOLAS:
+    escola.setdefault('banco', f"escola_{escola['slug']}")
+    escola.setdefault('banco_arquivo', f"{escola['banco']}_arquivo")
+    DATABASES[escola['banco']] = {**DATABASES['default'], 'NAME': ESCOLAS_DIR / f"{escola['slug']}.sqlite3"}
+    DATABASES[escola['banco_arquivo']] = {**DATABASES['arquivo'], 'NAME': ESCOLAS_DIR / f"{escola['slug']}_arquivo.sqlite3"}
+    ALLOWED_HOSTS += escola.get('dominios', [])
+
+DATABASE_ROUTERS = ['core.replica.RoteadorReplica']
+
+# ==============================================================================
+# 3.2 CACHE E SESSÕES
+# ==============================================================================
+if EM_PRODUCAO:
+    # Cache em arquivo: compartilhado entre os workers do servidor
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('SMARTWORKFLOW_CACHE_DIR', BASE_DIR / '.cache'),
+            'TIMEOUT': 300,
+            'KEY_FUNCTION': 'core.escolas.chave_cache',  # chaves separadas por escola
+        }
+    }
+    # Sessões no cache: nenhuma escrita no banco a cada requisição
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'KEY_FUNCTION': 'core.escolas.chave_cache',
+        }
+    }
+
+# ==============================================================================
+# 3.3 MÉTRICAS (PROMETHEUS)
+# ==============================================================================
+# /metrics exige 'Authorization: Bearer <token>' quando o token está definido;
+# sem token, só responde para localhost.
+METRICAS_TOKEN = os.environ.get('SMARTWORKFLOW_METRICAS_TOKEN')
+
 # ==============================================================================
 # 4. MODELO DE USUÁRIO PERSONALIZADO (CRIAR/EDITAR PROFESSORES)
 # ==============================================================================
@@ -97,6 +210,14 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [
     BASE_DIR / "static",
 ]
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+if EM_PRODUCAO:
+    # Nomes com hash (cache eterno no navegador) + cópias .gz geradas no collectstatic
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'core.storage.ManifestGzipStaticFilesStorage'},
+    }
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -0,0 +1,28 @@
+import gzip
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+class ManifestGzipStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage que também grava uma cópia pré-comprimida
+    (.gz) de cada arquivo textual com hash, para o servidor web entregar
+    diretamente (gzip_static no nginx, por exemplo).
+    """
+    extensoes_comprimidas = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map')
+
+    def post_process(self, paths, dry_run=False, **options):
+        processados = set()
+        for original, processado, alterado in super().post_process(paths, dry_run, **options):
+            if processado and not isinstance(alterado, Exception):
+                processados.add(processado)
+            yield original, processado, alterado
+
+        if dry_run:
+            return
+
+        for nome in processados:
+            if not nome.endswith(self.extensoes_comprimidas):
+                continue
+            with open(self.path(nome), 'rb') as origem:
+                conteudo = origem.read()
+            with open(self.path(nome) + '.gz', 'wb') as destino:
+                destino.write(gzip.compress(conteudo, compresslevel=9))
@@ -1,12 +1,17 @@
 from django.contrib import admin
 from django.urls import path, include 
+from core.metricas import metricas
 from academic.views import (
-    dashboard, turma_detail, avaliar_aluno, avaliar_materia, sugerir_atividade, 
+    dashboard, turma_detail, avaliar_aluno, avaliar_materia, iniciar_materia, sugerir_atividade, 
     area_coordenacao, aprovar_sugestao, visualizar_relatorio, enviar_relatorio_final,
     limpar_materia, detalhe_sugestao, decisao_relatorio, configuracoes_sistema,
-    gestao_escolar, salvar_turma, excluir_turma, salvar_aluno, excluir_aluno,
+    gestao_escolar, gestao_form_edicao, salvar_turma, excluir_turma, salvar_aluno, excluir_aluno,
     salvar_professor, excluir_professor, criar_sugestao_coordenador, gestao_competencias,
-    salvar_competencia, excluir_competencia, visualizar_competencias, historico_coordenacao
+    salvar_competencia, excluir_competencia, competencia_detalhe, competencia_form_edicao,
+    visualizar_competencias, historico_coordenacao,
+    virada_ano_letivo, analise_competencias, metricas_fluxo, evolucao_aluno, evolucao_turma,
+    autocomplete_competencias, autocomplete_competencias_aluno, clonar_trimestre_anterior, clonar_trimestre_anterior_turma_view,
+    grade_avaliacao
 )
 
 urlpatterns = [
@@ -15,18 +20,27 @@ urlpatterns = [
     # ==========================================================================
     path('admin/', admin.site.urls),
     path('accounts/', include('django.contrib.auth.urls')), # Login/Logout nativo
+    path('metrics', metricas, name='metricas'),  # Prometheus (token ou localhost)
     
     # ==========================================================================
     # 2. DASHBOARD E FLUXO PRINCIPAL
     # ==========================================================================
     path('', dashboard, name='dashboard'), #
     path('turma/<int:turma_id>/', turma_detail, name='turma_detail'), #
+    path('turma/<int:turma_id>/evolucao/', evolucao_turma, name='evolucao_turma'),
+    path('turma/<int:turma_id>/clonar-anterior/', clonar_trimestre_anterior_turma_view, name='clonar_trimestre_anterior_turma'),
+    path('turma/<int:turma_id>/grade/<str:materia_codigo>/', grade_avaliacao, name='grade_avaliacao'),
     
     # ==========================================================================
     # 3. AVALIAÇÃO E RELATÓRIOS (Workflow do Professor)
     # ==========================================================================
     path('avaliar/<int:aluno_pk>/', avaliar_aluno, name='avaliar_aluno'), #
+    path('avaliar/<int:aluno_pk>/evolucao/', evolucao_aluno, name='evolucao_aluno'),
+    path('avaliar/<int:aluno_pk>/clonar-anterior/', clonar_trimestre_anterior, name='clonar_trimestre_anterior'),
+    path('avaliar/<int:aluno_pk>/disciplina/<str:materia_codigo>/', iniciar_materia, name='iniciar_materia'),
+    path('avaliar/<int:aluno_pk>/disciplina/<str:materia_codigo>/autocomplete/', autocomplete_competencias_aluno, name='autocomplete_competencias_aluno'),
     path('relatorio/<int:relatorio_id>/disciplina/<str:materia_codigo>/', avaliar_materia, name='avaliar_materia'), #
+    path('relatorio/<int:relatorio_id>/disciplina/<str:materia_codigo>/autocomplete/', autocomplete_competencias, name='autocomplete_competencias'),
     path('relatorio/<int:relatorio_id>/limpar/<str:materia_codigo>/', limpar_materia, name='limpar_materia'), #
     path('relatorio/<int:relatorio_id>/enviar/', enviar_relatorio_final, name='enviar_relatorio_final'), #
     path('relatorio/<int:relatorio_id>/visualizar/', visualizar_relatorio, name='visualizar_relatorio'), #
@@ -46,11 +60,15 @@ urlpatterns = [
     path('relatorio/<int:relatorio_id>/decisao/', decisao_relatorio, name='decisao_relatorio'), #
     path('sistema/configuracoes/', configuracoes_sistema, name='configuracoes_sistema'), #
     path('coordenacao/historico/', historico_coordenacao, name='historico_coordenacao'),
+    path('sistema/virada-ano/', virada_ano_letivo, name='virada_ano_letivo'),
+    path('coordenacao/analise/', analise_competencias, name='analise_competencias'),
+    path('coordenacao/fluxo/', metricas_fluxo, name='metricas_fluxo'),
     
     # ==========================================================================
     # 6. GESTÃO ESCOLAR (Turmas, Alunos e Professores)
     # ==========================================================================
     path('gestao/', gestao_escolar, name='gestao_escolar'), #
+    path('gestao/<str:tipo>/<int:obj_id>/form/', gestao_form_edicao, name='gestao_form_edicao'),
     
     # Turmas
     path('gestao/turma/salvar/', salvar_turma, name='criar_turma'), #
@@ -74,5 +92,7 @@ urlpatterns = [
     path('gestao/competencias/salvar/', salvar_competencia, name='criar_competencia'), #
     path('gestao/competencias/salvar/<int:competencia_id>/', salvar_competencia, name='editar_competencia'), #
     path('gestao/competencias/excluir/<int:competencia_id>/', excluir_competencia, name='excluir_competencia'), #
+    path('gestao/competencias/<int:competencia_id>/detalhe/', competencia_detalhe, name='competencia_detalhe'),
+    path('gestao/competencias/<int:competencia_id>/editar/', competencia_form_edicao, name='competencia_form_edicao'),
     path('bncc/catalogo/', visualizar_competencias, name='catalogo_bncc_professor'), #
 ]
\ No newline at end of file